@@ -1,45 +1,6 @@
 import os
-from config import configuration, config_file
-from loguru import logger
-
-from fabric import Application
-from fabric.utils import monitor_file, get_relative_path, idle_add
-from widgets.helpers.formatted_exec import formatted_exec_shell_command
-
-from windows.pill import PillWindow, PillApplets
-from windows.osd import OSDWindow
-from windows.bar import BarWindow
-from windows.corners import CornersWindow
-from windows.dock import DockWindow
-# import windows.dock
-
-# import sdbus
-# from sdbus_block.networkmanager import (
-#     NetworkDeviceGeneric,
-#     NetworkDeviceWireless,
-#     NetworkConnectionSettings,
-#     NetworkManagerSettings,
-#     NetworkManager,
-# )
-# from sdbus import sd_bus_open_system
-# from sdbus_async.networkmanager import (
-#     NetworkDeviceGeneric,
-#     NetworkDeviceWireless,
-#     NetworkConnectionSettings,
-#     NetworkManagerSettings,
-#     NetworkManager,
-#     AccessPoint,
-# )
-
-# from sdbus_block.networkmanager.enums import DeviceType
-import gi
-
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GLib  # noqa: E402, F401
-
-logger.disable("fabric.audio")
-logger.disable("fabric.widgets.wayland")
-logger.disable("fabric.hyprland.widgets")
+import signal
+
 
 def apply_styles():
     if os.path.exists("style.css"):
@@ -65,7 +26,60 @@ def apply_styles():
         logger.error("Failed to compile sass!")
 
 
+def on_exit_signal():
+    # atexit doesn't run when the process is killed by a signal
+    logger.info("Exiting...")
+    get_state_store().flush_now()
+    app.quit()
+    return False
+
+
 if __name__ == "__main__":
+    # thumbnail workers (see `ThumbnailLoader`) run this file again as `__mp_main__`,
+    # everything the shell needs is only imported (and configured) here
+    from config import configuration, config_file
+    from loguru import logger
+
+    from fabric import Application
+    from fabric.utils import monitor_file, get_relative_path, idle_add
+    from widgets.helpers.formatted_exec import formatted_exec_shell_command
+    from widgets.helpers.state_store import get_state_store
+
+    from windows.pill import PillWindow, PillApplets
+    from windows.osd import OSDWindow
+    from windows.bar import BarWindow
+    from windows.corners import CornersWindow
+    from windows.dock import DockWindow
+    # import windows.dock
+
+    # import sdbus
+    # from sdbus_block.networkmanager import (
+    #     NetworkDeviceGeneric,
+    #     NetworkDeviceWireless,
+    #     NetworkConnectionSettings,
+    #     NetworkManagerSettings,
+    #     NetworkManager,
+    # )
+    # from sdbus import sd_bus_open_system
+    # from sdbus_async.networkmanager import (
+    #     NetworkDeviceGeneric,
+    #     NetworkDeviceWireless,
+    #     NetworkConnectionSettings,
+    #     NetworkManagerSettings,
+    #     NetworkManager,
+    #     AccessPoint,
+    # )
+
+    # from sdbus_block.networkmanager.enums import DeviceType
+    import gi
+
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk, GLib  # noqa: E402, F401
+
+    logger.disable("fabric.audio")
+    logger.disable("fabric.widgets.wayland")
+    logger.disable("fabric.hyprland.widgets")
+
     global osd_window
     osd_window = OSDWindow()
 
@@ -170,9 +184,14 @@ if __name__ == "__main__":
     # setting_dataclass = setting.get_profile(False)
     # logger.error(setting_dataclass.connection)
 
+    for exit_signal in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, exit_signal, on_exit_signal)
+
     logger.info(f"Starting shell... pid:{os.getpid()}")
     app.run()
 
+    get_state_store().flush_now()
+
     # handles = []
     # for name, app in apps.items():
     #     handles.append(GLib.Thread.new(name, app.run))
@@ -0,0 +1,307 @@
+"""
+Replays a compositor trace against the real services and reports how they keep up.
+
+The fake compositor from `tools/fake_compositor.py` serves the trace, while the
+services (and optionally the workspace widgets) run on a GLib main loop in this
+process. Reported are the events handled per second, the latency from an event
+being written to the socket until the main loop is done with it, and main-loop stalls.
+
+Usage:
+    python tools/compositor_bench.py niri trace.jsonl --speed flood
+    python tools/compositor_bench.py hyprland trace.jsonl --speed 10 --widgets
+    python tools/compositor_bench.py niri --generate --windows 500 --events 20000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_compositor import (
+    FakeNiriServer,
+    FakeHyprlandServer,
+    NIRI_SENTINEL_EVENT,
+    HYPRLAND_SENTINEL_EVENT,
+    load_trace,
+    parse_speed,
+    generate_trace,
+)
+
+HEARTBEAT_INTERVAL = 5  # ms
+SETTLE_TIME = 100  # ms
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Heartbeat:
+    """
+    Ticks on the main loop and records how late every tick came, i.e. how long
+    the loop was busy with something else.
+    """
+
+    def __init__(self, GLib, interval: int = HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self.stalls: list[float] = []
+        self.last = time.monotonic()
+        GLib.timeout_add(interval, self.tick)
+
+    def tick(self) -> bool:
+        now = time.monotonic()
+        self.stalls.append(max(0, (now - self.last) * 1000 - self.interval))
+        self.last = now
+        return True
+
+
+class BenchResult:
+    def __init__(self):
+        self.start = 0.0
+        self.end = 0.0
+        self.sent = 0
+        # (sequence number, time the main loop was done with it)
+        self.handled: dict[int, float] = {}
+        self.flushes = 0
+        self.flush_times: list[float] = []
+
+    def report(self, sent_times: list[tuple[int, float]], heartbeat: Heartbeat, extra: dict[str, str]):
+        elapsed = max(self.end - self.start, 1e-9)
+        sent_at = dict(sent_times)
+        latencies = [
+            (handled - sent_at[seq]) * 1000
+            for seq, handled in self.handled.items()
+            if seq in sent_at
+        ]
+
+        rows = {
+            "events sent": str(self.sent),
+            "events observed": f"{len(self.handled)} (the rest were filtered or coalesced)",
+            "elapsed": f"{elapsed:.3f} s",
+            "throughput": f"{self.sent / elapsed:.0f} events/s",
+            "latency p50": f"{percentile(latencies, 50):.2f} ms",
+            "latency p99": f"{percentile(latencies, 99):.2f} ms",
+            "latency max": f"{max(latencies, default=0):.2f} ms",
+            "main loop flushes": str(self.flushes),
+            "flush time p99": f"{percentile(self.flush_times, 99):.2f} ms",
+            "main loop stall max": f"{max(heartbeat.stalls, default=0):.2f} ms",
+            "main loop stall p99": f"{percentile(heartbeat.stalls, 99):.2f} ms",
+            "main loop stall total": f"{sum(heartbeat.stalls):.1f} ms",
+            **extra,
+        }
+        width = max(map(len, rows))
+        for name, value in rows.items():
+            print(f"{name:<{width}}  {value}")
+
+
+def init_gtk(widgets: bool):
+    import gi
+
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import GLib, Gtk
+
+    if widgets and not Gtk.init_check(sys.argv)[0]:
+        print("no display available, benchmarking the services only", file=sys.stderr)
+        widgets = False
+
+    return GLib, widgets
+
+
+def bench_niri(trace: list[dict], runtime_dir: str, speed: float, widgets: bool, timeout: float) -> None:
+    server = FakeNiriServer(
+        os.path.join(runtime_dir, "niri.sock"), trace, speed=speed, sentinel=True
+    )
+    server.start()
+    os.environ["NIRI_SOCKET"] = server.socket_path
+
+    GLib, widgets = init_gtk(widgets)
+    from widgets.helpers.niri.service import get_niri_connection
+    from widgets.helpers.niri.state import get_niri_state
+
+    result = BenchResult()
+    niri = get_niri_connection()
+    state = get_niri_state()
+    # window events are only decoded once something calls `watch_windows`
+    state.watch_windows()
+
+    if widgets:
+        from widgets.helpers.niri.widgets import Workspaces
+
+        workspaces = Workspaces()
+        workspaces.show_all()
+
+    loop = GLib.MainLoop()
+    dispatch_events = niri._event_batcher.flush_callback
+
+    def measured_dispatch(events):
+        started = time.monotonic()
+        # the state (and with it the widgets) is updated synchronously from here
+        dispatch_events(events)
+        done = time.monotonic()
+
+        result.flushes += 1
+        result.flush_times.append((done - started) * 1000)
+        for event in events:
+            if (seq := event.data.get("_bench_seq")) is not None:
+                result.handled[seq] = done
+
+    niri._event_batcher.flush_callback = measured_dispatch
+
+    def on_stream_started(_, connected: bool):
+        if connected and not result.start:
+            result.start = time.monotonic()
+
+    def on_done(*_):
+        result.end = time.monotonic()
+        GLib.timeout_add(SETTLE_TIME, loop.quit)
+
+    niri.connect("connection-changed", on_stream_started)
+    niri.connect(f"event::{NIRI_SENTINEL_EVENT}", on_done)
+
+    heartbeat = Heartbeat(GLib)
+    GLib.timeout_add(int(timeout * 1000), loop.quit)
+    loop.run()
+
+    result.sent = len(server.sent)
+    result.report(
+        server.sent,
+        heartbeat,
+        {
+            "workspaces mirrored": str(len(state.workspaces)),
+            "windows mirrored": str(len(state.windows)),
+            "widgets": "yes" if widgets else "no",
+        },
+    )
+    server.stop()
+
+
+def bench_hyprland(
+    trace: list[dict], runtime_dir: str, speed: float, widgets: bool, timeout: float
+) -> None:
+    signature = "compositor-bench"
+    server = FakeHyprlandServer(runtime_dir, signature, trace, speed=speed, sentinel=True)
+    server.start()
+    os.environ["XDG_RUNTIME_DIR"] = runtime_dir
+    os.environ["HYPRLAND_INSTANCE_SIGNATURE"] = signature
+
+    GLib, widgets = init_gtk(widgets)
+    from fabric.hyprland.widgets import get_hyprland_connection
+    from widgets.helpers.hyprland_clients import get_hyprland_clients_service
+    from widgets.helpers.workspace_properties import get_workspace_properties_service
+
+    result = BenchResult()
+    hyprland = get_hyprland_connection()
+    clients = get_hyprland_clients_service()
+    # hyprland events carry no payload to tag, they're matched to what was sent by order
+    received: list[float] = []
+    lock = threading.Lock()
+    started: list[float] = []
+
+    # handlers run in the order they were connected, so these two wrap everything listening in between
+    clients.connect("changed", lambda *_: started.append(time.monotonic()))
+    properties = get_workspace_properties_service()
+
+    if widgets:
+        from fabric.hyprland.widgets import Workspaces, WorkspaceButton
+
+        workspaces = Workspaces(
+            buttons_factory=lambda ws_id: WorkspaceButton(id=ws_id, label=str(ws_id))
+        )
+        workspaces.show_all()
+
+    loop = GLib.MainLoop()
+
+    def on_changed(*_):
+        done = time.monotonic()
+
+        result.flushes += 1
+        result.flush_times.append((done - started.pop()) * 1000)
+        with lock:
+            for seq in range(len(result.handled), len(received)):
+                result.handled[seq] = done
+
+    clients.connect("changed", on_changed)
+
+    def on_event(_, event):
+        if event.name == HYPRLAND_SENTINEL_EVENT:
+            result.end = time.monotonic()
+            GLib.timeout_add(SETTLE_TIME, loop.quit)
+            return
+
+        if not result.start:
+            result.start = time.monotonic()
+        with lock:
+            received.append(time.monotonic())
+
+    hyprland.connect("event", on_event)
+
+    heartbeat = Heartbeat(GLib)
+    GLib.timeout_add(int(timeout * 1000), loop.quit)
+    loop.run()
+
+    result.sent = len(server.sent)
+    result.report(
+        server.sent,
+        heartbeat,
+        {
+            "clients mirrored": str(len(clients.clients)),
+            "fullscreen state": str(properties.fullscreen_state),
+            "widgets": "yes" if widgets else "no",
+        },
+    )
+    server.stop()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("compositor", choices=("niri", "hyprland"))
+    parser.add_argument("trace", nargs="?", help="trace to replay, see tools/fake_compositor.py")
+    parser.add_argument("--speed", default="flood", help='speed multiplier, or "flood"')
+    parser.add_argument("--widgets", action="store_true", help="also drive the workspace widgets (needs a display)")
+    parser.add_argument("--timeout", type=float, default=120, help="give up after this many seconds")
+    parser.add_argument("--runtime-dir", help="where to put the sockets (default: a temporary directory)")
+    parser.add_argument("--generate", action="store_true", help="replay a generated trace instead")
+    parser.add_argument("--windows", type=int, default=100)
+    parser.add_argument("--workspaces", type=int, default=6)
+    parser.add_argument("--outputs", type=int, default=1)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=200, help="events per second")
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.generate == bool(args.trace):
+        parser.error("pass either a trace or --generate")
+
+    if args.generate:
+        trace = generate_trace(
+            windows=args.windows,
+            workspaces=args.workspaces,
+            outputs=args.outputs,
+            events=args.events,
+            rate=args.rate,
+            seed=args.seed,
+        )
+    else:
+        trace = load_trace(args.trace)
+
+    bench = bench_niri if args.compositor == "niri" else bench_hyprland
+    # a temporary directory is only created (and removed on exit) when none is given
+    with (
+        contextlib.nullcontext(args.runtime_dir)
+        if args.runtime_dir
+        else tempfile.TemporaryDirectory(prefix="compositor-bench-")
+    ) as runtime_dir:
+        bench(trace, runtime_dir, parse_speed(args.speed), args.widgets, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
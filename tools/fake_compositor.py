@@ -0,0 +1,676 @@
+"""
+A stand-in for the compositor IPC sockets, replaying recorded event traces.
+
+It speaks niri's JSON protocol on `$NIRI_SOCKET`, and hyprland's request socket
+(`.socket.sock`) and event socket (`.socket2.sock`), so the services and widgets
+in `widgets/helpers` can be exercised without a live compositor.
+
+Traces are JSON lines, each entry holding the offset (in seconds) it was recorded at
+and one of:
+    {"t": 0.5, "niri": {"WorkspaceActivated": {"id": 2, "focused": true}}}
+    {"t": 0.5, "hyprland": "workspace>>2"}
+    {"t": 0.5, "hyprland_state": {"clients": [...], "activeworkspace": {...}}}
+
+`hyprland_state` entries aren't sent anywhere, they replace what the request socket
+answers from then on. niri queries are answered from a state mirrored from the
+replayed events.
+
+Usage:
+    python tools/fake_compositor.py generate --windows 500 -o trace.jsonl
+    python tools/fake_compositor.py serve trace.jsonl --speed 10
+    python tools/fake_compositor.py serve trace.jsonl --speed flood
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import contextlib
+from collections.abc import Iterable
+
+
+def load_trace(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(path: str, trace: Iterable[dict]):
+    with open(path, "w") as f:
+        for entry in trace:
+            f.write(json.dumps(entry) + "\n")
+
+
+def parse_speed(speed: str | float) -> float:
+    """
+    A replay speed multiplier, "flood" (or 0) sends everything as fast as possible.
+    """
+    if speed == "flood":
+        return 0
+
+    return float(speed)
+
+
+class Replayer:
+    """
+    Paces trace entries according to their recorded offsets and the replay speed.
+    """
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.start = time.monotonic()
+
+    def wait_for(self, offset: float):
+        if self.speed <= 0:
+            return
+
+        delay = self.start + offset / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+NIRI_SENTINEL_EVENT = "FakeCompositorDone"
+HYPRLAND_SENTINEL_EVENT = "fakecompositordone"
+NIRI_SNAPSHOT_EVENTS = {"WorkspacesChanged", "WindowsChanged", "KeyboardLayoutsChanged"}
+
+
+class FakeNiriState:
+    """
+    The bare minimum of niri's state needed to answer queries consistently with the replayed events.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.workspaces: dict[int, dict] = {}
+        self.windows: dict[int, dict] = {}
+        self.outputs: dict[str, dict] = {}
+        self.keyboard_layouts = {"names": ["English (US)"], "current_idx": 0}
+
+    def apply(self, event: dict):
+        # the trace has to stay untouched for looped replays
+        name, data = next(iter(copy.deepcopy(event).items()))
+
+        with self.lock:
+            match name:
+                case "WorkspacesChanged":
+                    self.workspaces = {ws["id"]: ws for ws in data["workspaces"]}
+                    for ws in data["workspaces"]:
+                        if ws.get("output"):
+                            self.outputs.setdefault(ws["output"], fake_output(ws["output"]))
+                case "WorkspaceActivated":
+                    if not (activated := self.workspaces.get(data["id"])):
+                        return
+                    for ws in self.workspaces.values():
+                        if ws["output"] == activated["output"]:
+                            ws["is_active"] = False
+                        if data["focused"]:
+                            ws["is_focused"] = False
+                    activated["is_active"] = True
+                    activated["is_focused"] = activated["is_focused"] or data["focused"]
+                case "WorkspaceUrgencyChanged":
+                    if ws := self.workspaces.get(data["id"]):
+                        ws["is_urgent"] = data["urgent"]
+                case "WindowsChanged":
+                    self.windows = {window["id"]: window for window in data["windows"]}
+                case "WindowOpenedOrChanged":
+                    self.windows[data["window"]["id"]] = data["window"]
+                case "WindowClosed":
+                    self.windows.pop(data["id"], None)
+                case "WindowFocusChanged":
+                    for window in self.windows.values():
+                        window["is_focused"] = window["id"] == data["id"]
+                case "KeyboardLayoutsChanged":
+                    self.keyboard_layouts = data["keyboard_layouts"]
+                case "KeyboardLayoutSwitched":
+                    self.keyboard_layouts["current_idx"] = data["idx"]
+
+    def snapshot(self) -> list[dict]:
+        with self.lock:
+            return [
+                {"WorkspacesChanged": {"workspaces": list(self.workspaces.values())}},
+                {"WindowsChanged": {"windows": list(self.windows.values())}},
+                {"KeyboardLayoutsChanged": {"keyboard_layouts": self.keyboard_layouts}},
+            ]
+
+    def answer(self, request) -> dict:
+        if isinstance(request, dict):
+            # Actions (and anything else with a payload) are acknowledged and otherwise ignored
+            return {"Ok": "Handled"}
+
+        with self.lock:
+            match request:
+                case "Workspaces":
+                    return {"Ok": {"Workspaces": list(self.workspaces.values())}}
+                case "Windows":
+                    return {"Ok": {"Windows": list(self.windows.values())}}
+                case "Outputs":
+                    return {"Ok": {"Outputs": self.outputs}}
+                case "KeyboardLayouts":
+                    return {"Ok": {"KeyboardLayouts": self.keyboard_layouts}}
+                case "FocusedWindow":
+                    focused = next(
+                        (w for w in self.windows.values() if w.get("is_focused")), None
+                    )
+                    return {"Ok": {"FocusedWindow": focused}}
+                case "Version":
+                    return {"Ok": {"Version": "fake"}}
+
+        return {"Err": f"unsupported request: {request}"}
+
+
+class FakeNiriServer:
+    """
+    Serves niri's IPC protocol on a unix socket, streaming `trace` to every EventStream client.
+
+    Like niri, every connection answers a single request, unless `persistent` is set.
+    With `sentinel`, a `FakeCompositorDone` event marks the end of the replay.
+    `sent` records (sequence number, time.monotonic()) for every streamed event, the
+    sequence number is also injected into the event payload as `_bench_seq`.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        trace: list[dict],
+        speed: float = 1,
+        persistent: bool = False,
+        loop: bool = False,
+        sentinel: bool = False,
+    ):
+        self.socket_path = socket_path
+        self.trace = [entry for entry in trace if "niri" in entry]
+        self.speed = speed
+        self.persistent = persistent
+        self.loop = loop
+        self.sentinel = sentinel
+
+        # the leading snapshots are the state niri was in when the trace was recorded
+        self.state = FakeNiriState()
+        while self.trace and next(iter(self.trace[0]["niri"])) in NIRI_SNAPSHOT_EVENTS:
+            self.state.apply(self.trace.pop(0)["niri"])
+        self.sent: list[tuple[int, float]] = []
+        self.streams_done = threading.Event()
+        self._stopped = threading.Event()
+        self._server: socket.socket | None = None
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen(64)
+
+        threading.Thread(target=self.accept_task, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._server:
+            self._server.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def accept_task(self):
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+
+            threading.Thread(target=self.client_task, args=(client,), daemon=True).start()
+
+    def client_task(self, client: socket.socket):
+        with client, client.makefile("rwb") as stream:
+            for line in stream:
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    stream.write(b'{"Err":"invalid request"}\n')
+                    stream.flush()
+                    return
+
+                if request == "EventStream":
+                    stream.write(b'{"Ok":"Handled"}\n')
+                    stream.flush()
+                    return self.stream_events(stream)
+
+                stream.write(json.dumps(self.state.answer(request)).encode() + b"\n")
+                stream.flush()
+
+                if not self.persistent:
+                    return
+
+    def stream_events(self, stream):
+        try:
+            for event in self.state.snapshot():
+                stream.write(json.dumps(event).encode() + b"\n")
+            stream.flush()
+
+            while True:
+                replayer = Replayer(self.speed)
+                for entry in self.trace:
+                    if self._stopped.is_set():
+                        return
+
+                    replayer.wait_for(entry["t"])
+
+                    event = entry["niri"]
+                    self.state.apply(event)
+
+                    name, data = next(iter(event.items()))
+                    seq = len(self.sent)
+                    line = json.dumps({name: {**data, "_bench_seq": seq}}).encode()
+
+                    self.sent.append((seq, time.monotonic()))
+                    stream.write(line + b"\n")
+                    if self.speed > 0:
+                        stream.flush()
+                stream.flush()
+
+                if not self.loop:
+                    break
+
+            if self.sentinel:
+                stream.write(json.dumps({NIRI_SENTINEL_EVENT: {}}).encode() + b"\n")
+                stream.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        finally:
+            self.streams_done.set()
+
+        # keep the stream open like niri does, until the client goes away
+        self._stopped.wait()
+
+
+class FakeHyprlandServer:
+    """
+    Serves hyprland's `.socket.sock` (requests) and `.socket2.sock` (events) under
+    `$XDG_RUNTIME_DIR/hypr/<signature>/`, replaying `trace` to every event client.
+    `sent` records (sequence number, time.monotonic()) for every event line.
+    With `sentinel`, a `fakecompositordone` event marks the end of the replay.
+    """
+
+    def __init__(
+        self,
+        runtime_dir: str,
+        signature: str,
+        trace: list[dict],
+        speed: float = 1,
+        loop: bool = False,
+        sentinel: bool = False,
+    ):
+        self.directory = os.path.join(runtime_dir, "hypr", signature)
+        self.trace = [
+            entry for entry in trace if "hyprland" in entry or "hyprland_state" in entry
+        ]
+        self.speed = speed
+        self.loop = loop
+        self.sentinel = sentinel
+
+        self.state: dict[str, object] = {
+            "clients": [],
+            "activeworkspace": {"id": 1, "name": "1"},
+            "monitors": [fake_hyprland_monitor()],
+            "workspaces": [],
+            "devices": {"keyboards": [{"name": "fake-keyboard", "active_keymap": "English (US)"}]},
+        }
+        self.state_lock = threading.Lock()
+
+        # like with niri, the leading state is what hyprland looked like when the trace was recorded
+        while self.trace and "hyprland_state" in self.trace[0]:
+            self.state.update(self.trace.pop(0)["hyprland_state"])
+
+        self.sent: list[tuple[int, float]] = []
+        self.streams_done = threading.Event()
+        self._stopped = threading.Event()
+        self._servers: list[socket.socket] = []
+
+    @property
+    def request_socket_path(self) -> str:
+        return os.path.join(self.directory, ".socket.sock")
+
+    @property
+    def event_socket_path(self) -> str:
+        return os.path.join(self.directory, ".socket2.sock")
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        for path, handler in (
+            (self.request_socket_path, self.request_task),
+            (self.event_socket_path, self.event_task),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(64)
+            self._servers.append(server)
+
+            threading.Thread(
+                target=self.accept_task, args=(server, handler), daemon=True
+            ).start()
+
+    def stop(self):
+        self._stopped.set()
+        for server in self._servers:
+            server.close()
+        for path in (self.request_socket_path, self.event_socket_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def accept_task(self, server: socket.socket, handler):
+        while not self._stopped.is_set():
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+
+            threading.Thread(target=handler, args=(client,), daemon=True).start()
+
+    def request_task(self, client: socket.socket):
+        with client:
+            request = client.recv(8192).decode().strip()
+            # flags come before the slash, e.g. "j/clients", "[[BATCH]]" isn't supported
+            flags, _, command = request.rpartition("/")
+            command = command.split()[0] if command else ""
+
+            with self.state_lock:
+                if command in self.state:
+                    reply = json.dumps(self.state[command]) if "j" in flags else str(self.state[command])
+                else:
+                    reply = "ok"
+
+            client.sendall(reply.encode())
+
+    def event_task(self, client: socket.socket):
+        try:
+            with client:
+                while True:
+                    replayer = Replayer(self.speed)
+                    for entry in self.trace:
+                        if self._stopped.is_set():
+                            return
+
+                        replayer.wait_for(entry["t"])
+
+                        if "hyprland_state" in entry:
+                            with self.state_lock:
+                                self.state.update(entry["hyprland_state"])
+                            continue
+
+                        self.sent.append((len(self.sent), time.monotonic()))
+                        client.sendall(entry["hyprland"].encode() + b"\n")
+
+                    if not self.loop:
+                        break
+
+                if self.sentinel:
+                    client.sendall(f"{HYPRLAND_SENTINEL_EVENT}>>\n".encode())
+
+                self.streams_done.set()
+                self._stopped.wait()
+        except (BrokenPipeError, ConnectionResetError):
+            self.streams_done.set()
+
+
+def fake_output(name: str, x: int = 0) -> dict:
+    return {
+        "name": name,
+        "make": "Fake",
+        "model": "Monitor",
+        "serial": None,
+        "physical_size": [600, 340],
+        "modes": [{"width": 2560, "height": 1440, "refresh_rate": 60000, "is_preferred": True}],
+        "current_mode": 0,
+        "vrr_supported": False,
+        "vrr_enabled": False,
+        "logical": {
+            "x": x,
+            "y": 0,
+            "width": 2560,
+            "height": 1440,
+            "scale": 1.0,
+            "transform": "Normal",
+        },
+    }
+
+
+def fake_hyprland_monitor(id: int = 0, x: int = 0) -> dict:
+    return {
+        "id": id,
+        "name": f"DP-{id + 1}",
+        "x": x,
+        "y": 0,
+        "width": 2560,
+        "height": 1440,
+        "scale": 1.0,
+        "transform": 0,
+        "focused": id == 0,
+        "activeWorkspace": {"id": 1, "name": "1"},
+        "reserved": [0, 0, 0, 0],
+    }
+
+
+def generate_trace(
+    windows: int = 100,
+    workspaces: int = 6,
+    outputs: int = 1,
+    events: int = 2000,
+    rate: float = 200,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    A synthetic session: `windows` windows spread over `workspaces` workspaces per output,
+    followed by `events` random opens, closes, moves, focus and workspace switches,
+    at roughly `rate` events per second, for both niri and hyprland.
+    """
+    rng = random.Random(seed)
+    trace: list[dict] = []
+    t = 0.0
+
+    output_names = [f"DP-{i + 1}" for i in range(outputs)]
+    niri_workspaces = [
+        {
+            "id": o * workspaces + i + 1,
+            "idx": i + 1,
+            "name": None,
+            "output": output,
+            "is_urgent": False,
+            "is_active": i == 0,
+            "is_focused": o == 0 and i == 0,
+            "active_window_id": None,
+        }
+        for o, output in enumerate(output_names)
+        for i in range(workspaces)
+    ]
+    trace.append({"t": t, "niri": {"WorkspacesChanged": {"workspaces": niri_workspaces}}})
+
+    next_window_id = 1
+    open_windows: dict[int, dict] = {}
+
+    def new_window() -> dict:
+        nonlocal next_window_id
+        ws = rng.choice(niri_workspaces)
+        output_index = output_names.index(ws["output"])
+        window = {
+            "id": next_window_id,
+            "title": f"Window {next_window_id}",
+            "app_id": rng.choice(["kitty", "firefox", "code", "nautilus"]),
+            "pid": 1000 + next_window_id,
+            "workspace_id": ws["id"],
+            "is_focused": False,
+            "is_floating": rng.random() < 0.2,
+            "is_urgent": False,
+            # hyprland only, kept alongside so both traces agree
+            "at": [output_index * 2560 + rng.randrange(0, 2000), rng.randrange(0, 1000)],
+            "size": [rng.randrange(200, 1280), rng.randrange(200, 1000)],
+        }
+        next_window_id += 1
+        return window
+
+    def hyprland_clients() -> list[dict]:
+        return [
+            {
+                "address": hex(0x1000 + window["id"]),
+                "mapped": True,
+                "hidden": False,
+                "at": window["at"],
+                "size": window["size"],
+                "workspace": {"id": window["workspace_id"], "name": str(window["workspace_id"])},
+                "floating": window["is_floating"],
+                "pinned": False,
+                "monitor": (window["workspace_id"] - 1) // workspaces,
+                "class": window["app_id"],
+                "title": window["title"],
+                "pid": window["pid"],
+                "fullscreen": 0,
+                "focusHistoryID": 0,
+            }
+            for window in open_windows.values()
+        ]
+
+    def niri_window(window: dict) -> dict:
+        return {k: v for k, v in window.items() if k not in ("at", "size")}
+
+    for _ in range(windows):
+        window = new_window()
+        open_windows[window["id"]] = window
+    trace.append(
+        {"t": t, "niri": {"WindowsChanged": {"windows": [niri_window(w) for w in open_windows.values()]}}}
+    )
+    trace.append({"t": t, "hyprland_state": {"clients": hyprland_clients()}})
+
+    for _ in range(events):
+        t += rng.expovariate(rate)
+        roll = rng.random()
+
+        if roll < 0.2 or not open_windows:
+            window = new_window()
+            open_windows[window["id"]] = window
+            trace.append({"t": t, "hyprland_state": {"clients": hyprland_clients()}})
+            trace.append({"t": t, "niri": {"WindowOpenedOrChanged": {"window": niri_window(window)}}})
+            trace.append(
+                {
+                    "t": t,
+                    "hyprland": f"openwindow>>{hex(0x1000 + window['id'])[2:]},{window['workspace_id']},{window['app_id']},{window['title']}",
+                }
+            )
+        elif roll < 0.35:
+            window = open_windows.pop(rng.choice(list(open_windows)))
+            trace.append({"t": t, "hyprland_state": {"clients": hyprland_clients()}})
+            trace.append({"t": t, "niri": {"WindowClosed": {"id": window["id"]}}})
+            trace.append({"t": t, "hyprland": f"closewindow>>{hex(0x1000 + window['id'])[2:]}"})
+        elif roll < 0.5:
+            window = open_windows[rng.choice(list(open_windows))]
+            ws = rng.choice(niri_workspaces)
+            window["workspace_id"] = ws["id"]
+            trace.append({"t": t, "hyprland_state": {"clients": hyprland_clients()}})
+            trace.append({"t": t, "niri": {"WindowOpenedOrChanged": {"window": niri_window(window)}}})
+            trace.append(
+                {
+                    "t": t,
+                    "hyprland": f"movewindowv2>>{hex(0x1000 + window['id'])[2:]},{ws['id']},{ws['id']}",
+                }
+            )
+            trace.append({"t": t, "hyprland": f"movewindow>>{hex(0x1000 + window['id'])[2:]},{ws['id']}"})
+        elif roll < 0.75:
+            window = open_windows[rng.choice(list(open_windows))]
+            trace.append({"t": t, "niri": {"WindowFocusChanged": {"id": window["id"]}}})
+            trace.append({"t": t, "hyprland": f"activewindowv2>>{hex(0x1000 + window['id'])[2:]}"})
+        else:
+            ws = rng.choice(niri_workspaces)
+            trace.append(
+                {
+                    "t": t,
+                    "hyprland_state": {"activeworkspace": {"id": ws["id"], "name": str(ws["id"])}},
+                }
+            )
+            trace.append({"t": t, "niri": {"WorkspaceActivated": {"id": ws["id"], "focused": True}}})
+            trace.append({"t": t, "hyprland": f"workspacev2>>{ws['id']},{ws['id']}"})
+            trace.append({"t": t, "hyprland": f"workspace>>{ws['id']}"})
+
+    return trace
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="generate a synthetic trace")
+    generate.add_argument("-o", "--output", required=True)
+    generate.add_argument("--windows", type=int, default=100)
+    generate.add_argument("--workspaces", type=int, default=6)
+    generate.add_argument("--outputs", type=int, default=1)
+    generate.add_argument("--events", type=int, default=2000)
+    generate.add_argument("--rate", type=float, default=200, help="events per second")
+    generate.add_argument("--seed", type=int, default=0)
+
+    serve = commands.add_parser("serve", help="replay a trace on fake compositor sockets")
+    serve.add_argument("trace")
+    serve.add_argument("--speed", default="1", help='speed multiplier, or "flood"')
+    serve.add_argument("--loop", action="store_true")
+    serve.add_argument("--persistent", action="store_true", help="answer several niri requests per connection")
+    serve.add_argument("--runtime-dir", help="where to put the sockets (default: a temporary directory)")
+    serve.add_argument("--signature", default="fake")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        trace = generate_trace(
+            windows=args.windows,
+            workspaces=args.workspaces,
+            outputs=args.outputs,
+            events=args.events,
+            rate=args.rate,
+            seed=args.seed,
+        )
+        save_trace(args.output, trace)
+        print(f"wrote {len(trace)} entries to {args.output}")
+        return
+
+    trace = load_trace(args.trace)
+    speed = parse_speed(args.speed)
+    # the bench harness stops it with SIGTERM, which exits (and cleans up) like ^C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # a temporary directory is only created (and removed on exit) when none is given
+    with (
+        contextlib.nullcontext(args.runtime_dir)
+        if args.runtime_dir
+        else tempfile.TemporaryDirectory(prefix="fake-compositor-")
+    ) as runtime_dir:
+        niri = FakeNiriServer(
+            os.path.join(runtime_dir, "niri.sock"),
+            trace,
+            speed=speed,
+            persistent=args.persistent,
+            loop=args.loop,
+        )
+        hyprland = FakeHyprlandServer(runtime_dir, args.signature, trace, speed=speed, loop=args.loop)
+        niri.start()
+        hyprland.start()
+
+        print(f"export NIRI_SOCKET={niri.socket_path}")
+        print(f"export XDG_RUNTIME_DIR={runtime_dir}")
+        print(f"export HYPRLAND_INSTANCE_SIGNATURE={args.signature}")
+        sys.stdout.flush()
+
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            niri.stop()
+            hyprland.stop()
+
+
+if __name__ == "__main__":
+    main()
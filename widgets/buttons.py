@@ -8,7 +8,9 @@ from fabric.core.service import Signal, Property
 from fabric.hyprland.widgets import WorkspaceButton
 
 from loguru import logger
-from typing import Literal
+from typing import Literal, cast
+import math
+import cairo
 
 # import gi
 # gi.require_version("Gtk", "3.0")
@@ -52,6 +54,68 @@ class MarkupButton(Button):
         self.label.set_markup(new_markup)
 
 
+class ThumbnailButton(MarkupButton):
+    """
+    A button painted with a cairo surface, scaled to cover it (like
+    `background-size: cover`), aligned by its `left`/`right` style classes and
+    clipped to its border radius.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.surface: cairo.ImageSurface | None = None
+
+    def set_surface(self, surface: cairo.ImageSurface | None):
+        if surface is self.surface:
+            return
+
+        self.surface = surface
+        self.queue_draw()
+
+    def do_draw(self, cr: cairo.Context):
+        GTKButton.do_draw(self, cr)
+
+        if not self.surface:
+            return
+
+        context = self.get_style_context()
+        width, height = self.get_allocated_width(), self.get_allocated_height()
+        surface_width, surface_height = self.surface.get_width(), self.surface.get_height()
+        if not (width and height and surface_width and surface_height):
+            return
+
+        scale = max(width / surface_width, height / surface_height)
+        x = width - surface_width * scale
+        if context.has_class("left"):
+            x = 0
+        elif not context.has_class("right"):
+            x /= 2
+        y = (height - surface_height * scale) / 2
+
+        radius = min(
+            cast(int, context.get_property("border-radius", context.get_state())),
+            width / 2,
+            height / 2,
+        )
+
+        cr.save()
+        cr.new_sub_path()
+        cr.arc(width - radius, radius, radius, -math.pi / 2, 0)
+        cr.arc(width - radius, height - radius, radius, 0, math.pi / 2)
+        cr.arc(radius, height - radius, radius, math.pi / 2, math.pi)
+        cr.arc(radius, radius, radius, math.pi, 3 * math.pi / 2)
+        cr.close_path()
+        cr.clip()
+
+        cr.translate(x, y)
+        cr.scale(scale, scale)
+        cr.set_source_surface(self.surface, 0, 0)
+        cr.get_source().set_filter(cairo.FILTER_GOOD)
+        cr.paint()
+        cr.restore()
+
+
 class ToggleButton(MarkupButton):
     @Signal
     def on_toggled(self, modifiers: int): ...
@@ -1,9 +1,11 @@
 import math
+from collections.abc import Callable, Sequence
 from fabric.utils import DesktopApp
 from fabric.widgets.button import Button
 from loguru import logger
 
 from widgets.rounded_image import RoundedImage as Image
+from widgets.helpers.icon_cache import IconImage
 from fabric.widgets.eventbox import EventBox
 from fabric.widgets.box import Box
 from fabric.widgets.label import Label
@@ -11,6 +13,8 @@ from fabric.core.service import Signal
 
 from gi.repository import Gdk  # noqa: E402
 
+OVERSCAN_ROWS = 1
+
 
 class Grid(Box):
     @Signal
@@ -24,6 +28,7 @@ class Grid(Box):
         item_sort_name_fetcher,
         item_factory,
         sort_function,
+        search_function: Callable[[str | None], Sequence] | None = None,
         *args,
         **kwargs,
     ):
@@ -37,22 +42,29 @@ class Grid(Box):
         self.get_item_name = item_sort_name_fetcher
         self.item_factory = item_factory
         self.sort_function = sort_function
+        # returns the ranked matches for a keyword, replaces the filtering and sorting below
+        self.search_function = search_function
 
-        self.rows: list[Box] = []
+        self.num_rows = rows
         self.items = self.get_items()
 
-        def row_factory():
-            return Box(h_expand=True, v_expand=True)
-
-        for i in range(rows):
-            self.rows.append(row_factory())
-            self.add(self.rows[-1])
+        # the row boxes, top to bottom, with OVERSCAN_ROWS hidden ones on each side of the
+        # visible page, already bound to the rows above and below it
+        self.rows: list[Box] = []
+        # the row of items shown by the first row box, so the top overscan one
+        self.first_row = -OVERSCAN_ROWS
 
         id = 0
-        for row in self.rows:
-            for i in range(self.num_columns):
+        for i in range(rows + 2 * OVERSCAN_ROWS):
+            row = Box(h_expand=True, v_expand=True)
+            # only ever shown through `redraw_items`
+            row.set_no_show_all(True)
+            row.set_visible(OVERSCAN_ROWS <= i < rows + OVERSCAN_ROWS)
+
+            for _ in range(self.num_columns):
                 new_item = GridItem(id=id)
                 new_item.connect("button-release-event", self.handle_item_click)
+                new_item.show_all()
 
                 row.add(new_item)
 
@@ -60,12 +72,16 @@ class Grid(Box):
 
             row.set_homogeneous(True)
 
+            self.rows.append(row)
+            self.add(row)
+
         self.set_homogeneous(True)
 
     def handle_item_click(self, item, *_):
-        index = item.id + self.row_offset * self.num_columns
+        if item.index is None:
+            return
 
-        self.selected_item = index
+        self.selected_item = item.index
         self.redraw_items()
 
         self.on_item_clicked()
@@ -76,87 +92,84 @@ class Grid(Box):
 
             for child in children:
                 child.clear()
-                child.remove_style("active")
 
         self.filter_items()
 
     def filter_items(self, keyword: str | None = None):
-        if keyword is None:
-            self.items = self.get_items()
+        if self.search_function:
+            self.items = self.search_function(keyword)
         else:
-            self.items = [
-                item
-                for item in self.get_items()
-                if keyword.casefold() in self.get_item_name(item).casefold()
-            ]
+            if keyword is None:
+                self.items = self.get_items()
+            else:
+                self.items = [
+                    item
+                    for item in self.get_items()
+                    if keyword.casefold() in self.get_item_name(item).casefold()
+                ]
 
-        self.items.sort(key=lambda x: str.casefold(x.name))
-        self.items.sort(key=self.sort_function)
+            self.items.sort(key=lambda x: str.casefold(x.name))
+            self.items.sort(key=self.sort_function)
 
         self.row_offset = 0
         self.selected_item = 0
 
-        self.redraw_items(force_update=True)
+        # slots keeping the same item aren't redrawn
+        self.redraw_items()
 
     def redraw_items(self, force_update=False):
-        if not force_update:
-            update_items = False
-            while (
-                self.selected_item - self.row_offset * self.num_columns
-                >= self.num_columns * len(self.rows)
-            ):
-                self.row_offset += 1
-                update_items = True
-
-            while self.selected_item - self.row_offset * self.num_columns < 0:
-                self.row_offset -= 1
-                update_items = True
-        else:
-            update_items = True
-
-        if update_items:
-            for i in range(self.num_columns * len(self.rows)):
-                index = i + self.row_offset * self.num_columns
-
-                row = math.floor(i / self.num_columns)
-                column = i % self.num_columns
-
-                grid_item = self.rows[row].children[column]
+        """
+        Scroll to the selected item, and update the slots whose item or selected state changed.
+        """
+        selected_row = self.selected_item // self.num_columns
+        if selected_row < self.row_offset:
+            self.row_offset = selected_row
+        elif selected_row >= self.row_offset + self.num_rows:
+            self.row_offset = selected_row - self.num_rows + 1
 
-                if index >= len(self.items):
-                    grid_item.clear()
-                    grid_item.remove_style("active")
+        self.scroll_rows(self.row_offset - OVERSCAN_ROWS)
 
-                    continue
+        for position, row in enumerate(self.rows):
+            row.set_visible(OVERSCAN_ROWS <= position < self.num_rows + OVERSCAN_ROWS)
 
-                item = self.items[index]
-                grid_item.update(*self.item_factory(item))
+            index = (self.first_row + position) * self.num_columns
+            children: list[GridItem] = row.children
+            for grid_item in children:
+                self.bind_item(grid_item, index, force_update)
+                index += 1
+
+    def scroll_rows(self, first_row: int):
+        """
+        Move the row boxes scrolled out on one side to the other, the rest keep their items.
+        """
+        shift = first_row - self.first_row
+        self.first_row = first_row
+
+        if not shift or abs(shift) >= len(self.rows):
+            # nothing to recycle, everything gets rebound
+            return
 
-                if index == self.selected_item:
-                    # logger.error(f"forced index: {i} {index}")
-                    grid_item.add_style("active")
-                else:
-                    grid_item.remove_style("active")
+        if shift > 0:
+            moved, self.rows = self.rows[:shift], self.rows[shift:] + self.rows[:shift]
+            for row in moved:
+                self.reorder_child(row, -1)
         else:
-            for i in range(self.num_columns * len(self.rows)):
-                index = i + self.row_offset * self.num_columns
-
-                row = math.floor(i / self.num_columns)
-                column = i % self.num_columns
+            moved, self.rows = self.rows[shift:], self.rows[shift:] + self.rows[:shift]
+            for position, row in enumerate(moved):
+                self.reorder_child(row, position)
 
-                grid_item = self.rows[row].children[column]
+    def bind_item(self, grid_item: "GridItem", index: int, force_update: bool = False):
+        item = self.items[index] if 0 <= index < len(self.items) else None
+        grid_item.index = index if item is not None else None
 
-                if index >= len(self.items):
-                    grid_item.clear()
-                    grid_item.remove_style("active")
-
-                    continue
+        if force_update or item is not grid_item.item:
+            if item is None:
+                grid_item.clear()
+            else:
+                grid_item.update(*self.item_factory(item))
+            grid_item.item = item
 
-                if index == self.selected_item:
-                    # logger.error(f"index: {i} {index}")
-                    grid_item.add_style("active")
-                else:
-                    grid_item.remove_style("active")
+        grid_item.set_active(item is not None and index == self.selected_item)
 
     def inc_selection(self):
         self.selected_item += 1
@@ -208,11 +221,15 @@ class Grid(Box):
         self.redraw_items()
 
 
-class GridItem(Button):
+class GridItem(IconImage, Button):
     def __init__(self, id, *args, **kwargs):
         super().__init__(name="grid_item", * args, **kwargs)
 
         self.id = id
+        # what the slot shows, see `Grid.bind_item`
+        self.index: int | None = None
+        self.item = None
+        self.active = False
 
         self.set_can_focus(False)
         self.set_focus_on_click(False)
@@ -243,6 +260,8 @@ class GridItem(Button):
         self.connect("enter-notify-event", lambda *_: self.cursor_enter())
         self.connect("leave-notify-event", lambda *_: self.cursor_leave())
 
+        self.clear()
+
     def cursor_enter(self):
         if not self.is_sensitive():
             return
@@ -267,18 +286,25 @@ class GridItem(Button):
 
     def clear(self):
         self.set_label("")
+        self.cancel_image()
         self.icon.clear()
+        self.item = None
+        self.set_active(False)
 
         self.add_style("empty")
 
-    def set_label(self, markup):
-        self.label.set_markup(markup)
+    def set_active(self, active: bool):
+        if active == self.active:
+            return
 
-    def set_image(self, image):
-        if isinstance(image, str):
-            self.icon.set_from_file(image)
+        self.active = active
+        if active:
+            self.add_style("active")
         else:
-            self.icon.set_from_pixbuf(image)
+            self.remove_style("active")
+
+    def set_label(self, markup):
+        self.label.set_markup(markup)
 
     def add_style(self, style):
         self.add_style_class(style)
@@ -0,0 +1,117 @@
+from collections.abc import Iterable, Hashable
+
+from fabric.utils import DesktopApp
+
+NGRAM_SIZE = 3
+MEMO_SIZE = 4096
+
+
+def get_app_keys(app: DesktopApp) -> list[str]:
+    """
+    The identifiers an app can be found by, lowercased.
+    """
+    keys = []
+    if app.name:
+        keys.append(app.name.lower())
+    if app.display_name:
+        keys.append(app.display_name.lower())
+    if app.window_class:
+        keys.append(app.window_class.lower())
+    if app.executable:
+        keys.append(app.executable.split("/")[-1].lower())
+    if app.command_line:
+        keys.append(app.command_line.split()[0].split("/")[-1].lower())
+
+    return keys
+
+
+class AppMatcher:
+    """
+    Resolves identifiers (window classes, titles, pinned item names...) to desktop apps.
+
+    An identifier matches the app registered under it exactly, otherwise the app
+    of the first identifier (in registration order) containing it. Substring
+    lookups go through an n-gram index instead of scanning every identifier, and
+    every answer is memoized, so repeated lookups (windows retitle all the time)
+    are a dict hit. The matcher is immutable, build a new one when the apps change.
+    """
+
+    def __init__(self, apps: Iterable[DesktopApp]):
+        self.identifiers: dict[str, DesktopApp] = {}
+        for app in apps:
+            for key in get_app_keys(app):
+                self.identifiers[key] = app
+
+        # identifiers by registration order, which decides between several substring matches
+        self._keys = list(self.identifiers)
+        # every n-gram (and shorter) of every identifier, to the positions of the identifiers containing it
+        self._ngrams: dict[str, set[int]] = {}
+        for position, key in enumerate(self._keys):
+            for size in range(1, NGRAM_SIZE + 1):
+                for start in range(len(key) - size + 1):
+                    self._ngrams.setdefault(key[start : start + size], set()).add(position)
+
+        self._memo: dict[Hashable, DesktopApp | None] = {}
+
+    def find(self, identifier: str) -> DesktopApp | None:
+        identifier = identifier.lower()
+        try:
+            return self._memo[identifier]
+        except KeyError:
+            app = self.lookup(identifier)
+            self.memoize(identifier, app)
+            return app
+
+    def find_first(self, identifiers: Iterable[str]) -> DesktopApp | None:
+        """
+        The app of the first identifier that matches anything.
+        """
+        identifiers = tuple(identifiers)
+        try:
+            return self._memo[identifiers]
+        except KeyError:
+            pass
+
+        app = None
+        for identifier in identifiers:
+            if app := self.find(identifier):
+                break
+
+        self.memoize(identifiers, app)
+        return app
+
+    def memoize(self, key: Hashable, app: DesktopApp | None):
+        # titles are endless (terminals put the running command in them), start over instead of growing forever
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+
+        self._memo[key] = app
+
+    def lookup(self, identifier: str) -> DesktopApp | None:
+        if (app := self.identifiers.get(identifier)) is not None:
+            return app
+
+        if not identifier:
+            # the empty string is in everything
+            return self.identifiers[self._keys[0]] if self._keys else None
+
+        if len(identifier) <= NGRAM_SIZE:
+            candidates = self._ngrams.get(identifier)
+        else:
+            candidates = None
+            for start in range(len(identifier) - NGRAM_SIZE + 1):
+                positions = self._ngrams.get(identifier[start : start + NGRAM_SIZE])
+                if not positions:
+                    return None
+                candidates = positions if candidates is None else candidates & positions
+                if not candidates:
+                    return None
+
+        if not candidates:
+            return None
+
+        for position in sorted(candidates):
+            if identifier in self._keys[position]:
+                return self.identifiers[self._keys[position]]
+
+        return None
@@ -0,0 +1,401 @@
+import re
+import math
+import time
+import heapq
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Callable, Container, Iterable, Iterator, Sequence
+from itertools import islice
+from operator import itemgetter
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+QUERY_CACHE_SIZE = 32
+# up to how many candidates are checked one by one, past that they're searched for in the joined haystacks
+SCAN_LIMIT = 256
+# between the items in the joined haystacks, it can't be typed
+SEPARATOR = "\0"
+BIAS_TTL = 60  # seconds
+
+# fzf-like scoring, every matched character is worth SCORE_MATCH plus its bonuses
+SCORE_MATCH = 16
+BONUS_BOUNDARY = 8
+BONUS_FIRST_CHAR_MULTIPLIER = 2
+BONUS_CONSECUTIVE = 4
+BONUS_PREFIX = 16
+BONUS_ACRONYM = 2
+PENALTY_GAP_START = 3
+PENALTY_GAP_EXTENSION = 1
+# matches in the other fields (generic name, description...) only count when contiguous, and for less
+OTHER_FIELDS_WEIGHT = 0.75
+# how much frecency counts against match quality, per doubling of the decayed launch count
+FRECENCY_WEIGHT = 8
+
+WORD_SEPARATORS = " -_./:+"
+
+
+def get_word_boundaries(text: str) -> frozenset[int]:
+    """
+    The positions starting a word, including camelCase humps.
+    """
+    return frozenset(
+        i
+        for i, char in enumerate(text)
+        if i == 0
+        or text[i - 1] in WORD_SEPARATORS
+        or (char.isupper() and text[i - 1].islower())
+        or (char.isdigit() and not text[i - 1].isdigit())
+    )
+
+
+def substring_score(query: str, text: str, position: int, boundaries: Container[int]) -> float:
+    score = (SCORE_MATCH + BONUS_CONSECUTIVE) * len(query) - BONUS_CONSECUTIVE
+    if position in boundaries:
+        score += BONUS_BOUNDARY * BONUS_FIRST_CHAR_MULTIPLIER
+    if position == 0:
+        score += BONUS_PREFIX
+    return score
+
+
+def fuzzy_score(query: str, text: str, boundaries: frozenset[int], initials: str) -> float | None:
+    """
+    How well `query` matches `text` (both casefolded) as a subsequence, None if it doesn't.
+    """
+    if (position := text.find(query)) >= 0:
+        score = substring_score(query, text, position, boundaries)
+    else:
+        # greedy, leftmost alignment, unlike fzf there's no search for the best one
+        score = 0
+        previous = -1
+        for char in query:
+            if (position := text.find(char, previous + 1)) < 0:
+                return None
+
+            score += SCORE_MATCH
+            if position in boundaries:
+                score += BONUS_BOUNDARY * (BONUS_FIRST_CHAR_MULTIPLIER if previous < 0 else 1)
+            if position == previous + 1:
+                score += BONUS_CONSECUTIVE
+            elif previous >= 0:
+                score -= PENALTY_GAP_START + PENALTY_GAP_EXTENSION * (position - previous - 2)
+            previous = position
+
+    # the alignment on word starts, which the greedy one misses ("vsc" for "Visual Studio Code")
+    if query in initials:
+        acronym_score = (
+            (SCORE_MATCH + BONUS_BOUNDARY + BONUS_ACRONYM) * len(query)
+            + BONUS_BOUNDARY * (BONUS_FIRST_CHAR_MULTIPLIER - 1)
+        )
+        score = max(score, acronym_score)
+
+    return score
+
+
+# the matches of a query, grouped by score (best first), each group in index order
+Groups = list[tuple[float, list[int]]]
+
+
+def group_by_score(scores: dict[int, float]) -> Groups:
+    groups: dict[float, list[int]] = {}
+    for i in sorted(scores):
+        groups.setdefault(scores[i], []).append(i)
+
+    return sorted(groups.items(), key=itemgetter(0), reverse=True)
+
+
+class SearchIndex(Generic[T]):
+    """
+    The precomputed, casefolded haystacks of a set of items, sorted by name, so
+    index order is also the order ties are ranked in.
+
+    Single characters match most items, so they're the most expensive queries
+    to score one by one, but their score only takes a few values (the name's
+    first character, a word start in the name, anywhere in the name, a word
+    start in the other fields, anywhere in them). So the first characters of
+    names and words are bucketed up front, and a character's matches are
+    grouped by score with membership tests, the first time it's searched for.
+    """
+
+    def __init__(
+        self,
+        items: Iterable[T],
+        haystack_fetcher: Callable[[T], Iterable[str | None]],
+        name_fetcher: Callable[[T], str],
+    ):
+        self.items: list[T] = sorted(items, key=lambda item: name_fetcher(item).casefold())
+        self.haystacks: list[str] = []
+        self.names: list[str] = []
+        self.name_boundaries: list[frozenset[int]] = []
+        self.name_initials: list[str] = []
+
+        for item in self.items:
+            fields = [field.casefold() for field in haystack_fetcher(item) if field]
+            self.haystacks.append(" ".join(fields).replace(SEPARATOR, " "))
+
+            name = name_fetcher(item)
+            boundaries = get_word_boundaries(name)
+            self.names.append(name.casefold().replace(SEPARATOR, " "))
+            self.name_boundaries.append(boundaries)
+            self.name_initials.append("".join(name[i] for i in sorted(boundaries)).casefold())
+
+        # everything joined, to be searched with a single regex
+        self.names_text, self.name_starts = self.join(self.names)
+        self.haystacks_text, self.haystack_starts = self.join(self.haystacks)
+
+        # char -> the items whose name starts with it, or has a word starting with it
+        self.first_chars: dict[str, list[int]] = {}
+        self.initial_chars: dict[str, list[int]] = {}
+        for i, (name, initials) in enumerate(zip(self.names, self.name_initials)):
+            if name:
+                self.first_chars.setdefault(name[0], []).append(i)
+            for char in set(initials):
+                self.initial_chars.setdefault(char, []).append(i)
+
+        self._single_chars: dict[str, Groups] = {}
+
+    @staticmethod
+    def join(texts: list[str]) -> tuple[str, list[int]]:
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + len(SEPARATOR)
+
+        return SEPARATOR.join(texts), starts
+
+    def get_single_char(self, char: str) -> Groups:
+        """
+        The matches of a single character, the same `score` would give.
+        """
+        if (groups := self._single_chars.get(char)) is not None:
+            return groups
+
+        first = self.first_chars.get(char, [])
+        initial = set(self.initial_chars.get(char, ())).difference(first)
+        in_name = [i for i, name in enumerate(self.names) if char in name]
+        in_name_set = set(in_name)
+        haystacks = self.haystacks
+        in_others = [
+            i for i, haystack in enumerate(haystacks) if char in haystack and i not in in_name_set
+        ]
+        # whether its first occurrence starts a word
+        at_word_start = {
+            i
+            for i in in_others
+            if (position := haystacks[i].find(char)) == 0 or haystacks[i][position - 1] == " "
+        }
+
+        scored = [
+            (substring_score("x", "x", 0, (0,)), first),
+            (fuzzy_score("x", "ax", frozenset((1,)), "x"), sorted(initial)),
+            (
+                fuzzy_score("x", "ax", frozenset(), ""),
+                [i for i in in_name if i not in initial and self.names[i][0] != char],
+            ),
+            (
+                substring_score("x", " x", 1, (1,)) * OTHER_FIELDS_WEIGHT,
+                [i for i in in_others if i in at_word_start],
+            ),
+            (
+                substring_score("x", "ax", 1, ()) * OTHER_FIELDS_WEIGHT,
+                [i for i in in_others if i not in at_word_start],
+            ),
+        ]
+        groups = sorted(
+            ((score, items) for score, items in scored if items), key=itemgetter(0), reverse=True
+        )
+
+        self._single_chars[char] = groups
+        return groups
+
+    def score(self, query: str, i: int) -> float | None:
+        """
+        How well an item matches `query`, None if it doesn't.
+        """
+        score = fuzzy_score(query, self.names[i], self.name_boundaries[i], self.name_initials[i])
+        if score is not None:
+            return score
+
+        haystack = self.haystacks[i]
+        if (position := haystack.find(query)) < 0:
+            return None
+
+        word_start = (position,) if position == 0 or haystack[position - 1] == " " else ()
+        return substring_score(query, haystack, position, word_start) * OTHER_FIELDS_WEIGHT
+
+    def find(self, query: str) -> list[int]:
+        """
+        The items matching `query`, in index order, found by searching all the
+        names and haystacks at once, in C.
+        """
+        # the rest of the item is consumed, so there's at most one match per item
+        name_pattern = re.compile(
+            f"[^{SEPARATOR}]*?".join(map(re.escape, query)) + f"[^{SEPARATOR}]*"
+        )
+        haystack_pattern = re.compile(re.escape(query) + f"[^{SEPARATOR}]*")
+
+        found = {
+            bisect_right(self.name_starts, match.start()) - 1
+            for match in name_pattern.finditer(self.names_text)
+        }
+        found.update(
+            bisect_right(self.haystack_starts, match.start()) - 1
+            for match in haystack_pattern.finditer(self.haystacks_text)
+        )
+
+        return sorted(found)
+
+
+class RankedResults(Sequence[T]):
+    """
+    Search results, ranked lazily: they're pulled from already sorted streams
+    only as far as they're looked at (the first page of a grid, say).
+    """
+
+    def __init__(self, index: SearchIndex[T], ranked: Iterator[int], count: int):
+        self.index = index
+        self.count = count
+        self._pending = ranked
+        self._ranked: list[int] = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("result index out of range")
+
+        if position >= len(self._ranked):
+            # grow geometrically, so scrolling down doesn't pull one row at a time
+            count = max(position + 1, len(self._ranked) * 2) - len(self._ranked)
+            self._ranked.extend(islice(self._pending, count))
+
+        return self.index.items[self._ranked[position]]
+
+
+class AppSearch(Generic[T]):
+    """
+    Fuzzy search over items (i.e. desktop apps) with precomputed haystacks.
+
+    Names are matched fuzzily (fzf-style: characters in order, with bonuses for
+    word boundaries, prefixes, consecutive runs and acronyms), the other fields
+    only by substring. The match quality is combined with the item's `bias`
+    (i.e. its frecency), which is computed for all items at once and refreshed
+    every `BIAS_TTL`, or after `invalidate_ranking`.
+
+    The index is built once per version of the item set (`invalidate` starts a
+    new one). Matches are scored without the bias, and grouped by score, so
+    only the few biased items (the ones launched recently) are ranked again
+    for each search, the rest is already in order. Single characters are
+    scored with the index, a longer query checks the matches of a previous
+    query it contains if there are few, otherwise it's searched for in all the
+    haystacks at once. Recent queries are remembered, so deleting characters is
+    a lookup.
+    """
+
+    def __init__(
+        self,
+        items_fetcher: Callable[[], Iterable[T]],
+        haystack_fetcher: Callable[[T], Iterable[str | None]],
+        name_fetcher: Callable[[T], str],
+        bias_fetcher: Callable[[T], float] = lambda _: 0,
+    ):
+        self.items_fetcher = items_fetcher
+        self.haystack_fetcher = haystack_fetcher
+        self.name_fetcher = name_fetcher
+        self.bias_fetcher = bias_fetcher
+
+        self._index: SearchIndex[T] | None = None
+        # query -> (groups, scores)
+        self._queries: OrderedDict[str, tuple[Groups, dict[int, float]]] = OrderedDict()
+        self._bias: list[float] | None = None
+        self._bias_time = 0.0
+        self._biased: list[int] = []
+        self._biased_set: frozenset[int] = frozenset()
+        self._order: list[int] = []
+
+    @property
+    def index(self) -> SearchIndex[T]:
+        if self._index is None:
+            self._index = SearchIndex(
+                self.items_fetcher(), self.haystack_fetcher, self.name_fetcher
+            )
+            self._queries.clear()
+            self._bias = None
+
+        return self._index
+
+    def invalidate(self):
+        self._index = None
+
+    def invalidate_ranking(self):
+        self._bias = None
+
+    def get_bias(self, index: SearchIndex[T]) -> list[float]:
+        if self._bias is None or time.monotonic() - self._bias_time > BIAS_TTL:
+            self._bias = [
+                FRECENCY_WEIGHT * math.log2(1 + self.bias_fetcher(item))
+                for item in index.items
+            ]
+            self._bias_time = time.monotonic()
+            self._biased = [i for i, bias in enumerate(self._bias) if bias]
+            self._biased_set = frozenset(self._biased)
+            # the order without a query, index order is the name order
+            self._order = sorted(range(len(index.items)), key=lambda i: (-self._bias[i], i))
+
+        return self._bias
+
+    def search(self, query: str | None = None) -> RankedResults[T]:
+        index = self.index
+        bias = self.get_bias(index)
+
+        if not (query := (query or "").casefold().replace(SEPARATOR, " ")):
+            return RankedResults(index, iter(self._order), len(self._order))
+
+        if len(query) == 1:
+            groups = index.get_single_char(query)
+            count = sum(len(items) for _, items in groups)
+            scores = {
+                i: score for i in self._biased if (score := index.score(query, i)) is not None
+            }
+        else:
+            groups, scores = self.match(index, query)
+            count = len(scores)
+
+        # the biased matches are ranked with their bias, and merged into the others, which are already in order
+        biased = sorted((-(scores[i] + bias[i]), i) for i in self._biased if i in scores)
+        biased_set = self._biased_set
+        unbiased = ((-score, i) for score, items in groups for i in items if i not in biased_set)
+
+        return RankedResults(index, map(itemgetter(1), heapq.merge(unbiased, biased)), count)
+
+    def match(self, index: SearchIndex[T], query: str) -> tuple[Groups, dict[int, float]]:
+        if (cached := self._queries.get(query)) is not None:
+            self._queries.move_to_end(query)
+            return cached
+
+        # anything matching the query also matches any part of it, start from the narrowest known one
+        candidates: Iterable[int] | None = None
+        for previous, (_, previous_scores) in self._queries.items():
+            if previous in query and (candidates is None or len(previous_scores) < len(candidates)):
+                candidates = previous_scores
+
+        if candidates is not None and len(candidates) <= SCAN_LIMIT:
+            items = sorted(candidates)
+        else:
+            items = index.find(query)
+
+        scores = {i: score for i in items if (score := index.score(query, i)) is not None}
+        result = (group_by_score(scores), scores)
+
+        self._queries[query] = result
+        if len(self._queries) > QUERY_CACHE_SIZE:
+            self._queries.popitem(last=False)
+
+        return result
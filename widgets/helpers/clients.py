@@ -2,9 +2,12 @@ import gi
 from os import name
 from loguru import logger
 
-from fabric.utils import get_desktop_applications, DesktopApp
+from fabric.utils import DesktopApp
 from fabric.core import Service, Signal, Property
 
+from widgets.helpers.app_matcher import AppMatcher
+from widgets.helpers.desktop_entries import get_desktop_entries
+
 gi.require_version("Glace", "0.1")
 from gi.repository import Glace  # noqa: E402
 
@@ -37,6 +40,8 @@ class ClientsService(Service):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+        self.desktop_entries = get_desktop_entries()
+        self.desktop_entries.connect("changed", lambda *_: self.build_app_identifiers())
         self.build_app_identifiers()
         self._clients: list[Client] = []
 
@@ -111,20 +116,9 @@ class ClientsService(Service):
         self.client_removed(matches[0]._client)
 
     def build_app_identifiers(self):
-        self.identifiers: dict[str, DesktopApp] = {}
-        for app in get_desktop_applications():
-            if app.name:
-                self.identifiers[app.name.lower()] = app
-            if app.display_name:
-                self.identifiers[app.display_name.lower()] = app
-            if app.window_class:
-                self.identifiers[app.window_class.lower()] = app
-            if app.executable:
-                self.identifiers[app.executable.split("/")[-1].lower()] = app
-            if app.command_line:
-                self.identifiers[app.command_line.split()[0].split("/")[-1].lower()] = (
-                    app
-                )
+        # a fresh matcher also drops everything the previous one memoized
+        self.matcher = AppMatcher(self.desktop_entries.apps)
+        self.identifiers: dict[str, DesktopApp] = self.matcher.identifiers
 
     # def find_app(self, app_identifier):
     #     if isinstance(app_identifier, dict):
@@ -143,22 +137,10 @@ class ClientsService(Service):
     #     return self.find_app_by_key(app_identifier)
 
     def find_app(self, app: Glace.Client):
-        for identifier in self.get_app_identifiers(app):
-            if app := self.find_app_by_identifier(identifier):
-                return app
-        else:
-            return None
+        return self.matcher.find_first(self.get_app_identifiers(app))
 
     def find_app_by_identifier(self, identifier) -> DesktopApp | None:
-        identifier = identifier.lower()
-
-        if identifier in self.identifiers:
-            return self.identifiers[identifier]
-
-        for app in self.identifiers.keys():
-            if identifier in app:
-                return self.identifiers[app]
-        return None
+        return self.matcher.find(identifier)
 
 
 service: ClientsService | None = None
@@ -0,0 +1,361 @@
+import os
+import json
+import gi
+from collections.abc import Callable
+from loguru import logger
+from config import configuration
+from widgets.helpers.icon_cache import IconRequest, get_icon_cache
+
+from fabric.core import Service, Signal, Property
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gio, GLib, Gtk, GdkPixbuf  # noqa: E402
+
+CACHE_VERSION = 1
+CACHE_FILE_NAME = "desktop_entries.json"
+RESCAN_DELAY = 250  # ms
+
+
+def get_application_dirs() -> list[str]:
+    """
+    The XDG application directories, in the order they take precedence.
+    """
+    dirs: list[str] = []
+    for data_dir in [GLib.get_user_data_dir(), *GLib.get_system_data_dirs()]:
+        if (directory := os.path.join(data_dir, "applications")) not in dirs:
+            dirs.append(directory)
+
+    return dirs
+
+
+def parse_desktop_entry(path: str) -> dict | None:
+    """
+    The fields of a desktop file, or None if it doesn't describe a usable app
+    (e.g. `Hidden=true`, which also masks entries with the same id in later dirs).
+    """
+    try:
+        app = Gio.DesktopAppInfo.new_from_filename(path)
+    except (GLib.Error, TypeError):
+        app = None
+    if not app:
+        return None
+
+    icon = app.get_icon()
+    return {
+        "name": app.get_name(),
+        "generic_name": app.get_generic_name(),
+        "display_name": app.get_display_name(),
+        "description": app.get_description(),
+        "window_class": app.get_startup_wm_class(),
+        "executable": app.get_executable(),
+        "command_line": app.get_commandline(),
+        "icon_name": icon.to_string() if icon else None,
+        "should_show": app.should_show(),
+    }
+
+
+class CachedDesktopApp:
+    """
+    A desktop app as read from the catalogue, with the same attributes as fabric's
+    `DesktopApp`. The `Gio.DesktopAppInfo` behind it is only loaded when needed
+    (i.e. to launch the app), everything else comes from the cache.
+    """
+
+    def __init__(self, path: str, desktop_id: str, fields: dict):
+        self.path = path
+        self.desktop_id = desktop_id
+        self._info: Gio.DesktopAppInfo | None = None
+
+        self.name: str = fields["name"]
+        self.generic_name: str | None = fields["generic_name"]
+        self.display_name: str | None = fields["display_name"]
+        self.description: str | None = fields["description"]
+        self.window_class: str | None = fields["window_class"]
+        self.executable: str | None = fields["executable"]
+        self.command_line: str | None = fields["command_line"]
+        self.icon_name: str | None = fields["icon_name"]
+        self.should_show: bool = fields["should_show"]
+
+    @property
+    def _app(self) -> Gio.DesktopAppInfo:
+        if not self._info:
+            self._info = Gio.DesktopAppInfo.new_from_filename(self.path)
+
+        return self._info
+
+    def launch(self, context: Gio.AppLaunchContext | None = None) -> bool:
+        return self._app.launch(None, context)
+
+    def get_icon_pixbuf(
+        self,
+        size: int = 48,
+        default_icon: str | None = "image-missing",
+        flags: Gtk.IconLookupFlags = Gtk.IconLookupFlags.FORCE_SIZE,
+        scale: int = 1,
+    ) -> GdkPixbuf.Pixbuf | None:
+        return get_icon_cache().load_icon(self.icon_name, size, scale, default_icon, flags)
+
+    def load_icon_async(
+        self,
+        size: int,
+        callback: Callable[[GdkPixbuf.Pixbuf | None], object],
+        default_icon: str | None = "image-missing",
+        flags: Gtk.IconLookupFlags = Gtk.IconLookupFlags.FORCE_SIZE,
+        scale: int = 1,
+        placeholder: bool = True,
+    ) -> IconRequest:
+        return get_icon_cache().load_icon_async(
+            self.icon_name, size, callback, scale, default_icon, flags, placeholder
+        )
+
+
+class DesktopEntries(Service):
+    """
+    A catalogue of the installed desktop apps.
+
+    Every desktop file is parsed once, and the result is persisted keyed by the
+    mtimes of the application directories and files, so a cold start only stats
+    them, and only re-parses what changed since. The directories are then watched,
+    and additions, changes and removals are applied as deltas (`changed` is
+    emitted after each).
+    """
+
+    @Signal
+    def changed(self): ...
+
+    @Property(list[CachedDesktopApp], "readable")
+    def apps(self) -> list[CachedDesktopApp]:
+        # a copy, callers sort it in place
+        return list(self._apps)
+
+    def __init__(self, cache_path: str | None = None, **kwargs):
+        super().__init__(**kwargs)
+
+        self.cache_path = cache_path or os.path.join(
+            configuration.get_property("desktop_entries_cache_dir"), CACHE_FILE_NAME
+        )
+        self.application_dirs = get_application_dirs()
+
+        # directory -> {"mtime", "files", "subdirs"}, file -> {"mtime", "entry"}
+        self._dirs: dict[str, dict] = {}
+        self._files: dict[str, dict] = {}
+        # parsed entries are kept across rescans, so unchanged apps stay the same objects
+        self._entries: dict[str, CachedDesktopApp] = {}
+        self._apps: list[CachedDesktopApp] = []
+
+        self._monitors: dict[str, Gio.FileMonitor] = {}
+        self._pending_dirs: set[str] = set()
+        self._rescan_source: int | None = None
+
+        cached_dirs, cached_files = self.load_cache()
+        dirty = False
+        for directory in self.application_dirs:
+            dirty = self.scan_dir(directory, cached_dirs, cached_files) or dirty
+        if dirty or cached_dirs.keys() != self._dirs.keys():
+            self.save_cache()
+
+        self.build_apps()
+        for directory in self.application_dirs:
+            self.watch_dir(directory)
+
+        logger.info(f"[DesktopEntries] Loaded {len(self._apps)} apps")
+
+    def get_app(self, desktop_id: str) -> CachedDesktopApp | None:
+        for app in self._apps:
+            if app.desktop_id == desktop_id:
+                return app
+        return None
+
+    # Scanning
+    def scan_dir(self, directory: str, cached_dirs: dict, cached_files: dict) -> bool:
+        """
+        (Re)scan a directory and its subdirectories against the given cache,
+        returns whether anything had to be parsed.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return self.forget_dir(directory)
+
+        dirty = False
+        if (cached := cached_dirs.get(directory)) and cached["mtime"] == mtime:
+            # nothing was added or removed, the files themselves might have changed though
+            files, subdirs = cached["files"], cached["subdirs"]
+        else:
+            dirty = True
+            files, subdirs = [], []
+            try:
+                with os.scandir(directory) as it:
+                    for item in sorted(it, key=lambda item: item.name):
+                        if item.is_dir():
+                            subdirs.append(item.name)
+                        elif item.name.endswith(".desktop"):
+                            files.append(item.name)
+            except OSError as e:
+                logger.warning(f"[DesktopEntries] Couldn't list {directory}: {e}")
+
+        # drop whatever disappeared since the last scan
+        if previous := self._dirs.get(directory):
+            for name in set(previous["files"]) - set(files):
+                self.forget_file(os.path.join(directory, name))
+            for name in set(previous["subdirs"]) - set(subdirs):
+                self.forget_dir(os.path.join(directory, name))
+
+        self._dirs[directory] = {"mtime": mtime, "files": files, "subdirs": subdirs}
+
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                file_mtime = os.stat(path).st_mtime
+            except OSError:
+                self.forget_file(path)
+                continue
+
+            if (cached_file := cached_files.get(path)) and cached_file["mtime"] == file_mtime:
+                self._files[path] = cached_file
+                continue
+
+            dirty = True
+            self._files[path] = {"mtime": file_mtime, "entry": parse_desktop_entry(path)}
+            self._entries.pop(path, None)
+
+        for name in subdirs:
+            dirty = self.scan_dir(os.path.join(directory, name), cached_dirs, cached_files) or dirty
+
+        return dirty
+
+    def forget_dir(self, directory: str) -> bool:
+        if not (previous := self._dirs.pop(directory, None)):
+            return False
+
+        for name in previous["files"]:
+            self.forget_file(os.path.join(directory, name))
+        for name in previous["subdirs"]:
+            self.forget_dir(os.path.join(directory, name))
+        if monitor := self._monitors.pop(directory, None):
+            monitor.cancel()
+
+        return True
+
+    def forget_file(self, path: str):
+        self._files.pop(path, None)
+        self._entries.pop(path, None)
+
+    def build_apps(self):
+        """
+        Resolve desktop ids, the first directory providing an id wins (and might hide it).
+        """
+        seen: set[str] = set()
+        apps: list[CachedDesktopApp] = []
+
+        def collect(directory: str, prefix: str):
+            if not (info := self._dirs.get(directory)):
+                return
+
+            for name in info["files"]:
+                desktop_id = prefix + name
+                path = os.path.join(directory, name)
+                if desktop_id in seen or not (file := self._files.get(path)):
+                    continue
+
+                seen.add(desktop_id)
+                if not (fields := file["entry"]) or not fields["should_show"]:
+                    continue
+
+                if not (entry := self._entries.get(path)):
+                    entry = self._entries[path] = CachedDesktopApp(path, desktop_id, fields)
+                apps.append(entry)
+
+            for name in info["subdirs"]:
+                collect(os.path.join(directory, name), f"{prefix}{name}-")
+
+        for directory in self.application_dirs:
+            collect(directory, "")
+
+        self._apps = apps
+
+    # Watching
+    def watch_dir(self, directory: str):
+        if directory not in self._monitors:
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None
+                )
+            except GLib.Error as e:
+                logger.warning(f"[DesktopEntries] Couldn't watch {directory}: {e.message}")
+                return
+
+            monitor.connect("changed", self.on_dir_changed, directory)
+            self._monitors[directory] = monitor
+
+        if info := self._dirs.get(directory):
+            for name in info["subdirs"]:
+                self.watch_dir(os.path.join(directory, name))
+
+    def on_dir_changed(self, _monitor, _file, _other_file, event_type, directory: str):
+        if event_type in (
+            Gio.FileMonitorEvent.ATTRIBUTE_CHANGED,
+            Gio.FileMonitorEvent.PRE_UNMOUNT,
+            Gio.FileMonitorEvent.CHANGED,
+        ):
+            # CHANGES_DONE_HINT follows once the file is fully written
+            return
+
+        self._pending_dirs.add(directory)
+        if self._rescan_source is None:
+            self._rescan_source = GLib.timeout_add(RESCAN_DELAY, self.rescan_pending)
+
+    def rescan_pending(self) -> bool:
+        self._rescan_source = None
+        pending, self._pending_dirs = self._pending_dirs, set()
+
+        # the current state is the cache, so only what actually changed gets parsed
+        dirty = False
+        for directory in pending:
+            dirty = self.scan_dir(directory, {}, dict(self._files)) or dirty
+            self.watch_dir(directory)
+
+        if dirty:
+            self.build_apps()
+            self.save_cache()
+            logger.info(f"[DesktopEntries] Desktop entries changed, {len(self._apps)} apps")
+            self.changed()
+
+        return False
+
+    # Persistence
+    def load_cache(self) -> tuple[dict, dict]:
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+            if cache.get("version") != CACHE_VERSION:
+                return {}, {}
+
+            return cache["dirs"], cache["files"]
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"[DesktopEntries] Ignoring invalid cache {self.cache_path}: {e}")
+            return {}, {}
+
+    def save_cache(self):
+        cache = {"version": CACHE_VERSION, "dirs": self._dirs, "files": self._files}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(cache, f, separators=(",", ":"))
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"[DesktopEntries] Couldn't write cache {self.cache_path}: {e}")
+
+
+service: DesktopEntries | None = None
+
+
+def get_desktop_entries() -> DesktopEntries:
+    global service
+    if not service:
+        service = DesktopEntries()
+
+    return service
@@ -0,0 +1,60 @@
+import threading
+from typing import Any, Generic, TypeVar
+from collections.abc import Callable, Hashable
+
+from loguru import logger
+from gi.repository import GLib
+
+T = TypeVar("T")
+
+FRAME_TIME = 16  # ms
+
+
+class EventBatcher(Generic[T]):
+    """
+    Collects events pushed from any thread and hands everything that arrived within
+    one frame to `flush_callback` on the main loop, as a single ordered batch.
+
+    Events pushed with a `key` are collapsed "latest wins": a newer event with the
+    same key replaces the queued one and moves to its position in the batch.
+    """
+
+    def __init__(
+        self,
+        flush_callback: Callable[[list[T]], Any],
+        frame_time: int = FRAME_TIME,
+    ):
+        self.flush_callback = flush_callback
+        self.frame_time = frame_time
+
+        self._lock = threading.Lock()
+        self._events: list[T | None] = []
+        self._keys: dict[Hashable, int] = {}
+        self._flush_source: int | None = None
+
+    def push(self, event: T, key: Hashable | None = None):
+        with self._lock:
+            if key is not None:
+                if (index := self._keys.get(key)) is not None:
+                    self._events[index] = None
+                self._keys[key] = len(self._events)
+
+            self._events.append(event)
+
+            if self._flush_source is None:
+                self._flush_source = GLib.timeout_add(self.frame_time, self.flush)
+
+    def flush(self) -> bool:
+        with self._lock:
+            events = [event for event in self._events if event is not None]
+            self._events = []
+            self._keys = {}
+            self._flush_source = None
+
+        if events:
+            try:
+                self.flush_callback(events)
+            except Exception as e:
+                logger.error(f"[EventBatcher] Error while flushing events: {e}")
+
+        return False
@@ -0,0 +1,487 @@
+import json
+import threading
+from collections.abc import Iterable, Iterator
+from loguru import logger
+
+from fabric import Service
+from fabric.core import Signal, Property
+from fabric.hyprland.widgets import get_hyprland_connection
+from fabric.hyprland.service import HyprlandEvent
+from fabric.utils.helpers import bulk_connect, idle_add
+from gi.repository import GLib
+
+from widgets.helpers.event_batcher import EventBatcher
+from widgets.helpers.spatial_index import SpatialGrid, Rect, rects_intersect
+
+RESYNC_DELAY = 0.05  # seconds
+DRIFT_RESYNC_INTERVAL = 30  # seconds
+# the fullscreen event doesn't say which mode, it's looked up with the next resync
+FULLSCREEN_UNKNOWN = -1
+
+
+def normalize_address(address: str) -> str:
+    # events carry addresses without the 0x prefix hyprctl uses
+    return address if address.startswith("0x") else f"0x{address}"
+
+
+def get_client_rect(client: dict) -> Rect:
+    return client["at"][0], client["at"][1], client["size"][0], client["size"][1]
+
+
+def get_shown_workspace_ids(monitor: dict) -> list[int]:
+    shown = [monitor["activeWorkspace"]["id"]]
+    if special_id := monitor.get("specialWorkspace", {}).get("id", 0):
+        shown.append(special_id)
+
+    return shown
+
+
+class HyprlandClients(Service):
+    """
+    An in-memory table of hyprland's clients, keyed by address.
+
+    It is maintained from the event socket, so reading it never needs a hyprctl
+    round-trip. Events don't carry window geometry (tiled windows are resized by
+    their neighbours opening, closing and moving), they only mark it stale: the
+    next overlap query queues a full `j/clients` resync, as does a timer every
+    `DRIFT_RESYNC_INTERVAL` for whatever the events missed. Resyncs run in a
+    background thread, and requests made while one is queued are coalesced.
+    Visible clients are kept in a spatial index per workspace for overlap
+    queries, new clients only once their geometry is known. `changed` fires at
+    most once per frame, `layout-changed` only when something that decides what
+    is on screen where did (window geometry, visibility or the workspaces shown
+    on the monitors).
+    """
+
+    @Signal
+    def changed(self): ...
+
+    @Signal
+    def layout_changed(self): ...
+
+    @Property(dict[str, dict], "readable")
+    def clients(self) -> dict[str, dict]:
+        return self._clients
+
+    @Property(int, "readable", default_value=-1)
+    def active_workspace(self) -> int:
+        return self._active_workspace
+
+    @Property(str, "readable")
+    def active_address(self) -> str | None:
+        return self._active_address
+
+    @Property(dict[str, dict], "readable")
+    def monitors(self) -> dict[str, dict]:
+        return self._monitors
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.hyprland = get_hyprland_connection()
+
+        self._clients: dict[str, dict] = {}
+        self._active_workspace: int = -1
+        self._active_address: str | None = None
+        self._monitors: dict[str, dict] = {}
+        self._layout_dirty = False
+        self._layout_key: tuple = ()
+        # workspace names to ids, openwindow only mentions the name
+        self._workspace_ids: dict[str, int] = {}
+        # bumped by every event that can move windows, a resync started before is outdated
+        self._geometry_generation = 0
+        self._geometry_stale = False
+        # opened since the last resync, their geometry is unknown
+        self._unplaced: set[str] = set()
+
+        # visible clients by workspace id, and the workspace each client is indexed under
+        self._index: dict[int, SpatialGrid[str]] = {}
+        self._indexed_workspaces: dict[str, int] = {}
+        self._pinned: set[str] = set()
+
+        self._batcher: EventBatcher[HyprlandEvent] = EventBatcher(self.apply_events)
+        self._resync_requested = threading.Event()
+
+        bulk_connect(
+            self.hyprland,
+            {
+                f"event::{name}": self.queue_event
+                for name in (
+                    "openwindow",
+                    "closewindow",
+                    "movewindowv2",
+                    "changefloatingmode",
+                    "activewindowv2",
+                    "workspacev2",
+                    "focusedmonv2",
+                    "fullscreen",
+                    "pin",
+                    "windowtitlev2",
+                    "activespecial",
+                    "monitoraddedv2",
+                    "monitorremoved",
+                )
+            },
+        )
+
+        self.resync_thread = GLib.Thread.new(
+            "hyprland-clients-resync", self.resync_task, None
+        )
+        self.resync()
+        GLib.timeout_add_seconds(DRIFT_RESYNC_INTERVAL, self.on_drift_timeout)
+
+    def get_workspace_clients(self, workspace_id: int | None = None) -> list[dict]:
+        """
+        The visible clients on a workspace (the active one by default), pinned clients included.
+        """
+        if workspace_id is None:
+            workspace_id = self._active_workspace
+
+        addresses = set(self._index.get(workspace_id, ())) | self._pinned
+        # not in the spatial index yet, but there
+        addresses.update(
+            address
+            for address in self._unplaced
+            if self._clients[address]["workspace"]["id"] == workspace_id
+            and not self._clients[address]["hidden"]
+        )
+        return [self._clients[address] for address in addresses]
+
+    def get_clients_in_rect(
+        self,
+        rect: Rect,
+        workspace_ids: Iterable[int] | None = None,
+        monitor: dict | None = None,
+    ) -> list[dict]:
+        """
+        The visible clients intersecting `rect`, on the given workspaces (the
+        active one by default) or on what `monitor` shows, pinned clients included.
+        """
+        self.ensure_geometry()
+
+        found: dict[str, None] = {}
+        for grid in self.get_grids(workspace_ids, monitor):
+            found.update(dict.fromkeys(grid.query(rect)))
+        for address in self.get_pinned_in_rect(rect, monitor):
+            found[address] = None
+
+        return [self._clients[address] for address in found]
+
+    def any_client_in_rect(
+        self,
+        rect: Rect,
+        workspace_ids: Iterable[int] | None = None,
+        monitor: dict | None = None,
+    ) -> bool:
+        """
+        Like `get_clients_in_rect`, but stops at the first client found.
+        """
+        self.ensure_geometry()
+
+        return any(
+            grid.intersects(rect) for grid in self.get_grids(workspace_ids, monitor)
+        ) or any(True for _ in self.get_pinned_in_rect(rect, monitor))
+
+    def get_grids(
+        self, workspace_ids: Iterable[int] | None, monitor: dict | None
+    ) -> Iterator[SpatialGrid[str]]:
+        if monitor is not None:
+            workspace_ids = get_shown_workspace_ids(monitor)
+        elif workspace_ids is None:
+            workspace_ids = (self._active_workspace,)
+
+        for workspace_id in workspace_ids:
+            if grid := self._index.get(workspace_id):
+                yield grid
+
+    def get_pinned_in_rect(self, rect: Rect, monitor: dict | None) -> Iterator[str]:
+        # pinned windows follow the workspaces around, there are only ever a handful
+        for address in self._pinned - self._unplaced:
+            client = self._clients[address]
+            if (monitor is None or client.get("monitor") == monitor["id"]) and rects_intersect(
+                rect, get_client_rect(client)
+            ):
+                yield address
+
+    def index_client(self, client: dict):
+        address = client["address"]
+        workspace_id = client["workspace"]["id"]
+
+        if (indexed := self._indexed_workspaces.get(address)) is not None and (
+            indexed != workspace_id or client["hidden"]
+        ):
+            self.unindex_client(address)
+
+        if client["pinned"] and not client["hidden"]:
+            self._pinned.add(address)
+        else:
+            self._pinned.discard(address)
+
+        if client["hidden"] or address in self._unplaced:
+            return
+
+        self._index.setdefault(workspace_id, SpatialGrid()).insert(address, get_client_rect(client))
+        self._indexed_workspaces[address] = workspace_id
+
+    def unindex_client(self, address: str):
+        self._pinned.discard(address)
+        if (workspace_id := self._indexed_workspaces.pop(address, None)) is None:
+            return
+
+        grid = self._index[workspace_id]
+        grid.remove(address)
+        if not len(grid):
+            del self._index[workspace_id]
+
+    def resync(self):
+        """
+        Queue a full resync from hyprctl, requests made while one is queued are merged into it.
+        """
+        self._resync_requested.set()
+
+    def ensure_geometry(self):
+        # answers come from what's known, `layout-changed` follows if the resync moves anything
+        if self._geometry_stale:
+            self._geometry_stale = False
+            self.resync()
+
+    def mark_geometry_stale(self):
+        self._geometry_generation += 1
+        self._geometry_stale = True
+
+    def on_drift_timeout(self) -> bool:
+        self.resync()
+        return True
+
+    def resync_task(self, _) -> bool:
+        while True:
+            self._resync_requested.wait()
+            # let the rest of a burst land first
+            GLib.usleep(int(RESYNC_DELAY * 1_000_000))
+            self._resync_requested.clear()
+
+            generation = self._geometry_generation
+            try:
+                clients = json.loads(self.hyprland.send_command("j/clients").reply)
+                monitors = json.loads(self.hyprland.send_command("j/monitors").reply)
+            except Exception as e:
+                logger.error(f"[HyprlandClients] Failed to resync clients: {e}")
+                continue
+
+            idle_add(self.apply_snapshot, clients, monitors, generation)
+
+    def apply_snapshot(self, clients: list[dict], monitors: list[dict], generation: int):
+        fresh = {client["address"]: client for client in clients}
+
+        unplaced: set[str] = set()
+        if generation != self._geometry_generation:
+            # outdated by events since, windows opened meanwhile are kept until the next one
+            self.resync()
+            unplaced = {address for address in self._unplaced if address not in fresh}
+            fresh.update((address, self._clients[address]) for address in unplaced)
+        self._unplaced = unplaced
+
+        for address in self._clients.keys() - fresh.keys():
+            self.unindex_client(address)
+        # unchanged rects are left alone, only what moved is reindexed
+        for client in clients:
+            self.index_client(client)
+
+        self._clients = fresh
+        self._monitors = {monitor["name"]: monitor for monitor in monitors}
+        for monitor in monitors:
+            self._workspace_ids[monitor["activeWorkspace"]["name"]] = monitor["activeWorkspace"]["id"]
+            if monitor.get("focused"):
+                self._active_workspace = monitor["activeWorkspace"]["id"]
+        for client in clients:
+            self._workspace_ids[client["workspace"]["name"]] = client["workspace"]["id"]
+            if client.get("focusHistoryID") == 0:
+                self._active_address = client["address"]
+
+        # a resync mostly confirms what the events said already, only notify for actual changes
+        self._layout_dirty = True
+        self.notify_changed()
+
+    def notify_changed(self):
+        if self._layout_dirty:
+            self._layout_dirty = False
+            if (layout_key := self.get_layout_key()) != self._layout_key:
+                self._layout_key = layout_key
+                self.layout_changed()
+
+        self.changed()
+
+    def get_layout_key(self) -> tuple:
+        return (
+            tuple(
+                (
+                    address,
+                    *client["at"],
+                    *client["size"],
+                    client["workspace"]["id"],
+                    client["hidden"],
+                    client["pinned"],
+                    client["floating"],
+                    client["fullscreen"],
+                )
+                for address, client in self._clients.items()
+            ),
+            tuple(
+                (
+                    name,
+                    monitor["x"],
+                    monitor["y"],
+                    monitor["width"],
+                    monitor["height"],
+                    monitor["scale"],
+                    monitor["transform"],
+                    monitor["activeWorkspace"]["id"],
+                    monitor.get("specialWorkspace", {}).get("id", 0),
+                )
+                for name, monitor in self._monitors.items()
+            ),
+        )
+
+    def get_workspace_name(self, workspace_id: int) -> str:
+        # workspaces are named after their id unless renamed
+        return next(
+            (name for name, known_id in self._workspace_ids.items() if known_id == workspace_id),
+            str(workspace_id),
+        )
+
+    def queue_event(self, _, event: HyprlandEvent):
+        self._batcher.push(event)
+
+    def apply_events(self, events: list[HyprlandEvent]):
+        resync = False
+        for event in events:
+            try:
+                resync = self.apply_event(event) or resync
+            except (IndexError, ValueError) as e:
+                logger.warning(
+                    f"[HyprlandClients] Got invalid {event.name} event ({e}), raw data is\n{event.raw_data}"
+                )
+                resync = True
+
+        if resync:
+            self.resync()
+        self.notify_changed()
+
+    def apply_event(self, event: HyprlandEvent) -> bool:
+        """
+        Apply a single event to the table, returns whether it needs a resync right
+        away for what the event doesn't tell (a new monitor, a workspace or
+        fullscreen mode it doesn't name). Geometry is only marked stale.
+        """
+        data = event.data
+        # everything but focus and title changes moves things around on screen
+        self._layout_dirty = self._layout_dirty or event.name not in (
+            "activewindowv2",
+            "windowtitlev2",
+        )
+        if event.name in (
+            "openwindow",
+            "closewindow",
+            "movewindowv2",
+            "changefloatingmode",
+            "fullscreen",
+        ):
+            # tiled neighbours are resized too
+            self.mark_geometry_stale()
+
+        match event.name:
+            case "openwindow":
+                address = normalize_address(data[0])
+                workspace_name = data[1]
+                self._clients[address] = {
+                    "address": address,
+                    "mapped": True,
+                    "hidden": False,
+                    "at": [0, 0],
+                    "size": [0, 0],
+                    "workspace": {
+                        "id": self._workspace_ids.get(workspace_name, self._active_workspace),
+                        "name": workspace_name,
+                    },
+                    "floating": False,
+                    "pinned": False,
+                    "fullscreen": 0,
+                    "class": data[2],
+                    "title": ",".join(data[3:]),
+                }
+                self._unplaced.add(address)
+                self.index_client(self._clients[address])
+            case "closewindow":
+                address = normalize_address(data[0])
+                self._clients.pop(address, None)
+                self._unplaced.discard(address)
+                self.unindex_client(address)
+                if address == self._active_address:
+                    self._active_address = None
+            case "movewindowv2":
+                if client := self._clients.get(normalize_address(data[0])):
+                    client["workspace"] = {"id": int(data[1]), "name": data[2]}
+                    self.index_client(client)
+                self._workspace_ids[data[2]] = int(data[1])
+            case "changefloatingmode":
+                if client := self._clients.get(normalize_address(data[0])):
+                    client["floating"] = data[1] == "1"
+            case "activewindowv2":
+                self._active_address = normalize_address(data[0]) if data[0] else None
+            case "workspacev2":
+                self._active_workspace = int(data[0])
+                self._workspace_ids[data[1]] = int(data[0])
+                for monitor in self._monitors.values():
+                    if monitor.get("focused"):
+                        monitor["activeWorkspace"] = {"id": int(data[0]), "name": data[1]}
+            case "focusedmonv2":
+                self._active_workspace = int(data[1])
+                for name, monitor in self._monitors.items():
+                    monitor["focused"] = name == data[0]
+                    if name == data[0]:
+                        monitor["activeWorkspace"] = {
+                            "id": int(data[1]),
+                            "name": self.get_workspace_name(int(data[1])),
+                        }
+            case "activespecial":
+                if not (monitor := self._monitors.get(data[1])):
+                    return True
+                if not data[0]:
+                    monitor["specialWorkspace"] = {"id": 0, "name": ""}
+                elif (workspace_id := self._workspace_ids.get(data[0])) is not None:
+                    monitor["specialWorkspace"] = {"id": workspace_id, "name": data[0]}
+                else:
+                    return True
+            case "monitoraddedv2":
+                # rare, and the event doesn't carry its geometry
+                return True
+            case "monitorremoved":
+                self._monitors.pop(data[0], None)
+            case "fullscreen":
+                # the event only says whether the active window is fullscreen now, not in which mode
+                if client := self._clients.get(self._active_address):
+                    if data[0] != "1":
+                        client["fullscreen"] = 0
+                    elif not client["fullscreen"]:
+                        client["fullscreen"] = FULLSCREEN_UNKNOWN
+                        return True
+            case "pin":
+                if client := self._clients.get(normalize_address(data[0])):
+                    client["pinned"] = data[1] == "1"
+                    self.index_client(client)
+            case "windowtitlev2":
+                if client := self._clients.get(normalize_address(data[0])):
+                    client["title"] = ",".join(data[1:])
+
+        return False
+
+
+service: HyprlandClients | None = None
+
+
+def get_hyprland_clients_service() -> HyprlandClients:
+    global service
+    if not service:
+        service = HyprlandClients()
+
+    return service
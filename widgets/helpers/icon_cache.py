@@ -0,0 +1,406 @@
+import os
+import gi
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from loguru import logger
+from config import configuration
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gio, GLib, Gtk, GdkPixbuf  # noqa: E402
+
+DEFAULT_ICON = "image-missing"
+
+
+class IconRequest:
+    """
+    A pending asynchronous icon load, see `IconCache.load_icon_async`.
+    """
+
+    def __init__(
+        self,
+        cache: "IconCache",
+        names: list[str],
+        size: int,
+        scale: int,
+        flags: Gtk.IconLookupFlags,
+        callback: Callable[[GdkPixbuf.Pixbuf | None], object],
+    ):
+        self.cache = cache
+        # the icons to try, in order
+        self.names = names
+        self.size = size
+        self.scale = scale
+        self.flags = flags
+        self.callback = callback
+
+        self.load: "IconLoad | None" = None
+        self.cancelled = False
+
+    @property
+    def pending(self) -> bool:
+        return self.load is not None
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.cache.drop_request(self)
+
+
+class IconLoad:
+    """
+    The decoding of one icon, shared by every request waiting for it.
+    """
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.cancellable = Gio.Cancellable()
+        self.requests: list[IconRequest] = []
+
+
+class IconImage:
+    """
+    `set_image` for widgets showing their icon in `self.icon`, from a file path,
+    a pixbuf or an asynchronous loader (a `load_icon_async` call taking the
+    callback). The request of a loader is cancelled once the image is replaced.
+    """
+
+    icon: Gtk.Image
+    icon_request: IconRequest | None = None
+
+    def set_image(self, image):
+        self.cancel_image()
+
+        if isinstance(image, str):
+            self.icon.set_from_file(image)
+        elif callable(image):
+            # shows a placeholder until the icon is decoded
+            self.icon_request = image(self.icon.set_from_pixbuf)
+        else:
+            self.icon.set_from_pixbuf(image)
+
+    def cancel_image(self):
+        if self.icon_request:
+            self.icon_request.cancel()
+            self.icon_request = None
+
+
+class IconCache:
+    """
+    A process-wide cache of loaded (and scaled) pixbufs, keyed by icon name or
+    path, size and scale.
+
+    Entries are evicted least recently used first once their pixels take more
+    than `max_bytes`. Themed icons are dropped when the icon theme changes, and
+    hits and misses are counted (see `get_stats`). Pixbufs are shared between
+    every widget showing them, so they must not be modified in place. Like GTK,
+    it's only meant to be used from the main thread.
+
+    Icons can also be decoded asynchronously (`load_icon_async`), by GIO's
+    worker threads, so rasterizing SVGs doesn't block the main loop.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(configuration.get_property("icon_cache_size_mb") * 1024 * 1024)
+        )
+
+        self._entries: OrderedDict[Hashable, GdkPixbuf.Pixbuf | None] = OrderedDict()
+        self._bytes = 0
+        self._loads: dict[Hashable, IconLoad] = {}
+        self._placeholders: dict[int, GdkPixbuf.Pixbuf] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.icon_theme = Gtk.IconTheme.get_default()
+        self.icon_theme.connect("changed", lambda *_: self.invalidate_themed())
+
+    @staticmethod
+    def get_key(
+        name: str, size: int, scale: int, flags: Gtk.IconLookupFlags
+    ) -> Hashable:
+        if os.path.isabs(name):
+            return ("file", name, size, scale)
+        return ("theme", name, size, scale, int(flags))
+
+    # Loading
+    def lookup(
+        self, key: Hashable, loader: Callable[[], GdkPixbuf.Pixbuf | None]
+    ) -> GdkPixbuf.Pixbuf | None:
+        """
+        The pixbuf cached under `key`, loaded with `loader` if it isn't there yet.
+        Failed loads (None) are cached too, until the next theme change.
+        """
+        try:
+            pixbuf = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            pixbuf = loader()
+            self.store(key, pixbuf)
+            return pixbuf
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return pixbuf
+
+    def load_icon(
+        self,
+        icon: str | None,
+        size: int,
+        scale: int = 1,
+        default_icon: str | None = DEFAULT_ICON,
+        flags: Gtk.IconLookupFlags = Gtk.IconLookupFlags.FORCE_SIZE,
+    ) -> GdkPixbuf.Pixbuf | None:
+        """
+        An icon by theme name or file path, falling back to `default_icon`.
+        """
+        for name in (icon, default_icon):
+            if not name:
+                continue
+
+            if os.path.isabs(name):
+                pixbuf = self.load_file(name, size, scale)
+            else:
+                pixbuf = self.lookup(
+                    self.get_key(name, size, scale, flags),
+                    lambda: self._load_themed(name, size, scale, flags),
+                )
+
+            if pixbuf is not None:
+                return pixbuf
+
+        return None
+
+    def load_file(self, path: str, size: int, scale: int = 1) -> GdkPixbuf.Pixbuf | None:
+        def load():
+            try:
+                return GdkPixbuf.Pixbuf.new_from_file_at_scale(
+                    path, size * scale, size * scale, True
+                )
+            except GLib.Error as e:
+                logger.warning(f"[IconCache] Couldn't load {path}: {e.message}")
+                return None
+
+        return self.lookup(self.get_key(path, size, scale, Gtk.IconLookupFlags(0)), load)
+
+    def _load_themed(
+        self, name: str, size: int, scale: int, flags: Gtk.IconLookupFlags
+    ) -> GdkPixbuf.Pixbuf | None:
+        try:
+            return self.icon_theme.load_icon_for_scale(name, size, scale, flags)
+        except GLib.Error:
+            return None
+
+    # Asynchronous loading
+    def load_icon_async(
+        self,
+        icon: str | None,
+        size: int,
+        callback: Callable[[GdkPixbuf.Pixbuf | None], object],
+        scale: int = 1,
+        default_icon: str | None = DEFAULT_ICON,
+        flags: Gtk.IconLookupFlags = Gtk.IconLookupFlags.FORCE_SIZE,
+        placeholder: bool = True,
+    ) -> IconRequest:
+        """
+        Like `load_icon`, but `callback` is called right away only if the icon is
+        cached, otherwise with a transparent placeholder of the same size (unless
+        `placeholder` is False), then again with the icon once it's decoded. Cancel
+        the returned request when the icon isn't wanted anymore (i.e. the widget
+        shows something else).
+        """
+        request = IconRequest(
+            self, [name for name in (icon, default_icon) if name], size, scale, flags, callback
+        )
+        self.advance(request)
+
+        if placeholder and request.pending:
+            callback(self.get_placeholder(size * scale))
+
+        return request
+
+    def advance(self, request: IconRequest):
+        """
+        Deliver the first cached candidate of a request, or wait for its decoding.
+        """
+        while request.names:
+            name = request.names.pop(0)
+            key = self.get_key(name, request.size, request.scale, request.flags)
+
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                if (pixbuf := self._entries[key]) is not None:
+                    request.callback(pixbuf)
+                    return
+                continue
+
+            new = (load := self._loads.get(key)) is None
+            if new:
+                self.misses += 1
+                load = self._loads[key] = IconLoad(key)
+
+            request.load = load
+            load.requests.append(request)
+            if new:
+                self.start_load(load, name, request.size, request.scale, request.flags)
+            return
+
+        request.callback(None)
+
+    def drop_request(self, request: IconRequest):
+        if not (load := request.load):
+            return
+
+        request.load = None
+        load.requests.remove(request)
+        if not load.requests and self._loads.get(load.key) is load:
+            # nobody's waiting for it anymore
+            del self._loads[load.key]
+            load.cancellable.cancel()
+
+    def start_load(
+        self, load: IconLoad, name: str, size: int, scale: int, flags: Gtk.IconLookupFlags
+    ):
+        if os.path.isabs(name):
+            Gio.File.new_for_path(name).read_async(
+                GLib.PRIORITY_DEFAULT, load.cancellable, self.on_file_opened, load, size * scale
+            )
+            return
+
+        if not (info := self.icon_theme.lookup_icon_for_scale(name, size, scale, flags)):
+            self.finish_load(load, None)
+            return
+
+        info.load_icon_async(load.cancellable, self.on_icon_loaded, load)
+
+    def on_icon_loaded(self, info: Gtk.IconInfo, result: Gio.AsyncResult, load: IconLoad):
+        try:
+            pixbuf = info.load_icon_finish(result)
+        except GLib.Error as e:
+            if e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                return
+            pixbuf = None
+
+        self.finish_load(load, pixbuf)
+
+    def on_file_opened(self, file: Gio.File, result: Gio.AsyncResult, load: IconLoad, pixel_size: int):
+        try:
+            stream = file.read_finish(result)
+        except GLib.Error as e:
+            if not e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                logger.warning(f"[IconCache] Couldn't open {file.get_path()}: {e.message}")
+                self.finish_load(load, None)
+            return
+
+        GdkPixbuf.Pixbuf.new_from_stream_at_scale_async(
+            stream, pixel_size, pixel_size, True, load.cancellable, self.on_file_loaded, load
+        )
+
+    def on_file_loaded(self, stream: Gio.InputStream, result: Gio.AsyncResult, load: IconLoad):
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_stream_finish(result)
+        except GLib.Error as e:
+            if e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                return
+            logger.warning(f"[IconCache] Couldn't decode {load.key[1]}: {e.message}")
+            pixbuf = None
+        finally:
+            stream.close(None)
+
+        self.finish_load(load, pixbuf)
+
+    def finish_load(self, load: IconLoad, pixbuf: GdkPixbuf.Pixbuf | None):
+        if self._loads.get(load.key) is not load:
+            # cancelled, and maybe requested again since
+            return
+
+        del self._loads[load.key]
+        self.store(load.key, pixbuf)
+
+        # a callback can cancel (or request) icons, so the requests are detached first
+        requests, load.requests = load.requests, []
+        for request in requests:
+            request.load = None
+
+        for request in requests:
+            if request.cancelled:
+                continue
+            if pixbuf is not None:
+                request.callback(pixbuf)
+            else:
+                self.advance(request)
+
+    def get_placeholder(self, pixel_size: int) -> GdkPixbuf.Pixbuf:
+        if not (placeholder := self._placeholders.get(pixel_size)):
+            placeholder = GdkPixbuf.Pixbuf.new(
+                GdkPixbuf.Colorspace.RGB, True, 8, pixel_size, pixel_size
+            )
+            placeholder.fill(0)
+            self._placeholders[pixel_size] = placeholder
+
+        return placeholder
+
+    # Bookkeeping
+    @staticmethod
+    def get_pixbuf_bytes(pixbuf: GdkPixbuf.Pixbuf | None) -> int:
+        return pixbuf.get_byte_length() if pixbuf is not None else 0
+
+    def store(self, key: Hashable, pixbuf: GdkPixbuf.Pixbuf | None):
+        if key in self._entries:
+            self._bytes -= self.get_pixbuf_bytes(self._entries.pop(key))
+
+        size = self.get_pixbuf_bytes(pixbuf)
+        if size > self.max_bytes:
+            # it would evict everything else, and still not fit
+            return
+
+        self._entries[key] = pixbuf
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self.get_pixbuf_bytes(evicted)
+            self.evictions += 1
+
+    def invalidate_themed(self):
+        themed = [key for key in self._entries if key[0] == "theme"]
+        for key in themed:
+            self._bytes -= self.get_pixbuf_bytes(self._entries.pop(key))
+
+        logger.debug(f"[IconCache] Icon theme changed, dropped {len(themed)} icons")
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "loading": len(self._loads),
+            "hit_rate": self.hit_rate,
+        }
+
+
+cache: IconCache | None = None
+
+
+def get_icon_cache() -> IconCache:
+    global cache
+    if not cache:
+        cache = IconCache()
+
+    return cache
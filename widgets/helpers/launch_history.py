@@ -0,0 +1,78 @@
+import math
+import time
+from loguru import logger
+
+HISTORY_VERSION = 2
+BUCKET_SIZE = 60 * 60  # seconds
+MAX_BUCKETS = 64
+HALF_LIFE = 7 * 24 * 60 * 60  # seconds
+
+
+class LaunchHistory:
+    """
+    When each app was launched, as per-hour buckets of launch counts.
+
+    An app's frecency is the sum of its launches, each decayed exponentially
+    with its age (a launch counts half as much after `HALF_LIFE`). Only the
+    latest `MAX_BUCKETS` buckets of every app are kept, older ones are folded
+    into the oldest kept one.
+    """
+
+    def __init__(self, apps: dict[str, list[list[float]]] | None = None):
+        # app name -> [[bucket start, launches], ...], oldest first
+        self.apps: dict[str, list[list[float]]] = apps or {}
+        self.version = 0
+
+    @classmethod
+    def from_json(cls, data) -> "LaunchHistory":
+        if data is None:
+            return cls()
+
+        if isinstance(data, dict) and data.get("version") == HISTORY_VERSION:
+            return cls(data["apps"])
+
+        if isinstance(data, dict):
+            # the old format: a negative launch count per app, with no idea when, so they count as recent
+            bucket = cls.get_bucket(time.time())
+            return cls(
+                {
+                    name: [[bucket, -count]]
+                    for name, count in data.items()
+                    if isinstance(count, (int, float)) and count < 0
+                }
+            )
+
+        logger.warning(f"[LaunchHistory] Ignoring unknown history data: {data!r:.100}")
+        return cls()
+
+    def to_json(self) -> dict:
+        return {"version": HISTORY_VERSION, "apps": self.apps}
+
+    @staticmethod
+    def get_bucket(timestamp: float) -> float:
+        return timestamp - timestamp % BUCKET_SIZE
+
+    def record(self, name: str, timestamp: float | None = None):
+        bucket = self.get_bucket(time.time() if timestamp is None else timestamp)
+        buckets = self.apps.setdefault(name, [])
+
+        if buckets and buckets[-1][0] == bucket:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([bucket, 1])
+
+        if len(buckets) > MAX_BUCKETS:
+            oldest = buckets.pop(0)
+            buckets[0][1] += oldest[1]
+
+        self.version += 1
+
+    def frecency(self, name: str, now: float | None = None) -> float:
+        if not (buckets := self.apps.get(name)):
+            return 0
+
+        now = time.time() if now is None else now
+        return sum(
+            launches * math.exp2(-max(0, now - bucket) / HALF_LIFE)
+            for bucket, launches in buckets
+        )
@@ -1,6 +1,6 @@
 from .service import Niri, NiriEvent, NiriReply
+from .state import NiriState
 
 # Heavily modified versin of https://github.com/Fabric-Development/fabric/pull/118 TYSM🙏🙏
 
-__all__ = ["Niri", "NiriEvent", "NiriReply"]
-
+__all__ = ["Niri", "NiriEvent", "NiriReply", "NiriState"]
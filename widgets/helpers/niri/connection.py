@@ -0,0 +1,306 @@
+import json
+import time
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass
+from collections.abc import Callable
+
+from loguru import logger
+from gi.repository import Gio, GLib
+
+NIRI_COMMAND_TIMEOUT = 5  # seconds
+NIRI_RECONNECT_BACKOFF_MIN = 0.05  # seconds
+NIRI_RECONNECT_BACKOFF_MAX = 2  # seconds
+NIRI_PIPELINE_DEPTH = 8
+
+
+def encode_niri_command(command: str | dict) -> str:
+    # both plain requests ("Workspaces") and Action payloads are valid json on the wire
+    return json.dumps(command)
+
+
+@dataclass
+class NiriPendingRequest:
+    payload: str
+    callbacks: list[Callable[[dict | None], None]]
+    deadline: float
+    dedupe: bool = False
+
+
+class NiriSocket:
+    """
+    A single connection to the Niri IPC socket, used from the command thread only.
+    """
+
+    def __init__(self, socket_path: str):
+        client = Gio.SocketClient()
+        client.set_timeout(NIRI_COMMAND_TIMEOUT)
+
+        self.connection: Gio.SocketConnection = client.connect(
+            Gio.UnixSocketAddress.new(socket_path)
+        )
+        self.ostream = self.connection.get_output_stream()
+        self.istream = Gio.DataInputStream.new(self.connection.get_input_stream())
+
+        # how many replies this connection has already delivered
+        self.replies = 0
+        # whether it sat in the pool, in which case niri might have dropped it meanwhile
+        self.pooled = False
+
+    def write(self, payload: str):
+        self.ostream.write_all(f"{payload}\n".encode(), None)
+        self.ostream.flush(None)
+
+    def read(self) -> str | None:
+        return self.istream.read_line_utf8(None)[0]
+
+    def close(self):
+        try:
+            self.connection.close(None)
+        except GLib.Error:
+            pass
+
+
+class NiriCommandConnection:
+    """
+    A long-lived command channel to the Niri IPC socket.
+
+    Requests are queued and handled by a dedicated thread which keeps its
+    connections around across requests, so no request pays for a connect/accept
+    round-trip. Up to `NIRI_PIPELINE_DEPTH` queued requests are written before
+    their replies are read, over one connection if niri keeps it open, otherwise
+    over the `spare_connections` sockets the channel keeps pre-connected.
+    Identical queries (e.g. two "Workspaces" requests) share a single request
+    while it is in flight. While a reconnect is in flight (e.g. niri is
+    restarting) requests stay queued until they are sent or their timeout runs out.
+    """
+
+    def __init__(self, socket_path: str, spare_connections: int = 2):
+        self.socket_path = socket_path
+        self.spare_connections = spare_connections
+        # assume niri keeps the connection open until it proves otherwise
+        self.reusable = True
+
+        self._requests: queue.Queue[NiriPendingRequest] = queue.Queue()
+        self._in_flight: dict[str, NiriPendingRequest] = {}
+        self._in_flight_lock = threading.Lock()
+        self._pool: deque[NiriSocket] = deque()
+        self._backoff = NIRI_RECONNECT_BACKOFF_MIN
+
+        self.command_thread = GLib.Thread.new(
+            "niri-command-thread", self.command_task, None
+        )
+
+    def submit(
+        self,
+        command: str | dict,
+        callback: Callable[[dict | None], None],
+        timeout: float = NIRI_COMMAND_TIMEOUT,
+    ) -> None:
+        """
+        Queue a command, `callback` is called from the command thread with the
+        decoded reply, or with None if the command couldn't be delivered in time.
+        Plain queries are deduplicated against identical ones still in flight,
+        Actions never are since each of them has side effects.
+        """
+        payload = encode_niri_command(command)
+        dedupe = isinstance(command, str)
+
+        with self._in_flight_lock:
+            if dedupe and (pending := self._in_flight.get(payload)):
+                pending.callbacks.append(callback)
+                return
+
+            request = NiriPendingRequest(
+                payload=payload,
+                callbacks=[callback],
+                deadline=time.monotonic() + timeout,
+                dedupe=dedupe,
+            )
+            if dedupe:
+                self._in_flight[payload] = request
+
+        self._requests.put(request)
+
+    def request(
+        self, command: str | dict, timeout: float = NIRI_COMMAND_TIMEOUT
+    ) -> dict | None:
+        """
+        Send a command and block until its reply arrives.
+        """
+        done = threading.Event()
+        replies: list[dict | None] = []
+
+        def on_reply(reply: dict | None):
+            replies.append(reply)
+            done.set()
+
+        self.submit(command, on_reply, timeout)
+        if not done.wait(timeout):
+            return None
+
+        return replies[0]
+
+    def command_task(self, _) -> bool:
+        while True:
+            try:
+                batch = [self._requests.get(timeout=1)]
+            except queue.Empty:
+                self.fill_pool()
+                continue
+
+            while len(batch) < NIRI_PIPELINE_DEPTH:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            while batch:
+                batch = self.send_batch(batch)
+
+            if self._requests.empty():
+                self.fill_pool()
+
+    def send_batch(self, batch: list[NiriPendingRequest]) -> list[NiriPendingRequest]:
+        """
+        Pipeline a batch of requests, returns the ones that have to be retried.
+        """
+        now = time.monotonic()
+        for request in batch:
+            if now > request.deadline:
+                logger.warning(
+                    f"[NiriService] Dropping command {request.payload}, couldn't reach niri in time"
+                )
+                self.deliver(request, None)
+        batch = [request for request in batch if now <= request.deadline]
+        if not batch:
+            return []
+
+        # pair every request with the connection it is sent over
+        assignments: list[tuple[NiriSocket, NiriPendingRequest]] = []
+        try:
+            if self.reusable:
+                sock = self.acquire()
+                assignments = [(sock, request) for request in batch]
+            else:
+                for request in batch:
+                    assignments.append((self.acquire(), request))
+        except GLib.Error as e:
+            for sock in {sock for sock, _ in assignments}:
+                sock.close()
+            logger.warning(f"[NiriService] Failed to connect to niri: {e.message}")
+            self.wait_backoff()
+            return batch
+
+        retry: list[NiriPendingRequest] = []
+        broken: set[NiriSocket] = set()
+        backoff = False
+
+        def fail(sock: NiriSocket, request: NiriPendingRequest):
+            nonlocal backoff
+            retry.append(request)
+            if sock not in broken:
+                broken.add(sock)
+                sock.close()
+                backoff = backoff or not sock.pooled
+
+        written: list[tuple[NiriSocket, NiriPendingRequest]] = []
+        for sock, request in assignments:
+            if sock in broken:
+                retry.append(request)
+                continue
+
+            try:
+                sock.write(request.payload)
+                written.append((sock, request))
+            except GLib.Error as e:
+                logger.debug(f"[NiriService] Command connection error: {e.message}")
+                fail(sock, request)
+
+        for sock, request in written:
+            if sock in broken:
+                retry.append(request)
+                continue
+
+            try:
+                raw = sock.read()
+            except GLib.Error as e:
+                logger.debug(f"[NiriService] Command connection error: {e.message}")
+                fail(sock, request)
+                continue
+
+            if raw is None:
+                if sock.replies > 0 and self.reusable:
+                    logger.debug(
+                        "[NiriService] Niri closes command connections after each reply, keeping spare connections instead"
+                    )
+                    self.reusable = False
+                    # not a connection problem, don't back off for it
+                    sock.pooled = True
+                fail(sock, request)
+                continue
+
+            try:
+                reply = json.loads(raw)
+            except json.JSONDecodeError as e:
+                logger.error(f"[NiriService] Invalid reply for {request.payload}: {e}")
+                reply = None
+
+            sock.replies += 1
+            self.deliver(request, reply)
+
+        for sock in {sock for sock, _ in assignments} - broken:
+            self.release(sock)
+
+        if backoff:
+            self.wait_backoff()
+        elif len(retry) < len(batch):
+            self._backoff = NIRI_RECONNECT_BACKOFF_MIN
+
+        # keep the original order for the retried requests
+        return [request for request in batch if request in retry]
+
+    def deliver(self, request: NiriPendingRequest, reply: dict | None):
+        if request.dedupe:
+            with self._in_flight_lock:
+                if self._in_flight.get(request.payload) is request:
+                    self._in_flight.pop(request.payload)
+
+        for callback in request.callbacks:
+            try:
+                callback(reply)
+            except Exception as e:
+                logger.error(f"[NiriService] Command callback error: {e}")
+
+    def acquire(self) -> NiriSocket:
+        if self._pool:
+            return self._pool.popleft()
+
+        return NiriSocket(self.socket_path)
+
+    def release(self, sock: NiriSocket):
+        if self.reusable:
+            sock.pooled = True
+            self._pool.append(sock)
+        else:
+            sock.close()
+
+    def fill_pool(self):
+        target = 1 if self.reusable else self.spare_connections
+        while len(self._pool) < target:
+            try:
+                sock = NiriSocket(self.socket_path)
+            except GLib.Error:
+                return
+
+            sock.pooled = True
+            self._pool.append(sock)
+
+    def wait_backoff(self):
+        for sock in self._pool:
+            sock.close()
+        self._pool.clear()
+
+        time.sleep(self._backoff)
+        self._backoff = min(self._backoff * 2, NIRI_RECONNECT_BACKOFF_MAX)
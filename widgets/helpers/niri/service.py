@@ -1,16 +1,34 @@
 import os
 import json
+import time
 from dataclasses import dataclass
+from concurrent.futures import Future
 from typing import Callable, Any, ParamSpec, Concatenate
 
 from loguru import logger
-from gi.repository import Gio, GLib
+from gi.repository import Gio, GLib, GObject
 
 from fabric.core.service import Service, Signal, Property
 from fabric.utils.helpers import idle_add
 
+from widgets.helpers.event_batcher import EventBatcher
+from widgets.helpers.niri.connection import (
+    NiriCommandConnection,
+    NIRI_RECONNECT_BACKOFF_MIN,
+    NIRI_RECONNECT_BACKOFF_MAX,
+)
+
 P = ParamSpec("P")
-NIRI_COMMAND_BUFFER_SIZE = 1_048_576  # 1MB
+
+# events that carry a full snapshot (or an absolute value), only the latest one in a frame matters
+NIRI_LATEST_WINS_EVENTS = {
+    "WorkspacesChanged",
+    "WindowsChanged",
+    "WindowFocusChanged",
+    "KeyboardLayoutsChanged",
+    "KeyboardLayoutSwitched",
+    "OverviewOpenedOrClosed",
+}
 
 # Exceptions
 class NiriError(Exception): ...
@@ -29,6 +47,19 @@ class NiriEvent:
     data: dict
     raw: str
 
+command_connection: NiriCommandConnection | None = None
+
+def get_command_connection() -> NiriCommandConnection:
+    global command_connection
+    if not command_connection:
+        socket_path = os.getenv("NIRI_SOCKET")
+        if not socket_path or not os.path.exists(socket_path):
+            raise NiriSocketNotFoundError("NIRI_SOCKET not found or invalid.")
+
+        command_connection = NiriCommandConnection(socket_path)
+
+    return command_connection
+
 # Niri Service
 class Niri(Service):
     """
@@ -46,14 +77,34 @@ class Niri(Service):
     @Signal("event", flags="detailed")
     def event(self, event: object): ...
 
+    @Signal
+    def events_flushed(self): ...
+
+    @Property(bool, "readable", "is-connected", default_value=False)
+    def connected(self) -> bool:
+        return self._connected_notified
+
+    @Signal
+    def connection_changed(self, connected: bool): ...
+
     def __init__(self, commands_only: bool = False, **kwargs):
         super().__init__(**kwargs)
         self._ready = False
+        self._event_signal_id = GObject.signal_lookup("event", self.__gtype__)
+        self._event_quarks: dict[str, int] = {}
+        self._event_batcher: EventBatcher[NiriEvent] = EventBatcher(self.dispatch_events)
+        self.dispatching_events = False
+        # _connected is tracked by the event thread, _connected_notified by the main loop
+        self._connected = False
+        self._connected_notified = False
 
         self.socket_path = os.getenv("NIRI_SOCKET")
         if not self.socket_path or not os.path.exists(self.socket_path):
             raise NiriSocketNotFoundError("NIRI_SOCKET not found or invalid.")
 
+        # start the command channel right away so the first request finds it connected
+        get_command_connection()
+
         if not commands_only:
             self.event_socket_thread = GLib.Thread.new(
                 "niri-event-thread", self.event_socket_task, None
@@ -67,104 +118,156 @@ class Niri(Service):
         """
         Send a command (e.g. "Workspaces") to the Niri IPC socket.
         """
-        response = {}
-        try:
-            client = Gio.SocketClient()
-            address = Gio.UnixSocketAddress.new(os.getenv("NIRI_SOCKET"))
-            conn: Gio.SocketConnection = client.connect(address)
-            ostream = conn.get_output_stream()
-            istream = Gio.DataInputStream.new(conn.get_input_stream())
-
-            if isinstance(command, dict):
-                ostream.write((json.dumps(command) + "\n").encode())
-            else:
-                ostream.write((f'"{command}"\n').encode())
-                # ostream.write((f'"{command}"\n'))
-            ostream.flush()
-
-            raw_data = istream.read_line_utf8(None)[0]
-            response = json.loads(raw_data)
-        except Exception as e:
-            logger.error(f"[NiriService] Failed to send command '{command}': {e}")
+        response = get_command_connection().request(command)
+        if response is None:
+            logger.error(f"[NiriService] Failed to send command '{command}'")
             return NiriReply(command=command, reply={}, is_ok=False)
 
         return NiriReply(command=command, reply=response, is_ok="Ok" in response)
 
     @staticmethod
     def send_command_async(
-        command: str,
-        callback: Callable[Concatenate[NiriReply, P], Any],
+        command: str | dict,
+        callback: Callable[Concatenate[NiriReply, P], Any] | None = None,
         *args: P.args,
         **kwargs: P.kwargs,
-    ) -> None:
-        client = Gio.SocketClient()
-        address = Gio.UnixSocketAddress.new(os.getenv("NIRI_SOCKET"))
+    ) -> Future[NiriReply]:
+        """
+        Send a command without blocking, `callback` (if any) is called on the main loop
+        with the reply. Identical queries that are already in flight are only sent once.
+        """
+        future: Future[NiriReply] = Future()
 
-        def reader_callback(istream: Gio.DataInputStream, res: Gio.AsyncResult, *_):
-            try:
-                # raw = istream.read_line_finish_utf8(res)[0].decode()
-                raw = istream.read_line_finish_utf8(res)[0]
-                data = json.loads(raw)
-                reply = NiriReply(command=command, reply=data, is_ok="Ok" in data)
-            except Exception as e:
-                logger.error(f"[NiriService] Async command error: {e}")
+        def on_reply(response: dict | None):
+            if response is None:
+                logger.error(f"[NiriService] Failed to send command '{command}'")
                 reply = NiriReply(command=command, reply={}, is_ok=False)
+            else:
+                reply = NiriReply(command=command, reply=response, is_ok="Ok" in response)
 
-            callback(reply, *args, **kwargs)
+            future.set_result(reply)
+            if callback:
+                idle_add(lambda: callback(reply, *args, **kwargs) and False)
 
-        def connect_callback(client: Gio.SocketClient, res: Gio.AsyncResult, *_):
-            try:
-                conn: Gio.SocketConnection = client.connect_finish(res)
-                ostream = conn.get_output_stream()
-                istream = Gio.DataInputStream.new(conn.get_input_stream())
-
-                ostream.write_async(
-                    f'"{command}"\n'.encode(),
-                    NIRI_COMMAND_BUFFER_SIZE,
-                    None, None, None, None
-                )
-                ostream.flush_async(1, None, None, None)
-                istream.read_line_async(1, None, reader_callback, conn)
-            except Exception as e:
-                logger.error(f"[NiriService] Async connect error: {e}")
+        get_command_connection().submit(command, on_reply)
+        return future
 
-        client.connect_async(address, None, connect_callback, None)
+    def dispatch_events(self, events: list[NiriEvent]):
+        """
+        Emit a frame's worth of events, followed by a single `events-flushed`.
+        """
+        self.dispatching_events = True
+        try:
+            for event in events:
+                self.emit(f"event::{event.name}", event)
+        finally:
+            self.dispatching_events = False
+
+        self.events_flushed()
+
+    def has_event_listeners(self, event_name: str) -> bool:
+        """
+        Whether anything is connected to `event::<event_name>`, events no one listens to
+        are dropped in the event thread without being decoded.
+        """
+        if not (quark := self._event_quarks.get(event_name)):
+            quark = self._event_quarks[event_name] = GLib.quark_from_string(event_name)
+
+        return GObject.signal_has_handler_pending(
+            self, self._event_signal_id, quark, False
+        )
 
     def event_socket_task(self, _) -> bool:
         """
-        Listens for events using Niri's 'EventStream' mechanism.
+        Listens for events using Niri's 'EventStream' mechanism, reconnecting with an
+        exponential backoff whenever the stream drops.
         """
-        try:
-            client = Gio.SocketClient()
-            address = Gio.UnixSocketAddress.new(self.socket_path)
-            conn: Gio.SocketConnection = client.connect(address)
-            ostream = conn.get_output_stream()
-            istream = Gio.DataInputStream.new(conn.get_input_stream())
+        backoff = NIRI_RECONNECT_BACKOFF_MIN
+        while True:
+            try:
+                self.read_event_stream()
+                logger.warning("[NiriService] Event stream closed by niri")
+            except Exception as e:
+                logger.error(f"[NiriService] Event socket error: {e}")
+
+            if self._connected:
+                # it was up for a while, start over with the shortest delay
+                self._connected = False
+                backoff = NIRI_RECONNECT_BACKOFF_MIN
+                idle_add(self.set_connected, False)
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, NIRI_RECONNECT_BACKOFF_MAX)
 
+    def read_event_stream(self):
+        client = Gio.SocketClient()
+        address = Gio.UnixSocketAddress.new(self.socket_path)
+        conn: Gio.SocketConnection = client.connect(address)
+        ostream = conn.get_output_stream()
+        istream = Gio.DataInputStream.new(conn.get_input_stream())
+
+        try:
             # Tell Niri to start streaming events
-            ostream.write((f'"EventStream"\n').encode())
-            ostream.flush()
+            ostream.write_all(b'"EventStream"\n', None)
+            ostream.flush(None)
 
-            while not ostream.is_closed():
-                raw = istream.read_line_utf8(None)
-                if raw is None or raw[0] is None:
-                    continue
+            raw_str = istream.read_line_utf8(None)[0]
+            if raw_str is None:
+                return
+            if "Ok" not in json.loads(raw_str):
+                raise NiriError(f"Niri refused the event stream: {raw_str}")
+
+            # niri starts every stream with a full snapshot, which doubles as the resync after a reconnect
+            self._connected = True
+            idle_add(self.set_connected, True)
+
+            while True:
+                raw_str = istream.read_line_utf8(None)[0]
+                if raw_str is None:
+                    # EOF, niri went away
+                    return
 
                 try:
-                    raw_str = raw[0]
+                    # every event is an object with a single key, peek at it before parsing anything
+                    event_name = raw_str[2 : raw_str.find('"', 2)]
+                    if not self.has_event_listeners(event_name):
+                        continue
+
                     event_data = json.loads(raw_str)
-                    event_name = next(iter(event_data))
                     event_obj = NiriEvent(name=event_name, data=event_data[event_name], raw=raw_str)
 
                     # logger.debug(f"Emitting event: {event_name} with data: {event_data}")
                     # logger.debug(f"Event Object: {event_obj}")
 
-                    # idle_add(self.emit, f"event::{event_name}", event_obj)
-                    idle_add(self.emit, f"event::{event_name}", event_obj)
+                    self._event_batcher.push(
+                        event_obj,
+                        event_name if event_name in NIRI_LATEST_WINS_EVENTS else None,
+                    )
                 except Exception as e:
                     logger.error(f"[NiriService] Event parse error: {e}")
-        except Exception as e:
-            logger.error(f"[NiriService] Event socket error: {e}")
+        finally:
+            try:
+                conn.close(None)
+            except GLib.Error:
+                pass
+
+    def set_connected(self, connected: bool):
+        if self._connected_notified == connected:
+            return
+
+        self._connected_notified = connected
+        logger.info(
+            f"[NiriService] Event stream {'connected' if connected else 'disconnected'}"
+        )
+        self.notify("connected")
+        self.connection_changed(connected)
+
+
+connection: Niri | None = None
 
-        return False
+def get_niri_connection() -> Niri:
+    global connection
+    if not connection:
+        connection = Niri()
 
+    return connection
@@ -0,0 +1,361 @@
+from loguru import logger
+from typing import Any
+from collections.abc import Callable, Hashable, Iterable
+
+from fabric.core.service import Service, Signal, Property
+from fabric.utils.helpers import bulk_connect
+
+from widgets.helpers.niri.service import Niri, NiriEvent, NiriReply, get_niri_connection
+
+
+class NiriState(Service):
+    """
+    An in-memory mirror of niri's workspaces, windows, outputs and keyboard layouts.
+
+    The state is seeded once (asynchronously, widgets re-render on the *-changed
+    signals once it lands), and then kept current purely from the EventStream,
+    so reading it never needs an IPC round-trip. What events changed while a seed
+    was in flight is newer than its reply, and kept. Events are delivered in
+    per-frame batches, and each *-changed signal fires at most once per batch.
+    """
+
+    @Signal
+    def workspaces_changed(self): ...
+
+    @Signal
+    def windows_changed(self): ...
+
+    @Signal
+    def outputs_changed(self): ...
+
+    @Signal
+    def keyboard_layouts_changed(self): ...
+
+    @Property(list[dict], "readable")
+    def workspaces(self) -> list[dict]:
+        return sorted(self._workspaces.values(), key=lambda ws: (ws["output"] or "", ws["idx"]))
+
+    @Property(list[dict], "readable")
+    def windows(self) -> list[dict]:
+        # empty until `watch_windows` is called
+        return list(self._windows.values())
+
+    @Property(dict[str, dict], "readable")
+    def outputs(self) -> dict[str, dict]:
+        return self._outputs
+
+    @Property(list[str], "readable")
+    def keyboard_layouts(self) -> list[str]:
+        return self._keyboard_layouts
+
+    def get_current_keyboard_layout(self) -> str | None:
+        if self._keyboard_layout_idx is None or not (
+            0 <= self._keyboard_layout_idx < len(self._keyboard_layouts)
+        ):
+            return None
+
+        return self._keyboard_layouts[self._keyboard_layout_idx]
+
+    def __init__(self, connection: Niri | None = None, **kwargs):
+        super().__init__(**kwargs)
+
+        self.connection = connection or get_niri_connection()
+
+        self._workspaces: dict[int, dict] = {}
+        self._windows: dict[int, dict] = {}
+        self._outputs: dict[str, dict] = {}
+        self._keyboard_layouts: list[str] = []
+        self._keyboard_layout_idx: int | None = None
+        self._watching_windows = False
+        self._focused_window_id: int | None = None
+        self._dirty: dict[str, None] = {}
+        # the keys events changed since a domain's seed was requested, None for all of them
+        self._touched: dict[str, set[Hashable] | None] = {}
+
+        self._resync_on_connect = False
+
+        self.connection.connect("events-flushed", self.on_events_flushed)
+        self.connection.connect("connection-changed", self.on_connection_changed)
+
+        bulk_connect(
+            self.connection,
+            {
+                "event::WorkspacesChanged": self.on_workspaces_changed,
+                "event::WorkspaceActivated": self.on_workspace_activated,
+                "event::WorkspaceUrgencyChanged": self.on_workspace_urgency_changed,
+                "event::WorkspaceActiveWindowChanged": self.on_workspace_active_window_changed,
+                "event::KeyboardLayoutsChanged": self.on_keyboard_layouts_changed,
+                "event::KeyboardLayoutSwitched": self.on_keyboard_layout_switched,
+            },
+        )
+
+        self.seed()
+
+    def get_workspace(self, workspace_id: int) -> dict | None:
+        return self._workspaces.get(workspace_id)
+
+    def touch(self, domain: str, keys: Iterable[Hashable] | None = None):
+        """
+        Note what an event changed, for a seed of `domain` in flight.
+        """
+        if domain not in self._touched:
+            return
+
+        if keys is None:
+            self._touched[domain] = None
+        elif (touched := self._touched[domain]) is not None:
+            touched.update(keys)
+
+    def mark_changed(self, domain: str):
+        # while niri is dispatching a batch of events, notify once after the whole batch
+        if self.connection.dispatching_events:
+            self._dirty[domain] = None
+        else:
+            self.emit(f"{domain}-changed")
+
+    def on_events_flushed(self, _):
+        dirty, self._dirty = self._dirty, {}
+        for domain in dirty:
+            self.emit(f"{domain}-changed")
+
+    def on_connection_changed(self, _, connected: bool):
+        if not connected:
+            self._resync_on_connect = True
+            return logger.warning("[NiriState] Lost the event stream, state may be stale until it reconnects")
+
+        if self._resync_on_connect:
+            self._resync_on_connect = False
+            logger.info("[NiriState] Event stream is back, resyncing")
+            self.seed()
+
+    def watch_windows(self):
+        """
+        Start mirroring windows. Window events are by far the noisiest part of the
+        EventStream, so they're only subscribed to (and decoded) for whatever calls this.
+        """
+        if self._watching_windows:
+            return
+
+        self._watching_windows = True
+        bulk_connect(
+            self.connection,
+            {
+                "event::WindowsChanged": self.on_windows_changed,
+                "event::WindowOpenedOrChanged": self.on_window_opened_or_changed,
+                "event::WindowClosed": self.on_window_closed,
+                "event::WindowFocusChanged": self.on_window_focus_changed,
+                "event::WindowUrgencyChanged": self.on_window_urgency_changed,
+                "event::WindowLayoutsChanged": self.on_window_layouts_changed,
+            },
+        )
+        self.request_seed("Windows", "windows", self.apply_windows)
+
+    def get_window(self, window_id: int) -> dict | None:
+        return self._windows.get(window_id)
+
+    def get_focused_workspace(self) -> dict | None:
+        for ws in self._workspaces.values():
+            if ws.get("is_focused"):
+                return ws
+        return None
+
+    def get_workspace_windows(self, workspace_id: int) -> list[dict]:
+        return [
+            window
+            for window in self._windows.values()
+            if window.get("workspace_id") == workspace_id
+        ]
+
+    # Seeding
+    def seed(self):
+        for command, domain, handler in (
+            ("Workspaces", "workspaces", self.apply_workspaces),
+            ("Outputs", "outputs", self.apply_outputs),
+            ("KeyboardLayouts", "keyboard-layouts", self.apply_keyboard_layouts),
+        ):
+            self.request_seed(command, domain, handler)
+
+        if self._watching_windows:
+            self.request_seed("Windows", "windows", self.apply_windows)
+
+    def request_seed(
+        self, command: str, domain: str, handler: Callable[[Any, set[Hashable]], None]
+    ):
+        if domain in self._touched:
+            # one is in flight already, and would get the same reply
+            return
+
+        self._touched[domain] = set()
+        self.connection.send_command_async(command, self.on_seed_reply, domain, handler)
+
+    def on_seed_reply(
+        self, reply: NiriReply, domain: str, handler: Callable[[Any, set[Hashable]], None]
+    ):
+        touched = self._touched.pop(domain, set())
+        if not reply.is_ok:
+            return logger.warning(
+                f"[NiriState] Couldn't seed {reply.command}: {reply.reply}"
+            )
+
+        if touched is None:
+            # replaced as a whole by an event since
+            return logger.debug(f"[NiriState] Dropped an outdated {reply.command} seed")
+
+        handler(reply.reply["Ok"][reply.command], touched)
+
+    @staticmethod
+    def merge_seed(current: dict, seeded: dict, touched: Iterable[Hashable]) -> dict:
+        # what events changed since the seed was requested is newer than the reply
+        for key in touched:
+            if key in current:
+                seeded[key] = current[key]
+            else:
+                seeded.pop(key, None)
+
+        return seeded
+
+    def apply_workspaces(self, workspaces: list[dict], touched: Iterable[Hashable] = ()):
+        self._workspaces = self.merge_seed(
+            self._workspaces, {ws["id"]: ws for ws in workspaces}, touched
+        )
+        self.mark_changed("workspaces")
+
+        # niri doesn't stream output changes, so refresh them whenever a workspace lands on an unknown one
+        if self._outputs and any(
+            ws.get("output") and ws["output"] not in self._outputs
+            for ws in workspaces
+        ):
+            self.request_seed("Outputs", "outputs", self.apply_outputs)
+
+    def apply_windows(self, windows: list[dict], touched: Iterable[Hashable] = ()):
+        self._windows = self.merge_seed(
+            self._windows, {window["id"]: window for window in windows}, touched
+        )
+        if "is_focused" in touched:
+            # the focus moved since, away from windows the events didn't mention
+            for window in self._windows.values():
+                window["is_focused"] = window["id"] == self._focused_window_id
+
+        self.mark_changed("windows")
+
+    def apply_outputs(self, outputs: dict[str, dict], touched: Iterable[Hashable] = ()):
+        # niri doesn't stream output changes, nothing to merge
+        self._outputs = outputs
+        self.mark_changed("outputs")
+
+    def apply_keyboard_layouts(self, keyboard_layouts: dict, touched: Iterable[Hashable] = ()):
+        self._keyboard_layouts = keyboard_layouts["names"]
+        if "current_idx" not in touched:
+            self._keyboard_layout_idx = keyboard_layouts["current_idx"]
+        self.mark_changed("keyboard-layouts")
+
+    # Workspace events
+    def on_workspaces_changed(self, _, event: NiriEvent):
+        self.touch("workspaces")
+        self.apply_workspaces(event.data["workspaces"])
+
+    def on_workspace_activated(self, _, event: NiriEvent):
+        if not (activated := self._workspaces.get(event.data["id"])):
+            return logger.warning(f"[NiriState] Unknown workspace activated: {event.data}")
+
+        changed = [activated["id"]]
+        for ws in self._workspaces.values():
+            if ws["output"] == activated["output"] and ws.get("is_active"):
+                ws["is_active"] = False
+                changed.append(ws["id"])
+            if event.data["focused"] and ws.get("is_focused"):
+                ws["is_focused"] = False
+                changed.append(ws["id"])
+
+        activated["is_active"] = True
+        if event.data["focused"]:
+            activated["is_focused"] = True
+
+        self.touch("workspaces", changed)
+        self.mark_changed("workspaces")
+
+    def on_workspace_urgency_changed(self, _, event: NiriEvent):
+        if ws := self._workspaces.get(event.data["id"]):
+            ws["is_urgent"] = event.data["urgent"]
+            self.touch("workspaces", (ws["id"],))
+            self.mark_changed("workspaces")
+
+    def on_workspace_active_window_changed(self, _, event: NiriEvent):
+        if ws := self._workspaces.get(event.data["workspace_id"]):
+            ws["active_window_id"] = event.data["active_window_id"]
+            self.touch("workspaces", (ws["id"],))
+            self.mark_changed("workspaces")
+
+    # Window events
+    def on_windows_changed(self, _, event: NiriEvent):
+        self.touch("windows")
+        self.apply_windows(event.data["windows"])
+
+    def on_window_opened_or_changed(self, _, event: NiriEvent):
+        window = event.data["window"]
+        changed = [window["id"]]
+        if window.get("is_focused"):
+            self._focused_window_id = window["id"]
+            changed.append("is_focused")
+            for other in self._windows.values():
+                if other.get("is_focused"):
+                    other["is_focused"] = False
+                    changed.append(other["id"])
+
+        self._windows[window["id"]] = window
+        self.touch("windows", changed)
+        self.mark_changed("windows")
+
+    def on_window_closed(self, _, event: NiriEvent):
+        # even unknown, the seed might still list it
+        self.touch("windows", (event.data["id"],))
+        if self._windows.pop(event.data["id"], None):
+            self.mark_changed("windows")
+
+    def on_window_focus_changed(self, _, event: NiriEvent):
+        self._focused_window_id = event.data["id"]
+        changed = ["is_focused"]
+        for window in self._windows.values():
+            if window.get("is_focused") != (focused := window["id"] == event.data["id"]):
+                window["is_focused"] = focused
+                changed.append(window["id"])
+
+        self.touch("windows", changed)
+        self.mark_changed("windows")
+
+    def on_window_urgency_changed(self, _, event: NiriEvent):
+        if window := self._windows.get(event.data["id"]):
+            window["is_urgent"] = event.data["urgent"]
+            self.touch("windows", (window["id"],))
+            self.mark_changed("windows")
+
+    def on_window_layouts_changed(self, _, event: NiriEvent):
+        changed = []
+        for window_id, layout in event.data["changes"]:
+            if window := self._windows.get(window_id):
+                window["layout"] = layout
+                changed.append(window_id)
+
+        self.touch("windows", changed)
+        self.mark_changed("windows")
+
+    # Keyboard layout events
+    def on_keyboard_layouts_changed(self, _, event: NiriEvent):
+        self.touch("keyboard-layouts")
+        self.apply_keyboard_layouts(event.data["keyboard_layouts"])
+
+    def on_keyboard_layout_switched(self, _, event: NiriEvent):
+        self._keyboard_layout_idx = event.data["idx"]
+        self.touch("keyboard-layouts", ("current_idx",))
+        self.mark_changed("keyboard-layouts")
+
+
+state: NiriState | None = None
+
+
+def get_niri_state() -> NiriState:
+    global state
+    if not state:
+        state = NiriState()
+
+    return state
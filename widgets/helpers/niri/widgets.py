@@ -1,6 +1,7 @@
 import gi
 import re
 import json
+import bisect
 
 from loguru import logger
 from collections.abc import Iterable, Callable
@@ -13,19 +14,14 @@ from fabric.widgets.button import Button
 from fabric.widgets.eventbox import EventBox
 from fabric.utils.helpers import bulk_connect
 
-from widgets.helpers.niri.service import Niri, NiriEvent
+from widgets.helpers.niri.service import Niri, NiriEvent, get_niri_connection
+from widgets.helpers.niri.state import get_niri_state
 
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, Gdk
 
-connection: Niri | None = None
-
-def get_niri_connection() -> Niri:
-    global connection
-    if not connection:
-        connection = Niri()
-
-    return connection
+# (active, urgent, empty)
+WorkspaceButtonState = tuple[bool, bool, bool]
 
 class Workspaces(EventBox):
     @staticmethod
@@ -48,21 +44,18 @@ class Workspaces(EventBox):
         self.children = self._container
 
         self._static_workspace_buttons = static_workspace_buttons
-        self._active_workspace: int | None = None
         self._buttons: dict[int, WorkspaceButton] = {}
+        # button ids in the order they appear in the container
+        self._buttons_order: list[int] = []
+        # what the buttons were last synced to
+        self._snapshot: dict[int, WorkspaceButtonState | None] = {}
         self._buttons_preset: list[WorkspaceButton] = list(buttons or [])
         self._buttons_factory = buttons_factory
         self._invert_scroll = invert_scroll
         self._empty_scroll = empty_scroll
 
-        bulk_connect(
-            self.connection,
-            {
-                "event::WorkspaceActivated": self.on_workspace,
-                "event::WorkspacesChanged": self.on_workspace,
-                "event::WorkspaceUrgencyChanged": self.on_workspace_urgent,
-            },
-        )
+        self.state = get_niri_state()
+        self.state.connect("workspaces-changed", self.on_workspaces_changed)
 
         if self.connection.ready:
             self.on_ready(None)
@@ -72,62 +65,16 @@ class Workspaces(EventBox):
         self.connect("scroll-event", self.scroll_handler)
 
     def on_ready(self, _):
-        response = self.connection.send_command("Workspaces").reply
-        json_data = self.parse_niri_response(response)
-        if not json_data:
-            return
-
-        workspaces = json_data.get("Workspaces", [])
-
         if self._static_workspace_buttons:
             for btn in self._buttons_preset:
                 self.insert_button(btn)
+                # unknown state, the first sync either fills it in or marks it empty
+                self._snapshot[btn.id] = None
 
-        self.sync_workspaces(workspaces)
-
-        active = self.check_active_workspace_niri(json_data)
-        if active:
-            self._active_workspace = active["idx" if self._static_workspace_buttons else "id"]
-            if (btn := self._buttons.get(self._active_workspace)):
-                btn.active = True
-
-    def on_workspace(self, _, event: NiriEvent):
-        logger.debug(f"[EVENT] on_workspace: {event.data}")
-
-        response = self.connection.send_command("Workspaces").reply
-        json_data = self.parse_niri_response(response)
-        if not json_data:
-            return
-
-        workspaces = json_data.get("Workspaces", [])
-        self.sync_workspaces(workspaces)
-
-        active_ws = self.check_active_workspace_niri(json_data)
-        if not active_ws:
-            return
-
-        new_active_id = active_ws["idx" if self._static_workspace_buttons else "id"]
-        if new_active_id == self._active_workspace:
-            return
-
-        if (old := self._buttons.get(self._active_workspace)):
-            old.active = False
-
-        self._active_workspace = new_active_id
-
-        if (new := self._buttons.get(new_active_id)):
-            new.active = True
-            new.urgent = False
-
-    def on_workspace_urgent(self, _, event: NiriEvent):
-        urgent_ws = self.check_urgent_workspace_niri(event.data)
-        ws_id = urgent_ws.get("idx" if self._static_workspace_buttons else "id")
-        if not ws_id:
-            return
+        self.on_workspaces_changed()
 
-        if (btn := self._buttons.get(ws_id)):
-            btn.urgent = True
-            logger.info(f"[Workspaces] workspace {ws_id} is now urgent")
+    def on_workspaces_changed(self, *_):
+        self.sync_workspaces(self.state.workspaces)
 
     def scroll_handler(self, _, event: Gdk.EventScroll):
         direction = event.direction
@@ -139,7 +86,7 @@ class Workspaces(EventBox):
                 },
             }
 
-            self.connection.send_command(cmd)
+            self.connection.send_command_async(cmd)
             logger.info("[Workspaces] Moving to the workspace above")
         elif direction == Gdk.ScrollDirection.DOWN:
             cmd = {
@@ -149,87 +96,83 @@ class Workspaces(EventBox):
             }
 
             logger.info("[Workspaces] Moving to the workspace below")
-            self.connection.send_command(cmd)
+            self.connection.send_command_async(cmd)
         else:
             logger.warning(f"[Workspaces] Unknown sLayoutSwitchTargetcroll direction ({direction})")
             return
 
     def sync_workspaces(self, fresh_data: list[dict]) -> None:
         """
-        Sync internal workspace buttons with the latest workspace data.
-        Adds new buttons, updates existing ones, and removes stale ones.
+        Diff the latest workspace data against the previous snapshot and apply
+        only what changed: new and stale buttons, and changed button properties.
         """
         key = "idx" if self._static_workspace_buttons else "id"
-        fresh_ids = {ws[key] for ws in fresh_data if key in ws}
 
-        # Add/update buttons
+        fresh: dict[int, WorkspaceButtonState] = {}
         for ws in fresh_data:
-            btn = self.lookup_or_bake_button(ws[key])
-            if not btn:
+            if key not in ws:
                 continue
 
-            btn.empty = False
-            btn.active = ws.get("is_active", False)
+            # with static buttons several outputs share an index, any of them being active counts
+            active, urgent, _ = fresh.get(ws[key], (False, False, False))
+            active = active or ws.get("is_active", False)
+            urgent = (urgent or ws.get("is_urgent", False)) and not active
+            fresh[ws[key]] = (active, urgent, False)
 
-            if btn not in self._buttons:
+        # Remove old buttons
+        for id_ in self._snapshot.keys() - fresh.keys():
+            if not (btn := self._buttons.get(id_)):
+                continue
+
+            if self._static_workspace_buttons and btn in self._buttons_preset:
+                fresh[id_] = (False, False, True)
+            else:
+                self.remove_button(btn)
+
+        # Add/update buttons
+        for id_, state in fresh.items():
+            previous = self._snapshot.get(id_)
+            if state == previous:
+                continue
+
+            if not (btn := self._buttons.get(id_)):
+                if not self._buttons_factory or not (btn := self._buttons_factory(id_)):
+                    continue
                 self.insert_button(btn)
 
-        # Remove old buttons
-        for id_, btn in list(self._buttons.items()):
-            if id_ not in fresh_ids:
-                if self._static_workspace_buttons and btn in self._buttons_preset:
-                    btn.active = False
-                    btn.empty = True
-                else:
-                    self.remove_button(btn)
+            for name, value, old_value in zip(
+                ("active", "urgent", "empty"), state, previous or (None, None, None)
+            ):
+                if value != old_value:
+                    setattr(btn, name, value)
+
+        self._snapshot = fresh
 
     def insert_button(self, button: WorkspaceButton) -> None:
+        if button.id in self._buttons:
+            return
+
         self._buttons[button.id] = button
         self._container.add(button)
         button.connect("clicked", self.on_workspace_button_clicked)
-        self.reorder_buttons()
+
+        # the container is kept sorted, so a single move puts the new button in place
+        position = bisect.bisect(self._buttons_order, button.id)
+        self._buttons_order.insert(position, button.id)
+        self._container.reorder_child(button, position)
 
     def remove_button(self, button: WorkspaceButton) -> None:
         if self._buttons.pop(button.id, None):
+            self._buttons_order.remove(button.id)
             self._container.remove(button)
         button.destroy()
 
-    def reorder_buttons(self):
-        for pos, btn in enumerate(sorted(self._buttons.values(), key=lambda b: b.id)):
-            self._container.reorder_child(btn, pos)
-
-    def lookup_or_bake_button(self, workspace_id: int) -> WorkspaceButton | None:
-        return self._buttons.get(workspace_id) or (
-            self._buttons_factory(workspace_id) if self._buttons_factory else None
-        )
-
     def on_workspace_button_clicked(self, button: WorkspaceButton):
         key = "Index" if self._static_workspace_buttons else "Id"
         cmd = {"Action": {"FocusWorkspace": {"reference": {key: button.id}}}}
-        self.connection.send_command(cmd)
+        self.connection.send_command_async(cmd)
         logger.info(f"[Workspaces] Moved to workspace {button.id}")
 
-    def parse_niri_response(self, json_data: dict) -> dict | None:
-        if "Err" in json_data:
-            logger.warning(f"[Niri] Error: {json_data['Err']}")
-            return
-
-        ok_data = json_data.get("Ok")
-        if not isinstance(ok_data, dict) or len(ok_data) != 1:
-            logger.warning(f"[Niri] Unexpected response: {json_data}")
-            return
-
-        return ok_data
-
-    def check_active_workspace_niri(self, json_data: dict) -> dict | None:
-        for key in ("Workspaces", "workspaces"):
-            for ws in json_data.get(key, []):
-                if ws.get("is_active"):
-                    return ws
-        return None
-
-    def check_urgent_workspace_niri(self, json_data: dict) -> dict:
-        return json_data.get("WorkspaceUrgencyChanged", {})
 
 class Language(Button):
     def __init__(
@@ -239,15 +182,10 @@ class Language(Button):
         super().__init__(**kwargs)
 
         self.connection = get_niri_connection()
+        self.state = get_niri_state()
         self._keyboard_layouts = []
 
-        bulk_connect(
-            self.connection,
-            {
-                "event::KeyboardLayoutsChanged": self.on_layout_changed,
-                "event::KeyboardLayoutSwitched": self.on_layout_switched,
-            },
-        )
+        self.state.connect("keyboard-layouts-changed", self.on_layouts_changed)
 
         if self.connection.ready:
             self.on_ready(None)
@@ -261,37 +199,17 @@ class Language(Button):
             "[Language] Connected to the Niri socket"
         )
 
-    def on_layout_changed(self, _, event: NiriEvent):
-        logger.error(event.data)
-
-        data = event.data["keyboard_layouts"]
-        names = data["names"]
-        current_idx = data["current_idx"]
-        current_layout = names[current_idx]
-
-        logger.debug(current_layout)
-        return self.set_label(current_layout)
-
-    def on_layout_switched(self, _, event: NiriEvent):
-        logger.error(event.data)
-
-        current_idx = event.data.get("idx", None)
-
-        if current_idx is None:
-            return self.do_initialize()
-
-        return self.set_label(self._keyboard_layouts[current_idx])
+    def on_layouts_changed(self, *_):
+        return self.do_initialize()
 
     def do_initialize(self):
-        keyboard_layouts = self.parse_niri_response(self.connection.send_command("KeyboardLayouts").reply)["KeyboardLayouts"]
-        logger.error(keyboard_layouts)
-
-        names = keyboard_layouts["names"]
-        current_idx = keyboard_layouts["current_idx"]
+        self._keyboard_layouts = self.state.keyboard_layouts
 
-        self._keyboard_layouts = names
+        current_layout = self.state.get_current_keyboard_layout()
+        if current_layout is None:
+            return
 
-        current_layout = names[current_idx]
+        logger.debug(current_layout)
         return self.set_label(current_layout)
 
     def scroll_handler(self, _, event: Gdk.EventScroll):
@@ -306,7 +224,7 @@ class Language(Button):
                 },
             }
 
-            self.connection.send_command(cmd)
+            self.connection.send_command_async(cmd)
             logger.info("[Language] Changing to the next language")
         elif direction == Gdk.ScrollDirection.DOWN:
             cmd = {
@@ -318,19 +236,7 @@ class Language(Button):
             }
 
             logger.info("[Language] Changing to the previous language")
-            self.connection.send_command(cmd)
+            self.connection.send_command_async(cmd)
         else:
             logger.warning(f"[Language] Unknown scroll direction ({direction})")
             return
-
-    def parse_niri_response(self, json_data: dict) -> dict | None:
-        if "Err" in json_data:
-            logger.warning(f"[Niri] Error: {json_data['Err']}")
-            return
-
-        ok_data = json_data.get("Ok")
-        if not isinstance(ok_data, dict) or len(ok_data) != 1:
-            logger.warning(f"[Niri] Unexpected response: {json_data}")
-            return
-
-        return ok_data
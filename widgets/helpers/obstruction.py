@@ -0,0 +1,80 @@
+from collections.abc import Callable
+
+from fabric import Service
+from fabric.core import Signal, Property
+
+from widgets.helpers.hyprland_clients import get_hyprland_clients_service
+from widgets.helpers.spatial_index import Rect
+
+
+def get_monitor_rect(monitor: dict) -> Rect:
+    """
+    The area a monitor covers in the layout, hyprctl reports its mode in pixels.
+    """
+    width = monitor["width"] / monitor["scale"]
+    height = monitor["height"] / monitor["scale"]
+    if monitor["transform"] % 2:
+        # rotated by 90 or 270 degrees
+        width, height = height, width
+
+    return monitor["x"], monitor["y"], width, height
+
+
+class ObstructionWatcher(Service):
+    """
+    Tracks whether any window shown on a monitor overlaps a region of it, e.g. the
+    area a dock or a bar occupies.
+
+    `region` maps the monitor's rect to the watched one, so it follows mode, scale
+    and layout changes. Without a `monitor` name, the monitor that is focused when
+    the watcher first sees the outputs is used (where layer surfaces without an
+    output end up). The overlap is only recomputed when windows or the workspaces
+    shown move, or when `update` is called because the region itself changed.
+    """
+
+    @Signal
+    def obstructed_changed(self, obstructed: bool): ...
+
+    @Property(bool, "readable", "is-obstructed", default_value=False)
+    def obstructed(self) -> bool:
+        return self._obstructed
+
+    def __init__(
+        self,
+        region: Callable[[Rect], Rect],
+        monitor: str | None = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+
+        self.region = region
+        self.monitor = monitor
+        self._obstructed = False
+
+        self.clients = get_hyprland_clients_service()
+        self.clients.connect("layout-changed", self.update)
+
+        self.update()
+
+    def update(self, *_):
+        if not (monitor := self.lookup_monitor()):
+            return
+
+        obstructed = self.clients.any_client_in_rect(
+            self.region(get_monitor_rect(monitor)), monitor=monitor
+        )
+
+        if obstructed != self._obstructed:
+            self._obstructed = obstructed
+            self.notify("obstructed")
+            self.obstructed_changed(obstructed)
+
+    def lookup_monitor(self) -> dict | None:
+        monitors = self.clients.monitors
+        if self.monitor is None:
+            self.monitor = next(
+                (name for name, monitor in monitors.items() if monitor.get("focused")),
+                None,
+            )
+
+        return monitors.get(self.monitor) if self.monitor else None
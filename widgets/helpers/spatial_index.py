@@ -0,0 +1,106 @@
+from collections.abc import Hashable, Iterator
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+# x, y, width, height, in hyprland's (logical) layout coordinates
+Rect = tuple[float, float, float, float]
+
+CELL_SIZE = 256  # logical pixels
+
+
+def rects_intersect(a: Rect, b: Rect) -> bool:
+    # touching counts, a window flush against the dock's edge obstructs it
+    return (
+        a[0] <= b[0] + b[2]
+        and b[0] <= a[0] + a[2]
+        and a[1] <= b[1] + b[3]
+        and b[1] <= a[1] + a[3]
+    )
+
+
+class SpatialGrid(Generic[K]):
+    """
+    A uniform grid over layout coordinates, mapping every cell to the keys whose
+    rect covers it. Inserting, moving and removing a rect only touches the cells
+    it covers, and a query only looks at the keys in the cells the queried rect
+    covers, instead of scanning every rect.
+    """
+
+    def __init__(self, cell_size: int = CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], set[K]] = {}
+        self._rects: dict[K, Rect] = {}
+
+    def __len__(self) -> int:
+        return len(self._rects)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._rects
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._rects)
+
+    def get(self, key: K) -> Rect | None:
+        return self._rects.get(key)
+
+    def cells(self, rect: Rect) -> Iterator[tuple[int, int]]:
+        x, y, width, height = rect
+        left, top = int(x // self.cell_size), int(y // self.cell_size)
+        # a rect ending right on a cell border is in the next cell too, it touches what starts there
+        right = int((x + width) // self.cell_size)
+        bottom = int((y + height) // self.cell_size)
+
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                yield cx, cy
+
+    def insert(self, key: K, rect: Rect):
+        """
+        Insert `key`, or move it if it is indexed already.
+        """
+        if (old := self._rects.get(key)) is not None:
+            if old == rect:
+                return
+            self.remove(key)
+
+        self._rects[key] = rect
+        for cell in self.cells(rect):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: K):
+        if (rect := self._rects.pop(key, None)) is None:
+            return
+
+        for cell in self.cells(rect):
+            if (keys := self._cells.get(cell)) is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cells[cell]
+
+    def candidates(self, rect: Rect) -> set[K]:
+        found: set[K] = set()
+        for cell in self.cells(rect):
+            if keys := self._cells.get(cell):
+                found |= keys
+
+        return found
+
+    def query(self, rect: Rect) -> list[K]:
+        """
+        The keys whose rect intersects `rect`.
+        """
+        return [
+            key for key in self.candidates(rect) if rects_intersect(rect, self._rects[key])
+        ]
+
+    def intersects(self, rect: Rect) -> bool:
+        """
+        Whether anything intersects `rect`.
+        """
+        for cell in self.cells(rect):
+            for key in self._cells.get(cell, ()):
+                if rects_intersect(rect, self._rects[key]):
+                    return True
+
+        return False
@@ -0,0 +1,152 @@
+import os
+import json
+import atexit
+import threading
+from typing import Any
+from loguru import logger
+from config import configuration
+
+from gi.repository import GLib
+
+FLUSH_DELAY = 1000  # ms
+
+
+class StateStore:
+    """
+    Small JSON documents (launch history, pinned apps...) persisted in the XDG
+    state directory.
+
+    `set` only updates the document in memory, writes are coalesced and flushed
+    `FLUSH_DELAY` after the first change, on a worker thread. Every file is
+    written to a temporary file first and atomically renamed over the previous
+    one, so a crash leaves either version, never a truncated file. Whatever is
+    still dirty has to be flushed with `flush_now` on shutdown, it's done at
+    exit, and by the shell's SIGTERM/SIGINT handler, which atexit doesn't cover.
+    """
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory or configuration.get_property("state_dir")
+
+        self._documents: dict[str, Any] = {}
+        self._dirty: set[str] = set()
+        self._flush_source: int | None = None
+
+        # serialized documents waiting for the writer
+        self._pending: dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writing = False
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, name: str, default: Any = None, legacy_path: str | None = None) -> Any:
+        """
+        A document, read from disk the first time. If there's none yet, it's
+        migrated from `legacy_path` (i.e. where it used to be written).
+        """
+        if name in self._documents:
+            return self._documents[name]
+
+        for path in (self.get_path(name), legacy_path):
+            if not path or not os.path.exists(path):
+                continue
+
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"[StateStore] Couldn't read {path}: {e}")
+                continue
+
+            if path == legacy_path:
+                logger.info(f"[StateStore] Migrating {legacy_path} to {self.get_path(name)}")
+                self.set(name, data)
+
+            self._documents[name] = data
+            return data
+
+        return default
+
+    def set(self, name: str, data: Any):
+        self._documents[name] = data
+        self._dirty.add(name)
+
+        if self._flush_source is None:
+            self._flush_source = GLib.timeout_add(FLUSH_DELAY, self.flush)
+
+    def flush(self) -> bool:
+        """
+        Serialize the dirty documents, and write them in the background.
+        """
+        self._flush_source = None
+        self.serialize_dirty()
+
+        with self._pending_lock:
+            if self._writing or not self._pending:
+                return False
+            self._writing = True
+
+        GLib.Thread.new("state-store-writer", self.write_pending)
+        return False
+
+    def flush_now(self):
+        """
+        Write everything right away, on the calling thread.
+        """
+        if self._flush_source is not None:
+            GLib.source_remove(self._flush_source)
+            self._flush_source = None
+
+        self.serialize_dirty()
+        self.write_pending()
+
+    def serialize_dirty(self):
+        # on the main thread, the documents aren't safe to read from anywhere else
+        dirty, self._dirty = self._dirty, set()
+        serialized = {}
+        for name in dirty:
+            try:
+                serialized[name] = json.dumps(self._documents[name], separators=(",", ":"))
+            except (TypeError, ValueError) as e:
+                logger.error(f"[StateStore] Couldn't serialize {name}: {e}")
+
+        with self._pending_lock:
+            self._pending.update(serialized)
+
+    def write_pending(self):
+        while True:
+            # taken before popping, so writes to the same file can't be reordered
+            with self._write_lock:
+                with self._pending_lock:
+                    if not self._pending:
+                        self._writing = False
+                        return
+                    name, content = self._pending.popitem()
+
+                self.write(name, content)
+
+    def write(self, name: str, content: str):
+        path = self.get_path(name)
+        temp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "w") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"[StateStore] Couldn't write {path}: {e}")
+
+
+store: StateStore | None = None
+
+
+def get_state_store() -> StateStore:
+    global store
+    if not store:
+        store = StateStore()
+        atexit.register(store.flush_now)
+
+    return store
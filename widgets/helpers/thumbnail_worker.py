@@ -0,0 +1,31 @@
+"""
+Thumbnail rendering, run in the worker processes of `ThumbnailLoader`, so it
+only imports what it needs.
+"""
+
+import os
+from PIL import Image
+
+
+def render_thumbnail(source: str, atlas_path: str, offset: int, size: int) -> tuple[int, int]:
+    """
+    Render a thumbnail of `source` into the atlas tile at `offset`, as cairo's
+    ARGB32 (premultiplied, native endian BGRA rows, no padding), returns its size.
+    """
+    with Image.open(source) as img:
+        # Pillow's defaults: JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale still
+        # twice the size, then an integer `reduce`, the filter only runs on the last 2-4x step
+        img.thumbnail((size, size), Image.Resampling.BILINEAR)
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+
+        data = img.tobytes("raw", "BGRa")
+        width, height = img.size
+
+    fd = os.open(atlas_path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+    return width, height
@@ -0,0 +1,426 @@
+import os
+import re
+import time
+import json
+import mmap
+import cairo
+import hashlib
+import threading
+import multiprocessing
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+from config import configuration
+
+from fabric.utils.helpers import idle_add
+
+from widgets.helpers.thumbnail_worker import render_thumbnail
+
+from gi.repository import GLib
+
+THUMBNAIL_SIZE = 256
+WALLPAPER_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+POOL_IDLE_TIMEOUT = 10000  # ms
+
+ATLAS_VERSION = 2
+ATLAS_FILE_NAME = "atlas.bin"
+INDEX_FILE_NAME = "atlas.json"
+
+# the names of the thumbnails cached one png per wallpaper, before the atlas
+CACHED_THUMBNAIL_PATTERN = re.compile(r"[0-9a-f]{40}\.png")
+
+
+def is_wallpaper(file_name: str) -> bool:
+    return file_name.lower().endswith(WALLPAPER_EXTENSIONS)
+
+
+class ThumbnailAtlas:
+    """
+    Wallpaper thumbnails, pre-decoded into the fixed size tiles of a single
+    memory-mapped file, so showing one is copying its tile into a cairo surface:
+    no file to open and nothing to decode.
+
+    Thumbnails are keyed by a hash of the wallpaper's inode, mtime and size (and
+    the thumbnail size), so an edited or replaced wallpaper gets a new one, but a
+    renamed one keeps its thumbnail. The index (key -> tile, size and last use)
+    is a JSON file next to the atlas, saved once tiles are written. The atlas
+    holds as many tiles as fit in `max_bytes` (it's a sparse file, only the
+    written tiles take disk space). `collect_garbage` frees the tiles of
+    wallpapers that are gone or changed, and when the atlas is full, the least
+    recently used tile not used since `session_start` is reused.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_bytes: int | None = None,
+        size: int = THUMBNAIL_SIZE,
+    ):
+        self.directory = directory or configuration.get_property(
+            "wallpapers_thumbnails_cache_dir"
+        )
+        max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(configuration.get_property("wallpapers_thumbnails_cache_size_mb") * 1024 * 1024)
+        )
+        self.size = size
+        self.tile_bytes = size * size * 4
+        self.capacity = max(1, max_bytes // self.tile_bytes)
+
+        self.atlas_path = os.path.join(self.directory, ATLAS_FILE_NAME)
+        self.index_path = os.path.join(self.directory, INDEX_FILE_NAME)
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # key -> [tile, width, height, last used]
+        self._index: dict[str, list] = {}
+        self._free: list[int] = []
+        self.session_start = time.time()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.load_index()
+
+        with open(self.atlas_path, "a+b") as f:
+            os.truncate(f.fileno(), self.capacity * self.tile_bytes)
+            # shared, so the tiles the workers write show up, and writable, so `flush` syncs them
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+        self._buffer = memoryview(self._map)
+
+    def get_key(self, path: str) -> str | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        identity = f"{stat.st_dev}\0{stat.st_ino}\0{stat.st_mtime_ns}\0{stat.st_size}\0{self.size}"
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def get_offset(self, tile: int) -> int:
+        return tile * self.tile_bytes
+
+    # Lookups
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def lookup(self, path: str) -> str | None:
+        """
+        The key of a wallpaper's up to date thumbnail, if there's one.
+        """
+        if not (key := self.get_key(path)):
+            return None
+
+        with self._lock:
+            if not (entry := self._index.get(key)):
+                return None
+            entry[3] = time.time()
+
+        return key
+
+    def get_surface(self, key: str) -> cairo.ImageSurface | None:
+        """
+        A copy of the thumbnail's tile, which can be reused (or be rendered
+        into) while the surface is still shown.
+        """
+        with self._lock:
+            if not (entry := self._index.get(key)):
+                return None
+            entry[3] = time.time()
+            tile, width, height, _ = entry
+
+            offset = self.get_offset(tile)
+            stride = width * 4
+            # copied while the tile can't be freed, 256 KiB at most
+            data = bytearray(self._buffer[offset : offset + stride * height])
+
+        return cairo.ImageSurface.create_for_data(
+            data,
+            cairo.FORMAT_ARGB32,
+            width,
+            height,
+            stride,
+        )
+
+    # Allocation
+    def reserve(self) -> int | None:
+        """
+        A free tile, or the least recently used one that wasn't used this session.
+        """
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+
+            stale = [
+                (entry[3], key) for key, entry in self._index.items() if entry[3] < self.session_start
+            ]
+            if not stale:
+                return None
+
+            _, key = min(stale)
+            return self._index.pop(key)[0]
+
+    def commit(self, key: str, tile: int, width: int, height: int):
+        with self._lock:
+            self._index[key] = [tile, width, height, time.time()]
+
+    def release(self, tile: int):
+        with self._lock:
+            self._free.append(tile)
+
+    def collect_garbage(self, wallpapers: Iterable[str]):
+        """
+        Free the tiles of anything but `wallpapers` (all of them).
+        """
+        live = {key for path in wallpapers if (key := self.get_key(path))}
+
+        with self._lock:
+            orphans = [key for key in self._index if key not in live]
+            for key in orphans:
+                self._free.append(self._index.pop(key)[0])
+
+        if orphans:
+            logger.info(f"[ThumbnailAtlas] Freed {len(orphans)} orphaned thumbnails")
+        self.save_index()
+
+    # Persistence
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get("version") != ATLAS_VERSION or index.get("size") != self.size:
+                raise ValueError("outdated atlas")
+
+            self._index = {
+                key: entry for key, entry in index["thumbnails"].items() if entry[0] < self.capacity
+            }
+        except FileNotFoundError:
+            # a first run, anything left from before the atlas isn't needed anymore
+            self.remove_cached_thumbnails()
+            self.remove_legacy_thumbnails()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"[ThumbnailAtlas] Starting a new atlas: {e}")
+            self._index = {}
+
+        used = {entry[0] for entry in self._index.values()}
+        self._free = [tile for tile in range(self.capacity - 1, -1, -1) if tile not in used]
+
+    def save_index(self):
+        # saves can come from several threads, the last one taken has to be written last
+        with self._save_lock:
+            with self._lock:
+                index = {"version": ATLAS_VERSION, "size": self.size, "thumbnails": self._index}
+                content = json.dumps(index, separators=(",", ":"))
+
+            temp_path = f"{self.index_path}.tmp"
+            try:
+                # the tiles have to be on disk before an index pointing to them
+                self._map.flush()
+                with open(temp_path, "w") as f:
+                    f.write(content)
+                os.replace(temp_path, self.index_path)
+            except OSError as e:
+                logger.error(f"[ThumbnailAtlas] Couldn't write {self.index_path}: {e}")
+
+    def remove_cached_thumbnails(self):
+        # the one png per wallpaper the atlas replaced, the directory is user set, so nothing else is touched
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+
+        for name in names:
+            if CACHED_THUMBNAIL_PATTERN.fullmatch(name):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def remove_legacy_thumbnails(self):
+        """
+        Remove the thumbnails that used to be written to `<wallpapers_dir>/thumbnails`,
+        named like their wallpaper. Only those of a wallpaper that's still there are
+        removed, and the directory itself if that empties it.
+        """
+        if not (wallpapers_dir := configuration.get_property("wallpapers_dir")):
+            return
+
+        legacy_dir = os.path.join(wallpapers_dir, "thumbnails")
+        if not os.path.isdir(legacy_dir) or os.path.realpath(legacy_dir) == os.path.realpath(self.directory):
+            return
+
+        try:
+            names = os.listdir(legacy_dir)
+        except OSError:
+            return
+
+        removed = 0
+        for name in names:
+            if not is_wallpaper(name) or not os.path.isfile(os.path.join(wallpapers_dir, name)):
+                continue
+
+            try:
+                os.remove(os.path.join(legacy_dir, name))
+                removed += 1
+            except OSError:
+                pass
+
+        try:
+            os.rmdir(legacy_dir)
+        except OSError:
+            # not empty, what's left isn't ours
+            pass
+
+        if removed:
+            logger.info(f"[ThumbnailAtlas] Removed {removed} legacy thumbnails from {legacy_dir}")
+
+
+class ThumbnailLoader:
+    """
+    Renders thumbnails into the atlas on demand, in a pool of processes, since
+    Pillow holds the GIL through most of the decoding and resizing.
+
+    What's wanted is described with `set_window`, most wanted first. Each call
+    replaces the previous window, so the thumbnails that aren't wanted anymore
+    (i.e. scrolled away) are dropped before they're started. That's why only
+    `max_workers` renders are submitted at a time. `on_thumbnail(key, path)` is
+    called once a thumbnail is in the atlas. The pool is stopped after
+    `POOL_IDLE_TIMEOUT` without work. Like GTK, it's only meant to be used
+    from the main thread.
+    """
+
+    def __init__(
+        self,
+        atlas: ThumbnailAtlas,
+        on_thumbnail: Callable[[str, str], object],
+        max_workers: int | None = None,
+    ):
+        self.atlas = atlas
+        self.on_thumbnail = on_thumbnail
+        self.max_workers = max_workers or configuration.get_property(
+            "thumbnails_generator_max_workers"
+        )
+
+        # (key, path), most wanted first
+        self._queue: list[tuple[str, str]] = []
+        # key -> (render, tile)
+        self._running: dict[str, tuple[Future, int]] = {}
+        # wallpapers that couldn't be rendered, not retried until they change
+        self._failed: set[str] = set()
+
+        self._executor: ProcessPoolExecutor | None = None
+        self._shutdown_source: int | None = None
+        self._dirty = False
+
+    def set_window(self, wallpapers: Iterable[tuple[str, str]]):
+        """
+        Render the missing thumbnails of `wallpapers` (keys and paths), in order,
+        instead of whatever was wanted before.
+        """
+        wanted = {
+            key: path
+            for key, path in wallpapers
+            if key not in self._failed and key not in self.atlas
+        }
+
+        for key, (future, tile) in list(self._running.items()):
+            # only those that haven't started yet can be cancelled, the others are kept anyway
+            if key not in wanted and future.cancel():
+                del self._running[key]
+                self.atlas.release(tile)
+
+        self._queue = [(key, path) for key, path in wanted.items() if key not in self._running]
+        self.submit_queued()
+
+    def cancel(self):
+        self.set_window(())
+
+    def submit_queued(self):
+        while self._queue and len(self._running) < self.max_workers:
+            key, path = self._queue.pop(0)
+
+            if (tile := self.atlas.reserve()) is None:
+                logger.warning(
+                    "[ThumbnailLoader] The thumbnail atlas is full, raise wallpapers_thumbnails_cache_size_mb"
+                )
+                self._queue.clear()
+                break
+
+            future = self.get_executor().submit(
+                render_thumbnail, path, self.atlas.atlas_path, self.atlas.get_offset(tile), self.atlas.size
+            )
+            self._running[key] = (future, tile)
+            # called from the executor's thread
+            future.add_done_callback(
+                lambda future, key=key, path=path: idle_add(self.on_rendered, future, key, path)
+            )
+
+        if not self._running:
+            self.on_drained()
+
+    def on_rendered(self, future: Future, key: str, path: str):
+        if (running := self._running.get(key)) is None or running[0] is not future:
+            # dropped by `set_window`
+            return
+
+        _, tile = self._running.pop(key)
+        if future.cancelled():
+            # by the pool's shutdown
+            self.atlas.release(tile)
+            return
+
+        try:
+            width, height = future.result()
+        except BrokenProcessPool as e:
+            logger.error(f"[ThumbnailLoader] The thumbnails pool died: {e}")
+            self.atlas.release(tile)
+            self.shutdown()
+        except Exception as e:
+            logger.error(f"[ThumbnailLoader] Error processing {path}: {e}")
+            self.atlas.release(tile)
+            self._failed.add(key)
+        else:
+            self.atlas.commit(key, tile, width, height)
+            self._dirty = True
+            self.on_thumbnail(key, path)
+
+        self.submit_queued()
+
+    def on_drained(self):
+        if self._dirty:
+            self._dirty = False
+            GLib.Thread.new("thumbnail-atlas-save", self.atlas.save_index)
+
+        if self._executor is not None and self._shutdown_source is None:
+            self._shutdown_source = GLib.timeout_add(POOL_IDLE_TIMEOUT, self.on_idle_timeout)
+
+    def on_idle_timeout(self) -> bool:
+        self._shutdown_source = None
+        self.shutdown()
+        return False
+
+    # Pool
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self._shutdown_source is not None:
+            GLib.source_remove(self._shutdown_source)
+            self._shutdown_source = None
+
+        if self._executor is None:
+            # forking a process running GTK (and its threads) isn't safe, the workers are forked from a clean server
+            # (which still runs main.py as `__mp_main__`, it only sets up the shell as `__main__`)
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["widgets.helpers.thumbnail_worker"])
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+        return self._executor
+
+    def shutdown(self):
+        if self._shutdown_source is not None:
+            GLib.source_remove(self._shutdown_source)
+            self._shutdown_source = None
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
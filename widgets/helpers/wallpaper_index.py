@@ -0,0 +1,172 @@
+import os
+import gi
+from loguru import logger
+from config import configuration
+
+from fabric.core import Service, Signal, Property
+from fabric.utils.helpers import idle_add
+
+from widgets.helpers.thumbnails import ThumbnailAtlas, is_wallpaper
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gio, GLib  # noqa: E402
+
+RESCAN_DELAY = 250  # ms
+
+
+class WallpaperIndex(Service):
+    """
+    The wallpapers of `wallpapers_dir`, with the key of their thumbnail in the
+    atlas (which might not be rendered yet, see `ThumbnailLoader`).
+
+    The directory is listed once (`start`), then watched: new, changed and
+    renamed files are `added` (again), deleted ones are `removed`. Renames keep
+    their thumbnail, thumbnails are keyed by inode rather than path.
+    """
+
+    @Signal
+    def added(self, key: str, path: str): ...
+
+    @Signal
+    def removed(self, path: str): ...
+
+    @Signal
+    def scanned(self): ...
+
+    @Property(bool, "readable", default_value=False)
+    def ready(self) -> bool:
+        return self._ready
+
+    def __init__(self, directory: str | None = None, atlas: ThumbnailAtlas | None = None, **kwargs):
+        super().__init__(**kwargs)
+
+        directory = directory or configuration.get_property("wallpapers_dir")
+        # unset, not the working directory
+        self.directory = os.path.abspath(directory) if directory else None
+        self.atlas = atlas or ThumbnailAtlas()
+
+        # path -> thumbnail key
+        self.wallpapers: dict[str, str] = {}
+        self._ready = False
+        self._started = False
+
+        self._monitor: Gio.FileMonitor | None = None
+        self._pending: set[str] = set()
+        self._rescan_source: int | None = None
+
+    def start(self):
+        if self._started:
+            return
+
+        if not self.directory:
+            logger.warning("[WallpaperIndex] wallpapers_dir isn't set")
+            return
+        if not os.path.isdir(self.directory):
+            # tried again on the next start, it might just not be mounted yet
+            logger.warning(f"[WallpaperIndex] {self.directory} isn't a directory")
+            return
+
+        self._started = True
+
+        if self._monitor is None:
+            try:
+                self._monitor = Gio.File.new_for_path(self.directory).monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None
+                )
+                self._monitor.connect("changed", self.on_dir_changed)
+            except GLib.Error as e:
+                logger.warning(f"[WallpaperIndex] Couldn't watch {self.directory}: {e.message}")
+
+        GLib.Thread.new("wallpaper-index-scan", self.scan)
+
+    def scan(self):
+        try:
+            files = [
+                os.path.join(self.directory, file)
+                for file in os.listdir(self.directory)
+                if is_wallpaper(file)
+            ]
+        except OSError as e:
+            # without a listing, every thumbnail would look orphaned, nothing is collected
+            logger.error(f"[WallpaperIndex] Couldn't list {self.directory}: {e}")
+            idle_add(self.fail_scan)
+            return
+
+        wallpapers = {path: key for path in files if (key := self.atlas.get_key(path))}
+        self.atlas.collect_garbage(files)
+
+        idle_add(self.finish_scan, wallpapers)
+
+    def finish_scan(self, wallpapers: dict[str, str]):
+        for path, key in wallpapers.items():
+            # anything the monitor saw meanwhile is more recent
+            if path not in self.wallpapers:
+                self.add_wallpaper(key, path)
+
+        logger.info(f"[WallpaperIndex] Found {len(self.wallpapers)} wallpapers")
+        self._ready = True
+        self.notify("ready")
+        self.scanned()
+
+    def fail_scan(self):
+        # the next start scans again
+        self._started = False
+
+    def add_wallpaper(self, key: str, path: str):
+        if self.wallpapers.get(path) == key:
+            return
+
+        if path in self.wallpapers:
+            # changed in place, shows up as a new wallpaper
+            self.remove_wallpaper(path)
+
+        self.wallpapers[path] = key
+        self.added(key, path)
+
+    def remove_wallpaper(self, path: str):
+        if self.wallpapers.pop(path, None) is not None:
+            self.removed(path)
+
+    # Watching
+    def on_dir_changed(self, _monitor, file: Gio.File, other_file: Gio.File | None, event_type):
+        if event_type in (
+            Gio.FileMonitorEvent.ATTRIBUTE_CHANGED,
+            Gio.FileMonitorEvent.PRE_UNMOUNT,
+            Gio.FileMonitorEvent.CHANGED,
+        ):
+            # CHANGES_DONE_HINT follows once the file is fully written
+            return
+
+        for changed in (file, other_file):
+            if changed and (path := changed.get_path()) and is_wallpaper(path):
+                self._pending.add(path)
+
+        if self._pending and self._rescan_source is None:
+            self._rescan_source = GLib.timeout_add(RESCAN_DELAY, self.apply_pending)
+
+    def apply_pending(self) -> bool:
+        self._rescan_source = None
+        pending, self._pending = self._pending, set()
+
+        for path in pending:
+            if (
+                os.path.dirname(path) == self.directory
+                and os.path.isfile(path)
+                and (key := self.atlas.get_key(path))
+            ):
+                self.add_wallpaper(key, path)
+            else:
+                self.remove_wallpaper(path)
+
+        return False
+
+
+service: WallpaperIndex | None = None
+
+
+def get_wallpaper_index() -> WallpaperIndex:
+    global service
+    if not service:
+        service = WallpaperIndex()
+
+    return service
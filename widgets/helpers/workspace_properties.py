@@ -1,10 +1,9 @@
-import json
 from loguru import logger
 
 from fabric import Service
 from fabric.core import Signal
-from fabric.hyprland.widgets import get_hyprland_connection
-from fabric.utils.helpers import bulk_connect
+
+from widgets.helpers.hyprland_clients import get_hyprland_clients_service
 
 
 class WorkspaceProperties(Service):
@@ -17,41 +16,21 @@ class WorkspaceProperties(Service):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.hyprland = get_hyprland_connection()
+        self.clients = get_hyprland_clients_service()
 
         self.current_workspace = -1
         # self.fullscreen: bool = False
         self.fullscreen_state: int = 0
         self.empty: bool = False
 
-        bulk_connect(
-            self.hyprland,
-            {
-                "event::workspace": self.recalculate_props,
-                "event::fullscreen": self.recalculate_props,
-                "event::openwindow": self.recalculate_props,
-                "event::closewindow": self.recalculate_props,
-                "event::movewindow": self.recalculate_props,
-                "event::changefloatingmode": self.recalculate_props,
-            },
-        )
+        # the client table batches events per frame already, and answers from memory
+        self.clients.connect("changed", self.recalculate_props)
 
         self.recalculate_props()
 
     def get_workspace_clients(self):
-        self.current_workspace = json.loads(
-            self.hyprland.send_command("j/activeworkspace").reply
-        )["id"]
-
-        clients = json.loads(self.hyprland.send_command("j/clients").reply)
-        return [
-            client
-            for client in clients
-            if not client["hidden"]
-            and (
-                client["workspace"]["id"] == self.current_workspace or client["pinned"]
-            )
-        ]
+        self.current_workspace = self.clients.active_workspace
+        return self.clients.get_workspace_clients(self.current_workspace)
 
     def recalculate_props(self, *_):
         clients = self.get_workspace_clients()
@@ -126,43 +105,10 @@ class WorkspaceProperties(Service):
                         # self.fullscreen = False
 
     def get_clients_overlap_rect(self, x, y, width, height) -> bool:
-        rectl = [x, y]
-        rectr = [x + width, y + height]
-
-        clients = self.get_workspace_clients()
-        for client in clients:
-            clientl = client["at"]
-            clientr = [
-                client["at"][0] + client["size"][0],
-                client["at"][1] + client["size"][1],
-            ]
-            if clientl[0] > rectr[0] or rectl[0] > clientr[0]:
-                return False
-            elif clientl[1] > rectr[1] or rectl[1] > clientr[1]:
-                return False
-
-        return True
+        return self.clients.any_client_in_rect((x, y, width, height), (self.clients.active_workspace,))
 
     def get_clients_overlap_rect2(self, lx, ly, rx, ry) -> bool:
-        rectl = [lx, ly]
-        rectr = [rx, ry]
-
-        clients = self.get_workspace_clients()
-        for client in clients:
-            clientl = client["at"]
-            clientr = [
-                client["at"][0] + client["size"][0],
-                client["at"][1] + client["size"][1],
-            ]
-
-            if clientl[0] > rectr[0] or rectl[0] > clientr[0]:
-                continue
-            elif clientl[1] > rectr[1] or rectl[1] > clientr[1]:
-                continue
-            else:
-                return True
-
-        return False
+        return self.get_clients_overlap_rect(lx, ly, rx - lx, ry - ly)
 
 
 service: WorkspaceProperties | None = None
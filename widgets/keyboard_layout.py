@@ -4,7 +4,6 @@ from loguru import logger
 from collections.abc import Callable
 from config import configuration
 from widgets.helpers.niri.widgets import Language as NiriLanguage
-from widgets.helpers.niri.service import NiriEvent
 
 from fabric.hyprland.widgets import get_hyprland_connection
 from fabric.hyprland.widgets import Language
@@ -109,7 +108,7 @@ class NiriKeyboardLayout(NiriLanguage):
         self.connect("leave-notify-event", lambda *_: self.cursor_leave())
         self.connect(
             "button-release-event",
-            lambda *_: self.connection.send_command(
+            lambda *_: self.connection.send_command_async(
                 {
                     "Action": {
                         "SwitchLayout": {
@@ -120,32 +119,13 @@ class NiriKeyboardLayout(NiriLanguage):
             ),
         )
 
-    def on_layout_changed(self, _, event: NiriEvent):
-        data = event.data["keyboard_layouts"]
-        names = data["names"]
-        current_idx = data["current_idx"]
-        current_layout = names[current_idx]
-
-        logger.debug(current_layout)
-        self.set_label(self.language_formatter(current_layout))
-
-    def on_layout_switched(self, _, event: NiriEvent):
-        current_idx = event.data.get("idx", None)
-
-        if current_idx is None:
-            return self.do_initialize()
-
-        return self.set_label(self.language_formatter(self._keyboard_layouts[current_idx]))
-
     def do_initialize(self):
-        keyboard_layouts = self.parse_niri_response(self.connection.send_command("KeyboardLayouts").reply)["KeyboardLayouts"]
-
-        names = keyboard_layouts["names"]
-        current_idx = keyboard_layouts["current_idx"]
+        self._keyboard_layouts = self.state.keyboard_layouts
 
-        self._keyboard_layouts = names
+        current_layout = self.state.get_current_keyboard_layout()
+        if current_layout is None:
+            return
 
-        current_layout = names[current_idx]
         return self.set_label(self.language_formatter(current_layout))
 
     def cursor_enter(self):
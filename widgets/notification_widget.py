@@ -7,6 +7,7 @@ from loguru import logger
 from widgets.buttons import MarkupButton
 from widgets.rounded_image import RoundedImage
 from widgets.revealer import Revealer
+from widgets.helpers.icon_cache import get_icon_cache
 
 from config import configuration
 
@@ -140,51 +141,18 @@ class NotificationWidget(Revealer):
         # logger.error(image)
         # logger.error(self.notification.app_name)
         # logger.error(self.notification.app_icon)
-        try:
-            if self.notification.app_icon and self.notification.app_icon != "":
-                if os.path.isfile(self.notification.app_icon) and not image:
-                    image = GdkPixbuf.Pixbuf.new_from_file(self.notification.app_icon)
-                    pixbuf = (
-                        Gtk.IconTheme()
-                        .get_default()
-                        .load_icon(
-                            "error",
-                            configuration.get_property("notification_app_icon_size"),
-                            Gtk.IconLookupFlags.FORCE_SIZE,
-                        )
-                    )
-                else:
-                    pixbuf = (
-                        Gtk.IconTheme()
-                        .get_default()
-                        .load_icon(
-                            self.notification.app_icon,
-                            configuration.get_property("notification_app_icon_size"),
-                            Gtk.IconLookupFlags.FORCE_SIZE,
-                        )
-                    )
-            else:
-                pixbuf = (
-                    Gtk.IconTheme()
-                    .get_default()
-                    .load_icon(
-                        "error",
-                        configuration.get_property("notification_app_icon_size"),
-                        Gtk.IconLookupFlags.FORCE_SIZE,
-                    )
-                )
-        except Exception as e:
-            logger.error(f"Error while loading {self.notification.app_icon}: {e}")
-
-            pixbuf = (
-                Gtk.IconTheme()
-                .get_default()
-                .load_icon(
-                    "error",
-                    configuration.get_property("notification_app_icon_size"),
-                    Gtk.IconLookupFlags.FORCE_SIZE,
-                )
-            )
+        icon_cache = get_icon_cache()
+        icon_size = configuration.get_property("notification_app_icon_size")
+        app_icon_name = self.notification.app_icon
+        if app_icon_name and os.path.isfile(app_icon_name) and not image:
+            # the icon is a picture, show it as the image instead
+            try:
+                image = GdkPixbuf.Pixbuf.new_from_file(app_icon_name)
+            except GLib.Error as e:
+                logger.error(f"Error while loading {app_icon_name}: {e}")
+            app_icon_name = None
+
+        pixbuf = icon_cache.load_icon(app_icon_name, icon_size, default_icon="error")
 
         app_icon = RoundedImage(
             name="app_icon",
@@ -1,18 +1,22 @@
-import json
 import os
 import gi
+import time
 from loguru import logger
 # from xdg.DesktopEntry import DesktopEntry
 from config import configuration
 
 from widgets.grid import Grid
 from widgets.pill.applet import Applet
+from widgets.helpers.app_search import AppSearch
+from widgets.helpers.desktop_entries import DesktopEntries, get_desktop_entries
+from widgets.helpers.launch_history import LaunchHistory
+from widgets.helpers.state_store import get_state_store
 
 # from fabric.utils import exec_shell_command, exec_shell_command_async
 from fabric.widgets.entry import Entry
 from fabric.widgets.box import Box
 from fabric.core.service import Signal
-from fabric.utils.helpers import get_desktop_applications, DesktopApp
+from fabric.utils.helpers import DesktopApp
 
 
 gi.require_version("Gtk", "3.0")
@@ -33,12 +37,10 @@ class AppLauncher(Applet, Box):
 
         self.create_launch_context()
 
-        try:
-            with open('app_launcher_history') as history_data:
-                self.history = json.load(history_data)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            logger.error(f"Error while reading app launcher history file: {e}")
-            self.history: dict[str, int] = {}
+        self.state_store = get_state_store()
+        self.history = LaunchHistory.from_json(
+            self.state_store.get("app_launcher_history", legacy_path="app_launcher_history")
+        )
 
         self.entry = Entry(placeholder="Search for apps", name="app_launcher_entry")
         self.entry.grab_focus_without_selecting()
@@ -50,24 +52,89 @@ class AppLauncher(Applet, Box):
         )
         self.entry.connect("activate", lambda *_: True)
 
+        self._desktop_entries: DesktopEntries | None = None
+        self.app_search = AppSearch(
+            items_fetcher=lambda: self.desktop_entries.apps,
+            haystack_fetcher=lambda app: (app.name, app.generic_name, app.display_name, app.description),
+            name_fetcher=lambda app: app.name,
+            bias_fetcher=lambda app: self.history.frecency(app.name),
+        )
+
         self.app_grid = Grid(
             columns=configuration.get_property("app_launcher_columns"),
             rows=configuration.get_property("app_launcher_rows"),
-            items_fetcher=get_desktop_applications,
+            items_fetcher=lambda: self.desktop_entries.apps,
             item_sort_name_fetcher=lambda app: f"{app.name} {app.generic_name} {app.display_name} {app.description}",
             item_factory=lambda item: (
                 item.display_name,
-                item.get_icon_pixbuf(
-                    size=configuration.get_property("app_launcher_icon_size")
+                lambda callback: item.load_icon_async(
+                    configuration.get_property("app_launcher_icon_size"), callback
                 ),
             ),
-            sort_function=lambda item: self.history[item.name] if self.history.__contains__(item.name) else 0,
+            sort_function=lambda item: -self.history.frecency(item.name),
+            search_function=self.app_search.search,
         )
 
         self.app_grid.connect("on_item_clicked", lambda *_: self.select_app())
 
         self.children = [self.entry, self.app_grid]
 
+        # pending | running | done, and how long it took in seconds
+        self.prewarm_status = "pending"
+        self.prewarm_duration: float | None = None
+        self._prewarm_start = 0.0
+        # once everything that's shown at startup is drawn
+        GLib.idle_add(self.prewarm, priority=GLib.PRIORITY_LOW)
+
+    @property
+    def desktop_entries(self) -> DesktopEntries:
+        if not self._desktop_entries:
+            self._desktop_entries = get_desktop_entries()
+            self._desktop_entries.connect("changed", lambda *_: self.app_search.invalidate())
+
+        return self._desktop_entries
+
+    def prewarm(self) -> bool:
+        """
+        Load the catalogue, build the search index and rank the apps, and decode
+        the icons of the first page, so the first open is as fast as the next ones.
+        """
+        if self.prewarm_status != "pending":
+            return False
+
+        self.prewarm_status = "running"
+        self._prewarm_start = time.perf_counter()
+
+        # binds the first page too, which stays bound while hidden
+        self.app_grid.filter_items()
+
+        page = self.app_grid.items[: self.app_grid.num_columns * self.app_grid.num_rows]
+        remaining = len(page)
+
+        def on_icon_loaded(*_):
+            nonlocal remaining
+            remaining -= 1
+            if not remaining:
+                self.finish_prewarm()
+
+        for app in page:
+            app.load_icon_async(
+                configuration.get_property("app_launcher_icon_size"),
+                on_icon_loaded,
+                placeholder=False,
+            )
+        if not page:
+            self.finish_prewarm()
+
+        return False
+
+    def finish_prewarm(self):
+        self.prewarm_status = "done"
+        self.prewarm_duration = time.perf_counter() - self._prewarm_start
+        logger.info(
+            f"[AppLauncher] Prewarmed {len(self.app_grid.items)} apps in {self.prewarm_duration * 1000:.1f}ms"
+        )
+
     def handle_key_press_event(self, entry: Entry, event):
         match event.keyval:
             case 65363:  # right arrow
@@ -174,13 +241,9 @@ class AppLauncher(Applet, Box):
                 return
             # exec_shell_command(f"sh -c 'deactivate; uwsm app -- {exec}'")
 
-            if self.history.__contains__(app.name):
-                self.history[app.name] -= 1
-            else:
-                self.history[app.name] = -1
-
-            with open('app_launcher_history', "w") as file:
-                file.write(json.dumps(self.history))
+            self.history.record(app.name)
+            self.state_store.set("app_launcher_history", self.history.to_json())
+            self.app_search.invalidate_ranking()
 
             self.on_launched()
         except Exception as e:
@@ -189,6 +252,9 @@ class AppLauncher(Applet, Box):
     def unhide(self, *args):
         Applet.unhide(self, *args)
 
-        self.app_grid.reset_items()
+        # a no-op if it already ran, otherwise it's needed right now anyway
+        self.prewarm()
+        # only the slots whose app changed since the last time are redrawn
+        self.app_grid.filter_items()
         self.entry.set_text("")
         self.entry.grab_focus()
@@ -1,23 +1,21 @@
-import os
 import random
 import gi
 
 from loguru import logger
-from PIL import Image
 from config import configuration
-from concurrent.futures import ThreadPoolExecutor
 
 from widgets.pill.applet import Applet
-from widgets.buttons import MarkupButton
+from widgets.buttons import ThumbnailButton
 from widgets.cooldown import cooldown
 from widgets.helpers.formatted_exec import formatted_exec_shell_command_async
+from widgets.helpers.thumbnails import ThumbnailLoader
+from widgets.helpers.wallpaper_index import get_wallpaper_index
 from fabric.widgets.box import Box
 from fabric.widgets.label import Label
 from fabric.core.service import Signal
-from fabric.utils.helpers import idle_add
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GLib  # noqa: E402
+from gi.repository import Gtk  # noqa: E402
 
 
 class WallpaperSelector(Applet, Box):
@@ -38,12 +36,10 @@ class WallpaperSelector(Applet, Box):
         self.selected_index = 0
         self.wallpaper_paths = []
         self.last_cycle_time = 0
-        self.stop_goto = False
-        self.goto_started = False
-        self.thread_pool = ThreadPoolExecutor(
-            max_workers=configuration.get_property("thumbnails_generator_max_workers")
-        )
-        self.wallpaper_processor_thread = None
+        self.shown = False
+        # where the strip was last scrolled to, 1 (right) or -1 (left)
+        self.scroll_direction = 1
+        self.prefetch_radius = configuration.get_property("wallpapers_thumbnails_prefetch_radius")
 
         self.title = Label(
             name="title", label="Wallpaper selector", ellipsization="end"
@@ -72,7 +68,7 @@ class WallpaperSelector(Applet, Box):
         self.matugen_scheme_combo.set_can_focus(False)
         self.matugen_scheme_combo.set_focus_on_click(False)
 
-        self.Images = [MarkupButton(name="wallpaper_item") for _ in range(5)]
+        self.Images = [ThumbnailButton(name="wallpaper_item") for _ in range(5)]
         self.wallpapers_container = Box(children=self.Images)
 
         for image in self.Images:
@@ -206,10 +202,18 @@ class WallpaperSelector(Applet, Box):
 
         self.format_view()
 
-        thumbnail_dir = os.path.join(configuration.get_property("wallpapers_dir"), "thumbnails")
-        logger.debug(thumbnail_dir)
-        if not os.path.isdir(thumbnail_dir):
-            os.makedirs(thumbnail_dir, exist_ok=True)
+        self.wallpaper_index = get_wallpaper_index()
+        self.thumbnails = self.wallpaper_index.atlas
+        self.thumbnail_loader = ThumbnailLoader(self.thumbnails, self.on_thumbnail_loaded)
+        self.wallpaper_paths = [
+            (thumbnail, path) for path, thumbnail in self.wallpaper_index.wallpapers.items()
+        ]
+        self.wallpaper_index.connect(
+            "added", lambda _, thumbnail, path: self.append_wallpaper(thumbnail, path)
+        )
+        self.wallpaper_index.connect("removed", lambda _, path: self.remove_wallpaper(path))
+        self.wallpaper_index.connect("scanned", lambda *_: self.shuffle_wallpapers())
+        logger.debug(self.thumbnails.directory)
 
     # def on_hover(self, id, hover):
     #     self.corner_parents[id].add_style_class(
@@ -265,44 +269,83 @@ class WallpaperSelector(Applet, Box):
     def format_view(self):
         self.selected_index = 0
         self.wallpaper_paths = []
-        self.stop_goto = False
 
         self.update_style_classes()
         for i in range(5):
-            self.Images[i].set_style("background-image: none;")
+            self.Images[i].set_surface(None)
             self.Images[i].set_sensitive(False)
 
     def append_wallpaper(self, thumbnail, path):
-        if len(self.wallpaper_paths) - self.selected_index < 2:
-            self.Images[len(self.wallpaper_paths) - self.selected_index + 2].set_style(
-                f'background-image: url("{thumbnail}");'
+        self.wallpaper_paths.append((thumbnail, path))
+        # self.update_scroll_buttons()
+
+        if len(self.wallpaper_paths) - self.selected_index <= 2:
+            self.Images[len(self.wallpaper_paths) - self.selected_index + 1].set_surface(
+                self.thumbnails.get_surface(thumbnail)
             )
             self.Images[
-                len(self.wallpaper_paths) - self.selected_index + 2
+                len(self.wallpaper_paths) - self.selected_index + 1
             ].set_sensitive(True)
 
-        self.wallpaper_paths.append((thumbnail, path))
-        # self.update_scroll_buttons()
+            # the first listing is loaded all at once when it's shuffled
+            if self.wallpaper_index.ready:
+                self.load_window()
+
+    def remove_wallpaper(self, path):
+        index = next(
+            (i for i, (_, wallpaper) in enumerate(self.wallpaper_paths) if wallpaper == path),
+            None,
+        )
+        if index is None:
+            return
+
+        del self.wallpaper_paths[index]
+        if index < self.selected_index or self.selected_index >= len(self.wallpaper_paths):
+            self.selected_index = max(self.selected_index - 1, 0)
+
+        self.update_style_classes()
+        self.bind_slots()
 
     def shuffle_wallpapers(self):
         random.shuffle(self.wallpaper_paths)
+        self.bind_slots()
 
+    def bind_slots(self):
+        # the edge slots (0 and 4) are always empty
         for i in range(5):
-            if self.selected_index + i >= 5:
-                break
+            index = self.selected_index + i - 2
+            if i in (1, 2, 3) and 0 <= index < len(self.wallpaper_paths):
+                self.Images[i].set_surface(self.thumbnails.get_surface(self.wallpaper_paths[index][0]))
+                self.Images[i].set_sensitive(True)
+            else:
+                self.Images[i].set_surface(None)
+                self.Images[i].set_sensitive(False)
 
-            if len(self.wallpaper_paths) > self.selected_index - 2 + i >= 0:
-                thumbnail, path = self.wallpaper_paths[self.selected_index + i - 2]
+        self.load_window()
 
-                self.Images[self.selected_index + i].set_style(
-                    f'background-image: url("{thumbnail}");'
-                )
-                self.Images[self.selected_index + i].set_sensitive(True)
-            else:
-                self.Images[self.selected_index + i].set_style(
-                    "background-image: none;"
-                )
-                self.Images[self.selected_index + i].set_sensitive(False)
+    def load_window(self):
+        if not self.shown:
+            return
+
+        # the visible wallpapers first, then those ahead in the scrolling direction, and one behind
+        offsets = [
+            0,
+            1,
+            -1,
+            *(self.scroll_direction * i for i in range(2, self.prefetch_radius + 2)),
+            -self.scroll_direction * 2,
+        ]
+        self.thumbnail_loader.set_window(
+            self.wallpaper_paths[index]
+            for offset in offsets
+            if 0 <= (index := self.selected_index + offset) < len(self.wallpaper_paths)
+        )
+
+    def on_thumbnail_loaded(self, thumbnail, path):
+        for i in (1, 2, 3):
+            index = self.selected_index + i - 2
+            if 0 <= index < len(self.wallpaper_paths) and self.wallpaper_paths[index][0] == thumbnail:
+                self.Images[i].set_surface(self.thumbnails.get_surface(thumbnail))
 
     @cooldown(0.26, lambda *_: False, True)
     def cycle_cooldown(self, next=True):
@@ -310,6 +353,7 @@ class WallpaperSelector(Applet, Box):
         return True
 
     def cycle(self, next=True):
+        self.scroll_direction = 1 if next else -1
         if next:
             self.selected_index += 1
             self.wallpapers_container.reorder_child(self.Images[0], 4)
@@ -329,19 +373,20 @@ class WallpaperSelector(Applet, Box):
 
         self.update_style_classes()
 
-        self.Images[0].set_style("background-image: none;")
-        self.Images[4].set_style("background-image: none;")
+        self.Images[0].set_surface(None)
+        self.Images[4].set_surface(None)
 
         if self.selected_index - 1 >= 0:
-            self.Images[1].set_style(
-                f'background-image: url("{self.wallpaper_paths[self.selected_index - 1][0]}")'
+            self.Images[1].set_surface(
+                self.thumbnails.get_surface(self.wallpaper_paths[self.selected_index - 1][0])
             )
         if self.selected_index + 1 < len(self.wallpaper_paths):
-            self.Images[3].set_style(
-                f'background-image: url("{self.wallpaper_paths[self.selected_index + 1][0]}")'
+            self.Images[3].set_surface(
+                self.thumbnails.get_surface(self.wallpaper_paths[self.selected_index + 1][0])
             )
 
-    # @cooldown(0.3, lambda *_: False, True)
+        self.load_window()
+
     def goto_index(self, index):
         if (
             index >= len(self.wallpaper_paths)
@@ -350,31 +395,13 @@ class WallpaperSelector(Applet, Box):
         ):
             return
 
-        # if abs(index - self.selected_index) <= 2:
-        def goto_thread():
-            for _ in range(abs(index - self.selected_index)):
-                if self.stop_goto:
-                    break
-                idle_add(self.cycle, index - self.selected_index > 0)
+        # straight there, only the slots around it are bound (and their thumbnails loaded)
+        self.selected_index = index
+        # browsing goes on away from the edge jumped to
+        self.scroll_direction = 1 if index < len(self.wallpaper_paths) - 1 - index else -1
 
-                GLib.usleep(170 * 1000)
-
-            self.goto_started = False
-
-        self.stop_goto = False
-        self.goto_started = True
-        GLib.Thread.new("goto_thread", goto_thread)
-        # else:
-        #     for i in range(1, 4):
-        #         if 0 <= index + i - 2 < len(self.wallpaper_paths):
-        #             self.wallpapers[i].set_style(
-        #                 f'background-image: url("{self.wallpaper_paths[index + i - 2][0]}")'
-        #             )
-        #         else:
-        #             self.wallpapers[i].set_style("background-image: none;")
-
-        #     self.selected_index = index
-        #     self.update_scroll_buttons()
+        self.update_style_classes()
+        self.bind_slots()
 
         return True
 
@@ -382,20 +409,14 @@ class WallpaperSelector(Applet, Box):
         match event.keyval:
             case 65363:  # right arrow
                 if self.selected_index + 1 < len(self.wallpaper_paths):
-                    self.stop_goto = True
                     return self.cycle_cooldown()
             case 65361:  # left arrow
                 if self.selected_index > 0:
-                    self.stop_goto = True
                     return self.cycle_cooldown(False)
             case 65362:  # up arrow
-                self.stop_goto = True
-                if not self.goto_started:
-                    return self.goto_index(0)
+                return self.goto_index(0)
             case 65364:  # down arrow
-                self.stop_goto = True
-                if not self.goto_started:
-                    return self.goto_index(len(self.wallpaper_paths) - 1)
+                return self.goto_index(len(self.wallpaper_paths) - 1)
         return False
 
     def select_wallpaper(self):
@@ -429,63 +450,27 @@ class WallpaperSelector(Applet, Box):
         else:
             logger.error(f"unknown index: {index}")
 
-    def start_thumbnails_thread(self):
-        if not self.wallpaper_processor_thread:
-            self.wallpaper_processor_thread = GLib.Thread.new(
-                "wallpaper_processor", self.process_images
-            )
-
-    def process_images(self):
-        files = [
-            file
-            for file in os.listdir(configuration.get_property("wallpapers_dir"))
-            if file.lower().endswith(".png")
-        ]
-
-        results = self.thread_pool.map(self.generate_thumbnail, files)
-
-        for _ in results:
-            ...
-
-        self.wallpaper_processor_thread = None
-
-        idle_add(self.shuffle_wallpapers)
-
-    def generate_thumbnail(self, image):
-        thumbnail_path = os.path.join(
-            configuration.get_property("wallpapers_dir"), "thumbnails", image
-        )
-        file_path = os.path.join(configuration.get_property("wallpapers_dir"), image)
-        if os.path.isfile(thumbnail_path):
-            idle_add(self.append_wallpaper, thumbnail_path, file_path)
-        else:
-            try:
-                with Image.open(file_path) as img:
-                    img.thumbnail((256, 256), Image.Resampling.BILINEAR)
-                    img.save(thumbnail_path, "PNG")
-            except Exception as e:
-                logger.error(f"error processing {file_path}: {e}")
-                return False
-
-            if not os.path.exists(thumbnail_path):
-                logger.error(f"error processing {file_path}")
-                return False
-
-            idle_add(self.append_wallpaper, thumbnail_path, file_path)
-
-        return True
-
     def hide(self, *args):
         Applet.hide(self, *args)
 
-        self.stop_goto = True
+        self.shown = False
+        self.thumbnail_loader.cancel()
 
         for i in range(5):
             # self.wallpapers[i].add_style_class("empty")
-            self.Images[i].set_style("background-image: none;")
+            self.Images[i].set_surface(None)
 
     def unhide(self, *args):
         Applet.unhide(self, *args)
 
-        self.format_view()
-        self.start_thumbnails_thread()
+        self.shown = True
+        self.selected_index = 0
+        self.scroll_direction = 1
+        self.update_style_classes()
+
+        # the index is kept up to date from then on, only the first opening scans the directory
+        self.wallpaper_index.start()
+        if self.wallpaper_index.ready:
+            self.shuffle_wallpapers()
+        else:
+            self.bind_slots()
@@ -1,10 +1,12 @@
 import gi
+import hashlib
 from widgets.buttons import MarkupButton as Button
 from loguru import logger
+from widgets.helpers.icon_cache import get_icon_cache
 
 gi.require_version("Gray", "0.1")
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gray, Gtk, Gdk, GdkPixbuf, GLib  # noqa: E402
+from gi.repository import Gray, Gtk, Gdk, GdkPixbuf  # noqa: E402
 
 replace_item_names = {
     "spotify-linux-32": "spotify",
@@ -17,6 +19,7 @@ class SystemTray(Gtk.Box):
     def __init__(self, icon_size: int = 20, **kwargs) -> None:
         super().__init__(orientation=Gtk.Orientation.HORIZONTAL, **kwargs)
         self.icon_size = icon_size
+        self.icon_cache = get_icon_cache()
         self.watcher = Gray.Watcher()
         self.watcher.connect("item-added", self.on_item_added)
 
@@ -37,39 +40,27 @@ class SystemTray(Gtk.Box):
 
         pixmap = Gray.get_pixmap_for_pixmaps(item.get_icon_pixmaps(), self.icon_size)
 
-        try:
-            if pixmap is not None:
-                pixbuf = pixmap.as_pixbuf(self.icon_size, GdkPixbuf.InterpType.HYPER)
-            elif item.get_icon_name():
-                pixbuf = Gtk.IconTheme().load_icon(
-                    replace_item_names.get(item.get_icon_name(), item.get_icon_name()),
-                    self.icon_size,
-                    Gtk.IconLookupFlags.FORCE_SIZE,
-                )
-            else:
-                pixbuf = (
-                    Gtk.IconTheme()
-                    .get_default()
-                    .load_icon(
-                        "image-missing",
-                        self.icon_size,
-                        Gtk.IconLookupFlags.FORCE_SIZE,
-                    )
-                )
-        except GLib.Error:
-            pixbuf = (
-                Gtk.IconTheme()
-                .get_default()
-                .load_icon(
-                    "image-missing",
-                    self.icon_size,
-                    Gtk.IconLookupFlags.FORCE_SIZE,
-                )
+        if pixmap is not None:
+            pixbuf = self.icon_cache.lookup(
+                ("pixmap", self.get_pixmap_hash(pixmap), self.icon_size),
+                lambda: pixmap.as_pixbuf(self.icon_size, GdkPixbuf.InterpType.BILINEAR),
+            )
+        else:
+            icon_name = item.get_icon_name()
+            pixbuf = self.icon_cache.load_icon(
+                replace_item_names.get(icon_name, icon_name), self.icon_size
             )
 
         button.set_image(Gtk.Image.new_from_pixbuf(pixbuf))
         return button
 
+    @staticmethod
+    def get_pixmap_hash(pixmap) -> str:
+        # items can change their pixmap without changing identifier, the key follows the pixels
+        identity = hashlib.sha1(f"{pixmap.width}x{pixmap.height}:".encode())
+        identity.update(bytes(pixmap.buffer))
+        return identity.hexdigest()
+
     def on_button_click(self, button, item: Gray.Item, event):
         if event.button == Gdk.BUTTON_PRIMARY:
             try:
@@ -1,4 +1,3 @@
-import json
 import gi
 import random
 from time import sleep
@@ -16,7 +15,9 @@ from fabric.utils import DesktopApp, exec_shell_command_async, idle_add
 from windows.pill import PillWindow
 from widgets.buttons import Button, MarkupButton
 from widgets.helpers.clients import get_clients_service, Client
-from widgets.helpers.workspace_properties import get_workspace_properties_service
+from widgets.helpers.obstruction import ObstructionWatcher
+from widgets.helpers.icon_cache import IconImage
+from widgets.helpers.state_store import get_state_store
 
 gi.require_version("Glace", "0.1")
 from gi.repository import GLib  # noqa: E402
@@ -40,6 +41,7 @@ class DockWindow(Window):
         self.hide_ticket = 0
         self.height = 0
         self.width = 0
+        self.obstruction: ObstructionWatcher | None = None
 
         self.dock_items_pos: list[DockItem] = []
         self.dock_items: dict[Any, DockItem] = {}
@@ -94,14 +96,10 @@ class DockWindow(Window):
         self.load_pinned_items()
 
         if configuration.get_property("dock_visibility_rule") == "hide when obstructed":
-            self.workspace_props_service = get_workspace_properties_service()
-
-            # get_hyprland_connection().connect("event", lambda *_: self.check_obstructed())
-            # self.workspace_props_service.connect(
-            #     "props-recalculated", lambda *_: self.check_obstructed()
-            # )
+            self.obstruction = ObstructionWatcher(self.get_obstruction_region)
+            self.obstruction.connect("obstructed-changed", lambda *_: self.check_obstructed())
+            self.connect("size-allocate", lambda *_: self.on_size_allocate())
             self.check_obstructed()
-            GLib.timeout_add(100, self.check_obstructed)
 
         self.connect("enter-notify-event", lambda *_: self.on_mouse_enter())
         self.connect("leave-notify-event", lambda *_: self.on_mouse_leave())
@@ -130,25 +128,22 @@ class DockWindow(Window):
                 logger.error(f"Unknown action button {button}-click action: {action}")
 
     def load_pinned_items(self):
-        try:
-            with open("dock_pinned_items") as pinned_identifiers:
-                pinned_identifiers = json.load(pinned_identifiers)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            logger.error(f"Error while reading pinned dock apps file: {e}")
-
-            with open("dock_pinned_items", "w") as file:
-                file.write("")
-
-            return
+        pinned_identifiers = get_state_store().get(
+            "dock_pinned_items", [], legacy_path="dock_pinned_items"
+        )
+        if not isinstance(pinned_identifiers, list):
+            logger.error(f"Invalid pinned dock apps: {pinned_identifiers}")
+            pinned_identifiers = []
 
         for identifier in list(pinned_identifiers):
             app = self.clients_service.find_app_by_identifier(identifier)
             if app:
                 self.add_pinned_item(identifier, app)
 
-        with open("dock_pinned_items", "w") as file:
-            # logger.error(list(self.pinned_items.keys()))
-            file.write(json.dumps(list(self.pinned_items.keys())))
+        self.save_pinned_items()
+
+    def save_pinned_items(self):
+        get_state_store().set("dock_pinned_items", list(self.pinned_items.keys()))
 
     def add_pinned_item(self, identifier, item: DesktopApp):
         if item in self.loaded_pinned_desktop_apps:
@@ -189,9 +184,10 @@ class DockWindow(Window):
         if self.add_action_button:
             self.action_button_separator.remove_style_class("hidden")
 
-        with open("dock_pinned_items", "w") as file:
-            # logger.error(list(self.pinned_items.keys()))
-            file.write(json.dumps(list(self.pinned_items.keys())))
+        if self.obstruction:
+            self.check_obstructed()
+
+        self.save_pinned_items()
 
     def remove_pinned_item(self, item):
         if isinstance(item, str):
@@ -215,16 +211,15 @@ class DockWindow(Window):
         else:
             logger.error("Item not loaded???")
 
-        def hide_item(self: Self, item, identifier):
+        # unpinned right away, the item is only removed once it's hidden
+        self.pinned_items.pop(identifier)
+        self.save_pinned_items()
+
+        def hide_item(self: Self, item):
             sleep(0.25)
 
             self.pinned_container.remove(item)
             self.pinned_items_pos.remove(item)
-            self.pinned_items.pop(identifier)
-
-            with open("dock_pinned_items", "w") as file:
-                # logger.error(list(self.pinned_items.keys()))
-                file.write(json.dumps(list(self.pinned_items.keys())))
 
         item.unreveal()
         if self.pinned_items_pos.__len__() <= 1:
@@ -238,7 +233,7 @@ class DockWindow(Window):
 
             self.pinned_separator.add_style_class("hidden")
 
-        GLib.Thread.new("item-hide", hide_item, self, item, identifier)
+        GLib.Thread.new("item-hide", hide_item, self, item)
 
     def on_client_added(self, service):
         client = self.clients_service.clients[-1]
@@ -274,6 +269,9 @@ class DockWindow(Window):
 
         self.action_button_separator.remove_style_class("hidden")
 
+        if self.obstruction:
+            self.check_obstructed()
+
     def on_client_removed(self, service, client):
         if not self.dock_items.__contains__(client):
             logger.error(
@@ -361,36 +359,34 @@ class DockWindow(Window):
                 if configuration.get_property("dock_visibility_rule") == "auto hide":
                     self.dock.remove_style_class("shown")
                 self.hovored = False
+                if self.obstruction:
+                    idle_add(self.check_obstructed)
 
         GLib.Thread.new("dock-hide", hide, self, self.hide_ticket)
 
-    # @cooldown(0.1, lambda *_: logger.error("cooldown reached"))
-    def check_obstructed(self):
-        root = [960, 1080]
+    def on_size_allocate(self):
         size = self.get_size()
-        if not self.height or size.height > self.height:
-            self.height = size.height - 8
-        self.width = size.width
+        height = size.height - 8 if not self.height or size.height > self.height else self.height
+        if (size.width, height) == (self.width, self.height):
+            return
 
-        lx = root[0] - self.width / 2
-        ly = root[1] - self.height
+        self.width, self.height = size.width, height
+        self.obstruction.update()
 
-        rx = root[0] + self.width / 2
-        ry = root[1]
+    def get_obstruction_region(self, monitor: tuple[float, float, float, float]):
+        # the dock is anchored to the bottom center of its monitor
+        x, y, width, height = monitor
+        return x + (width - self.width) / 2, y + height - self.height, self.width, self.height
 
-        obstructed = self.workspace_props_service.get_clients_overlap_rect2(
-            lx, ly, rx, ry
-        )
-        if obstructed:
+    def check_obstructed(self):
+        if self.obstruction.obstructed:
             if not self.hovored:
                 self.dock.remove_style_class("shown")
         elif not self.main_container_empty or not self.pinned_container_empty:
             self.dock.add_style_class("shown")
 
-        return True
 
-
-class DockItem(Button):
+class DockItem(IconImage, Button):
     def __init__(self, client: Client, **kwargs):
         super().__init__(
             name="dock_item",
@@ -432,19 +428,13 @@ class DockItem(Button):
     def update(self, *_):
         self.set_tooltip_text(self.client._desktop_app.display_name)
         self.set_image(
-            self.client._desktop_app.get_icon_pixbuf(
-                size=configuration.get_property("dock_icon_size")
+            lambda callback: self.client._desktop_app.load_icon_async(
+                configuration.get_property("dock_icon_size"), callback
             )
         )
 
         self.update_state()
 
-    def set_image(self, image):
-        if isinstance(image, str):
-            self.icon.set_from_file(image)
-        else:
-            self.icon.set_from_pixbuf(image)
-
     def update_state(self, *_):
         if self.client._client.get_closed():
             return
@@ -492,10 +482,11 @@ class DockItem(Button):
             return False
 
     def unreveal(self):
+        self.cancel_image()
         self.remove_style_class("shown")
 
 
-class PinnedDockItem(Button):
+class PinnedDockItem(IconImage, Button):
     def __init__(self, desktop_app: DesktopApp, **kwargs):
         super().__init__(
             name="dock_item",
@@ -523,17 +514,11 @@ class PinnedDockItem(Button):
     def build_from_app(self, desktop_app: DesktopApp):
         self.set_tooltip_text(desktop_app.display_name)
         self.set_image(
-            desktop_app.get_icon_pixbuf(
-                size=configuration.get_property("dock_icon_size")
+            lambda callback: desktop_app.load_icon_async(
+                configuration.get_property("dock_icon_size"), callback
             )
         )
 
-    def set_image(self, image):
-        if isinstance(image, str):
-            self.icon.set_from_file(image)
-        else:
-            self.icon.set_from_pixbuf(image)
-
     def on_clicked(self, button, event):
         if event.button == 1:
             terminal = False
@@ -589,4 +574,5 @@ class PinnedDockItem(Button):
             return False
 
     def unreveal(self):
+        self.cancel_image()
         self.remove_style_class("shown")